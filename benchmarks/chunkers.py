@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compares chunking engines by throughput and chunk reuse after small edits
+
+Reuse ratio is the share of bytes of an edited copy which are found in chunks
+of the original data, i.e. what chunk level deduplication can save.
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+
+sys.path.insert(0, f"{sys.path[0]}/..")
+
+from file_utils.chunkers import FastCDCChunker, FixedChunker  # noqa: E402
+
+
+def make_data(size: int, seed: int) -> bytes:
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, "little")
+
+
+def edit_data(data: bytes, edits: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    for _ in range(edits):
+        position = rnd.randrange(len(data))
+        data = data[:position] + b"edit" + data[position:]
+    return data
+
+
+def measure(chunker, data: bytes, edited: bytes) -> dict:
+    started = time.perf_counter()
+    chunks = list(chunker.split(io.BytesIO(data)))
+    elapsed = time.perf_counter() - started
+    known = set(chunks)
+    reused = sum(
+        len(chunk) for chunk in chunker.split(io.BytesIO(edited)) if chunk in known
+    )
+    return {
+        "chunker": chunker.name,
+        "params": chunker.params,
+        "throughput_mb_s": round(len(data) / elapsed / 1000000.0, 2),
+        "chunks": len(chunks),
+        "avg_chunk_size": len(data) // max(len(chunks), 1),
+        "reuse_ratio": round(reused / len(edited), 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark chunking engines")
+    parser.add_argument("--size", type=int, default=64, help="Data size in MB")
+    parser.add_argument("--edits", type=int, default=10, help="Inserted edits")
+    parser.add_argument("--avg-chunk-size", type=int, default=1048576)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sample = make_data(args.size * 1048576, args.seed)
+    edited_sample = edit_data(sample, args.edits, args.seed)
+    results = [
+        measure(FixedChunker(args.avg_chunk_size), sample, edited_sample),
+        measure(
+            FastCDCChunker(
+                args.avg_chunk_size // 4, args.avg_chunk_size, args.avg_chunk_size * 4
+            ),
+            sample,
+            edited_sample,
+        ),
+    ]
+    print(json.dumps(results, indent=2))
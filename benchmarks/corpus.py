@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Reproducible synthetic corpora for the benchmark suite
+
+The same profile, scale and seed always produce the same files. Profiles:
+    tiny          many small text files in a flat directory
+    huge          a few large files, half random half compressible
+    compressible  log-like text files
+    random        incompressible files
+    deep          small files spread over a deep directory tree
+"""
+import argparse
+import json
+import os
+import random
+
+_WORDS = (
+    "GET POST PUT /index.html /api/v1/items 200 201 404 500 user session "
+    "cache miss hit latency ms request response upstream timeout retry"
+).split()
+
+
+def text_data(rnd: random.Random, size: int) -> bytes:
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(4, 12)))
+        lines.append(line)
+        length += len(line) + 1
+    return ("\n".join(lines) + "\n").encode("utf-8")[:size]
+
+
+def random_data(rnd: random.Random, size: int) -> bytes:
+    return rnd.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def _write(path: str, data: bytes) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fp_writer:
+        fp_writer.write(data)
+    return len(data)
+
+
+def _tiny(dest, rnd, scale):
+    for index in range(int(2000 * scale)):
+        yield f"{dest}/file-{index:06d}.txt", text_data(rnd, rnd.randint(64, 4096))
+
+
+def _huge(dest, rnd, scale):
+    size = int(64 * 1048576 * scale)
+    yield f"{dest}/random.bin", random_data(rnd, size)
+    yield f"{dest}/text.log", text_data(rnd, size)
+
+
+def _compressible(dest, rnd, scale):
+    for index in range(int(50 * scale)):
+        yield f"{dest}/app-{index:04d}.log", text_data(rnd, 1048576)
+
+
+def _random(dest, rnd, scale):
+    for index in range(int(50 * scale)):
+        yield f"{dest}/blob-{index:04d}.bin", random_data(rnd, 1048576)
+
+
+def _deep(dest, rnd, scale):
+    for branch in range(int(20 * scale)):
+        path = dest
+        for level in range(12):
+            path = f"{path}/d{branch:03d}-{level:02d}"
+            for index in range(2):
+                yield f"{path}/f{index}.txt", text_data(rnd, rnd.randint(128, 8192))
+
+
+PROFILES = {
+    "tiny": _tiny,
+    "huge": _huge,
+    "compressible": _compressible,
+    "random": _random,
+    "deep": _deep,
+}
+
+
+def generate(dest: str, profile: str, scale: float = 1.0, seed: int = 1) -> dict:
+    """Writes a corpus in to `dest`
+
+    Returns:
+        dict: profile, number of files and total bytes
+    """
+    rnd = random.Random(f"{profile}-{seed}")
+    files = 0
+    size = 0
+    for path, data in PROFILES[profile](dest, rnd, scale):
+        size += _write(path, data)
+        files += 1
+    return {"profile": profile, "files": files, "bytes": size}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a benchmark corpus")
+    parser.add_argument("dest", type=str, help="Directory to write the corpus to")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="tiny")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size multiplier")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.dest, args.profile, args.scale, args.seed)))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the file operations over synthetic corpora
+
+Every operation runs in a fresh process so its peak RSS is its own. Results are
+written as JSON, `--compare` reports the metrics of a previous result file which
+got worse by more than the threshold and exits with 1 when there are any.
+
+    python benchmarks/suite.py --profiles tiny compressible --output new.json
+    python benchmarks/suite.py --profiles tiny --compare new.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, f"{sys.path[0]}/..")
+
+# pylint: disable=wrong-import-position
+from benchmarks.corpus import PROFILES, generate  # noqa: E402
+from file_utils.compression import CODECS, Compressor  # noqa: E402
+from file_utils.db_managers import SQLiteDBManager  # noqa: E402
+from file_utils.files import (  # noqa: E402
+    delete_file_by_id,
+    find_files,
+    list_files,
+    restore_file_by_id,
+    store_files,
+)
+from file_utils.storage import STORAGES, get_storage  # noqa: E402
+from file_utils.walker import Walker  # noqa: E402
+
+OPERATIONS = ("walk", "store", "list", "find", "restore", "delete")
+SAMPLES = 50
+THRESHOLD = 0.1
+
+_FIND_PATTERNS = ("f", "*0*", "*.txt", "*-00*.log")
+
+
+class _Counter:  # pylint: disable=too-few-public-methods
+    @staticmethod
+    def get_all(data):
+        return sum(1 for _ in data)
+
+
+def percentiles(samples) -> dict:
+    """Latency percentiles in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(share):
+        return round(
+            ordered[min(int(share * len(ordered)), len(ordered) - 1)] * 1000, 3
+        )
+
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1048576.0 if sys.platform == "darwin" else 1024.0), 2)
+
+
+def database_size_mb(db_name: str) -> float:
+    size = 0
+    for path in (db_name, f"{db_name}-wal"):
+        if os.path.isfile(path):
+            size += os.path.getsize(path)
+    for root, _, files in os.walk(f"{db_name}.packs"):
+        size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(size / 1000000.0, 3)
+
+
+def _sample_ids(db_name: str, samples: int, seed: int) -> list:
+    with SQLiteDBManager(db_name) as db_conn:
+        ids = [row[0] for row in db_conn.query("select id from files order by id")]
+    return random.Random(seed).sample(ids, min(samples, len(ids)))
+
+
+def _timed(function, *positional, **kwargs):
+    started = time.perf_counter()
+    result = function(*positional, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def bench_walk(_db_name, corpus, options, _samples, _seed) -> dict:
+    walker = Walker(workers=options.get("walk_workers", 0))
+    elapsed, files = _timed(lambda: sum(1 for _ in walker.walk([corpus["path"]])))
+    return {"seconds": round(elapsed, 3), "files_per_s": round(files / elapsed, 1)}
+
+
+def bench_store(db_name, corpus, options, _samples, _seed) -> dict:
+    storage = options.get("storage")
+    compression = options.get("compression")
+    elapsed, stats = _timed(
+        store_files,
+        db_name,
+        [corpus["path"]],
+        compression=Compressor(compression) if compression else None,
+        storage=get_storage(storage) if storage else None,
+        bulk=options.get("bulk", False),
+        workers=options.get("workers", 0),
+        walker=Walker(workers=options.get("walk_workers", 0)),
+    )
+    return {
+        "seconds": round(elapsed, 3),
+        "throughput_mb_s": round(stats.bytes_read / elapsed / 1000000.0, 2),
+        "files_per_s": round(stats.files / elapsed, 1),
+        "dedup_ratio": round(stats.dedup_ratio, 3),
+        "compression_ratio": round(stats.compression_ratio, 3),
+        "db_size_mb": database_size_mb(db_name),
+    }
+
+
+def bench_list(db_name, _corpus, _options, _samples, _seed) -> dict:
+    elapsed, rows = _timed(list_files, db_name, _Counter)
+    return {"seconds": round(elapsed, 3), "rows_per_s": round(rows / elapsed, 1)}
+
+
+def bench_find(db_name, _corpus, _options, samples, _seed) -> dict:
+    latencies = []
+    for index in range(samples):
+        pattern = _FIND_PATTERNS[index % len(_FIND_PATTERNS)]
+        elapsed, _ = _timed(find_files, db_name, pattern, _Counter)
+        latencies.append(elapsed)
+    return percentiles(latencies)
+
+
+def bench_restore(db_name, _corpus, _options, samples, seed) -> dict:
+    latencies = []
+    restored = 0
+    with tempfile.TemporaryDirectory(prefix="file_utils_bench") as dest:
+        for file_id in _sample_ids(db_name, samples, seed):
+            elapsed, _ = _timed(restore_file_by_id, db_name, file_id, dest)
+            latencies.append(elapsed)
+            for name in os.listdir(dest):
+                restored += os.path.getsize(os.path.join(dest, name))
+                os.remove(os.path.join(dest, name))
+    result = percentiles(latencies)
+    if latencies:
+        result["throughput_mb_s"] = round(restored / sum(latencies) / 1000000.0, 2)
+    return result
+
+
+def bench_delete(db_name, _corpus, _options, samples, seed) -> dict:
+    latencies = []
+    for file_id in _sample_ids(db_name, samples, seed):
+        elapsed, _ = _timed(delete_file_by_id, db_name, file_id)
+        latencies.append(elapsed)
+    result = percentiles(latencies)
+    result["db_size_mb"] = database_size_mb(db_name)
+    return result
+
+
+_BENCHMARKS = {
+    "walk": bench_walk,
+    "store": bench_store,
+    "list": bench_list,
+    "find": bench_find,
+    "restore": bench_restore,
+    "delete": bench_delete,
+}
+
+
+def _child(operation, bench_args, results):
+    # per file progress would be part of the measurement
+    logging.disable(logging.INFO)
+    metrics = _BENCHMARKS[operation](*bench_args)
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    results.put(metrics)
+
+
+def run_operation(operation, *bench_args) -> dict:
+    """Runs a benchmark in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child, args=(operation, bench_args, results))
+    process.start()
+    metrics = results.get()
+    process.join()
+    return metrics
+
+
+def run_suite(profiles, *, scale=1.0, seed=1, samples=SAMPLES, options=None):
+    """Generates every corpus and benchmarks all operations on it"""
+    options = options or {}
+    results = {}
+    for profile in profiles:
+        work_dir = tempfile.mkdtemp(prefix="file_utils_bench")
+        try:
+            corpus = generate(f"{work_dir}/corpus", profile, scale, seed)
+            corpus["path"] = f"{work_dir}/corpus"
+            db_name = f"{work_dir}/bench.db"
+            results[profile] = {"corpus": {**corpus, "path": None}}
+            for operation in OPERATIONS:
+                results[profile][operation] = run_operation(
+                    operation, db_name, corpus, options, samples, seed
+                )
+        finally:
+            shutil.rmtree(work_dir)
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float = THRESHOLD) -> list:
+    """Metrics of `current` which are worse than `baseline` by over `threshold`
+
+    Throughputs and rates are better when higher, latencies, memory and sizes
+    when lower.
+    """
+    regressions = []
+    for profile, operations in current["results"].items():
+        for operation, metrics in operations.items():
+            old_metrics = baseline["results"].get(profile, {}).get(operation, {})
+            for metric, value in metrics.items():
+                old = old_metrics.get(metric)
+                if not isinstance(value, (int, float)) or not old:
+                    continue
+                higher_is_better = metric.endswith(("_mb_s", "_per_s", "_ratio"))
+                change = (value - old) / old
+                if (-change if higher_is_better else change) > threshold:
+                    regressions.append(
+                        f"{profile} {operation} {metric}: {old} -> {value} "
+                        f"({change:+.1%})"
+                    )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark file operations")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        choices=sorted(PROFILES),
+        default=sorted(PROFILES),
+        help="Corpora to benchmark",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Corpus size multiplier"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--samples", type=int, default=SAMPLES, help="Calls per latency measurement"
+    )
+    parser.add_argument("-c", "--compression", choices=CODECS)
+    parser.add_argument("--storage", choices=sorted(STORAGES))
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("-w", "--workers", type=int, default=0)
+    parser.add_argument("--walk-workers", type=int, default=0)
+    parser.add_argument("-o", "--output", type=str, help="Write results to this file")
+    parser.add_argument(
+        "--compare", type=str, help="Previous results to check for regressions"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Relative change reported as a regression",
+    )
+    args = parser.parse_args()
+
+    report = {
+        "commit": _commit(),
+        "created": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "scale": args.scale,
+        "seed": args.seed,
+        "options": {
+            "compression": args.compression,
+            "storage": args.storage,
+            "bulk": args.bulk,
+            "workers": args.workers,
+            "walk_workers": args.walk_workers,
+        },
+    }
+    report["results"] = run_suite(
+        args.profiles,
+        scale=args.scale,
+        seed=args.seed,
+        samples=args.samples,
+        options=report["options"],
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp_writer:
+            fp_writer.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fp_reader:
+            found = compare(json.load(fp_reader), report, args.threshold)
+        for line in found:
+            print(f"Regression {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
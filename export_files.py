@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+import sys
+
+from file_utils.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main(["export", *sys.argv[1:]]))
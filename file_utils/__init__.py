@@ -1,8 +1,41 @@
-from .files import (
-    delete_file_by_id,
-    find_files,
-    list_files,
-    restore_file_by_id,
-    store_files,
-)
-from .output_handlers import AsJSON, AsTable, Generic
+import importlib
+
+# public name -> submodule defining it, submodules are imported on first use
+# so a command only loads what it needs
+_EXPORTS = {
+    "IngestStats": "files",
+    "delete_file_by_id": "files",
+    "delete_files": "files",
+    "find_files": "files",
+    "list_files": "files",
+    "list_snapshots": "files",
+    "reclaim_space": "files",
+    "restore_file_by_id": "files",
+    "restore_files": "files",
+    "store_files": "files",
+    "StoredFile": "reader",
+    "open_file": "reader",
+    "AsCSV": "output_handlers",
+    "AsJSON": "output_handlers",
+    "AsJSONStream": "output_handlers",
+    "AsNDJSON": "output_handlers",
+    "AsPagedTable": "output_handlers",
+    "AsTable": "output_handlers",
+    "Generic": "output_handlers",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,246 @@
+"""
+Asyncio facade
+
+`AsyncFileUtils` runs all blocking file and SQLite work of a database on a
+single dedicated thread owning one connection, so concurrent coroutines share
+the connection safely and the event loop never blocks on I/O. Long operations
+are submitted as small steps, a backup yields the thread after every pipeline
+event and results are fetched a few rows at a time, so requests interleave
+instead of waiting for each other.
+
+Cancelling a coroutine stops its operation after the step in progress, files
+already stored or restored are kept.
+
+Backups and reads run concurrently with each other, deletions wait until no
+other task has a backup or a read in progress. A backup inserts a file's chunks
+before the row referencing them, a deletion in between could drop a shared
+chunk the file is about to reference, and a read could lose the chunks or rows
+it has yet to fetch. A task may delete while iterating its own listing.
+"""
+import asyncio
+import collections
+import contextlib
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from .db_managers import SQLiteDBManager
+from .files import (
+    IngestStats,
+    delete_file,
+    delete_matching,
+    iter_file_content,
+    iter_ingest,
+    restore_destination,
+)
+from .queries import query_files
+
+CONCURRENCY = 8
+STEP_ROWS = 256
+STEP_EVENTS = 64
+
+
+class AsyncFileUtils:  # pylint: disable=too-many-instance-attributes
+    """Asynchronous access to a database
+
+    Use as `async with AsyncFileUtils(db_name) as files: ...`. At most
+    `concurrency` operations run at once, others wait for a slot. Rows are
+    committed as the blocking functions commit them outside of bulk mode.
+
+    Args:
+        db_name (str): Path to sqlite database, created when it does not exist
+        concurrency (int): Maximum number of operations in progress
+        step_rows (int): Rows or chunk pieces fetched per step of an iteration
+        step_events (int): Pipeline events handled per step of a backup
+    """
+
+    def __init__(
+        self,
+        db_name,
+        *,
+        concurrency: int = CONCURRENCY,
+        step_rows: int = STEP_ROWS,
+        step_events: int = STEP_EVENTS,
+    ) -> None:
+        self._db_name = db_name
+        self._step_rows = step_rows
+        self._step_events = step_events
+        self._concurrency = concurrency
+        self._slots = None
+        self._executor = None
+        self._db_conn = None
+        # backups and reads in progress by task, deletions wait for them
+        self._users = collections.Counter()
+        self._idle = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self) -> None:
+        """Starts the database thread and opens the connection on it"""
+        # bound to the running loop, which Python < 3.10 does at creation
+        self._slots = asyncio.Semaphore(self._concurrency)
+        self._idle = asyncio.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="file-utils-db"
+        )
+        self._db_conn = await self._call(
+            lambda: SQLiteDBManager(self._db_name).__enter__()  # pylint: disable=C2801
+        )
+
+    async def close(self) -> None:
+        """Commits, closes the connection and stops the database thread"""
+        if self._executor is None:
+            return
+        try:
+            await self._call(self._db_conn.__exit__, None, None, None)
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+            self._db_conn = None
+
+    def _call(self, function, *args, **kwargs):
+        """Runs a blocking call on the database thread"""
+        if self._executor is None:
+            raise RuntimeError("Database is not open")
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs)
+        )
+
+    async def _iterate(self, iterator):
+        """Yields items of a blocking iterator fetched on the database thread"""
+        try:
+            while True:
+                items = await self._call(
+                    lambda: list(itertools.islice(iterator, self._step_rows))
+                )
+                for item in items:
+                    yield item
+                if len(items) < self._step_rows:
+                    return
+        finally:
+            if hasattr(iterator, "close"):
+                await self._call(iterator.close)
+
+    @contextlib.asynccontextmanager
+    async def _use(self):
+        """Counts a backup or read of the current task until it ends"""
+        task = asyncio.current_task()
+        async with self._idle:
+            self._users[task] += 1
+        try:
+            yield
+        finally:
+            async with self._idle:
+                self._users -= collections.Counter({task: 1})
+                self._idle.notify_all()
+
+    async def store_files(self, local_paths: list, **options) -> IngestStats:
+        """Stores files as `store_files` does
+
+        Args:
+            local_paths (list): Files or directories to store
+            options: `iter_ingest` keyword arguments
+
+        Returns:
+            IngestStats: counters of the run
+        """
+        ingest_stats = IngestStats()
+        async with self._slots, self._use():
+            await self._ingest(local_paths, ingest_stats, **options)
+        return ingest_stats
+
+    async def _ingest(self, local_paths, ingest_stats, **options) -> None:
+        steps = iter_ingest(self._db_conn, local_paths, ingest_stats, **options)
+
+        def advance() -> bool:
+            return len(list(itertools.islice(steps, self._step_events))) > 0
+
+        try:
+            while await self._call(advance):
+                pass
+        finally:
+            await self._call(steps.close)
+
+    async def _delete(self, function, *args, **kwargs):
+        """Runs a deletion once other tasks have no backup or read in progress
+
+        Backups and reads starting meanwhile wait for the deletion.
+        """
+        task = asyncio.current_task()
+        async with self._slots, self._idle:
+            await self._idle.wait_for(lambda: not set(self._users) - {task})
+            return await self._call(function, *args, **kwargs)
+
+    async def find_files(self, file_name=None, location=None, **options):
+        """Yields `v_files` rows matching as in the blocking `find_files`
+
+        Args:
+            file_name (str): File name, `*` is a wildcard otherwise a prefix
+            location (str): Original location pattern or prefix
+            options: `query_files` keyword arguments, e.g. `limit` or `after_id`
+        """
+        async with self._slots, self._use():
+            rows = query_files(self._db_conn, file_name, location, **options)
+            async for row in self._iterate(rows):
+                yield row
+
+    def list_files(self, **options):
+        """Yields all `v_files` rows ordered by name, options as in `find_files`"""
+        return self.find_files(None, **options)
+
+    async def iter_file_content(self, file_id: int):
+        """Yields the content of a stored file in pieces"""
+        async with self._slots, self._use():
+            async for piece in self._iterate(
+                iter_file_content(self._db_conn, int(file_id))
+            ):
+                yield piece
+
+    async def restore_file_by_id(self, file_id: int, dest_location: str) -> str:
+        """Restores a file to `dest_location` as `restore_file_by_id` does
+
+        A restore cancelled midway leaves a partially written file behind.
+
+        Returns:
+            str: Path of the restored file
+
+        Raises:
+            RuntimeError: When the file id does not exist
+        """
+        async with self._slots, self._use():
+            destination = await self._call(
+                restore_destination, self._db_conn, file_id, dest_location
+            )
+            fp_writer = await self._call(open, destination, "wb")
+            try:
+                async for piece in self._iterate(
+                    iter_file_content(self._db_conn, int(file_id))
+                ):
+                    await self._call(fp_writer.write, piece)
+            finally:
+                await self._call(fp_writer.close)
+        return destination
+
+    async def delete_file_by_id(self, file_id: int) -> None:
+        """Removes a file record as `delete_file_by_id` does
+
+        Raises:
+            RuntimeError: When the record id does not exist
+        """
+        await self._delete(delete_file, self._db_conn, int(file_id))
+
+    async def delete_files(self, **criteria) -> int:
+        """Removes many file records as `delete_files` does
+
+        Args:
+            criteria: `delete_files` selection keyword arguments
+
+        Returns:
+            int: Number of deleted files
+        """
+        return await self._delete(delete_matching, self._db_conn, **criteria)
@@ -0,0 +1,18 @@
+"""
+Archive catalogs
+
+Tells archive catalogs from file databases with the standard library only, the
+command line checks every database it opens before loading what it needs.
+"""
+import os
+import sqlite3
+from contextlib import closing
+
+
+def is_archive(path: str) -> bool:
+    """Whether `path` is an archive catalog"""
+    if not os.path.isfile(path):
+        return False
+    with closing(sqlite3.connect(path)) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    return "shards" in tables and "files" not in tables
@@ -0,0 +1,230 @@
+"""
+File chunking engines
+
+`fixed` splits files in to chunks of the same size. `fastcdc` places chunk
+boundaries by content using a gear rolling hash with normalized chunking
+(FastCDC), so inserting or removing bytes only changes the chunks around the edit.
+
+Given a `BufferPool`, `fixed` reads chunks in to reused buffers and yields
+memoryviews over them, so storing large files does not allocate a new chunk
+sized `bytes` object per chunk.
+"""
+import hashlib
+import json
+from collections import deque
+
+CHUNK_SIZE = 10485760
+
+FASTCDC_MIN_SIZE = 262144
+FASTCDC_AVG_SIZE = 1048576
+FASTCDC_MAX_SIZE = 4194304
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_NORMALIZATION = 2
+
+# Chunk boundaries depend on this table, it must never change
+_GEAR = tuple(
+    int.from_bytes(hashlib.sha256(bytes([value])).digest()[:8], "big")
+    for value in range(256)
+)
+
+
+class BufferPool:
+    """Read buffers reused across chunks
+
+    A chunk read in to a pool buffer is only valid until it is handed back
+    through `release`, the buffer is then overwritten by a later read. Chunks
+    which are never released cost a new allocation, not a corruption. The pool
+    may be shared by reader threads.
+    """
+
+    def __init__(self) -> None:
+        self._free = deque()
+
+    def acquire(self, size: int) -> bytearray:
+        """A buffer of `size` bytes, reused when one is free"""
+        try:
+            buffer = self._free.pop()
+        except IndexError:
+            return bytearray(size)
+        return buffer if len(buffer) == size else bytearray(size)
+
+    def release(self, data) -> None:
+        """Hands back a buffer, or a memoryview over one, other data is ignored"""
+        if isinstance(data, memoryview) and isinstance(data.obj, bytearray):
+            buffer = data.obj
+            data.release()
+            self._free.append(buffer)
+        elif isinstance(data, bytearray):
+            self._free.append(data)
+
+
+def _read_full(fp_reader, view) -> int:
+    """Fills `view` unless the end of the file is reached first"""
+    size = 0
+    while size < len(view):
+        count = fp_reader.readinto(view[size:])
+        if not count:
+            break
+        size += count
+    return size
+
+
+class FixedChunker:
+    """Splits files in to chunks of `chunk_size` bytes"""
+
+    name = "fixed"
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE) -> None:
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be positive")
+        self.chunk_size = chunk_size
+
+    @property
+    def params(self) -> dict:
+        return {"chunk_size": self.chunk_size}
+
+    def read_file(self, file_path: str, buffers: BufferPool = None):
+        """Yields chunks of the file"""
+        # chunks are read straight in to pool buffers, not through a file buffer
+        with open(file_path, "rb", buffering=-1 if buffers is None else 0) as fp_reader:
+            yield from self.split(fp_reader, buffers)
+
+    def split(self, fp_reader, buffers: BufferPool = None):
+        """Yields chunks read from a binary file object
+
+        With `buffers` chunks are memoryviews over buffers of the pool, the
+        caller releases each one once it is done with it.
+        """
+        if buffers is None or not hasattr(fp_reader, "readinto"):
+            while True:
+                chunk = fp_reader.read(self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        while True:
+            buffer = buffers.acquire(self.chunk_size)
+            with memoryview(buffer) as view:
+                size = _read_full(fp_reader, view)
+            if not size:
+                buffers.release(buffer)
+                return
+            yield memoryview(buffer)[:size]
+
+
+class FastCDCChunker:
+    """Content defined chunking with min/avg/max chunk sizes"""
+
+    name = "fastcdc"
+
+    def __init__(
+        self,
+        min_size: int = FASTCDC_MIN_SIZE,
+        avg_size: int = FASTCDC_AVG_SIZE,
+        max_size: int = FASTCDC_MAX_SIZE,
+    ) -> None:
+        if not 0 < min_size < avg_size < max_size:
+            raise ValueError("Chunk sizes must satisfy 0 < min < avg < max")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = max(avg_size.bit_length() - 1, _NORMALIZATION + 1)
+        # the top bits of the hash depend on the last 64 bytes
+        self._mask_small = ((1 << (bits + _NORMALIZATION)) - 1) << (
+            64 - bits - _NORMALIZATION
+        )
+        self._mask_large = ((1 << (bits - _NORMALIZATION)) - 1) << (
+            64 - bits + _NORMALIZATION
+        )
+
+    @property
+    def params(self) -> dict:
+        return {
+            "min_size": self.min_size,
+            "avg_size": self.avg_size,
+            "max_size": self.max_size,
+        }
+
+    def cut_point(self, data, start: int = 0, end: int = None) -> int:
+        """Position where the chunk starting at `start` ends, at most `end`"""
+        end = len(data) if end is None else end
+        size = end - start
+        if size <= self.min_size:
+            return end
+        if size > self.max_size:
+            end = start + self.max_size
+        normal = min(start + self.avg_size, end)
+        gear = _GEAR
+        fingerprint = 0
+        position = start + self.min_size
+        mask = self._mask_small
+        for byte in data[position:normal]:
+            fingerprint = ((fingerprint << 1) + gear[byte]) & _MASK64
+            position += 1
+            if not fingerprint & mask:
+                return position
+        mask = self._mask_large
+        for byte in data[normal:end]:
+            fingerprint = ((fingerprint << 1) + gear[byte]) & _MASK64
+            position += 1
+            if not fingerprint & mask:
+                return position
+        return end
+
+    def read_file(self, file_path: str, buffers=None):
+        """Yields chunks of the file"""
+        with open(file_path, "rb") as fp_reader:
+            yield from self.split(fp_reader, buffers)
+
+    def split(self, fp_reader, buffers=None):  # pylint: disable=unused-argument
+        """Yields chunks read from a binary file object
+
+        Chunks are cut from a sliding window, `buffers` is not used.
+        """
+        data = b""
+        offset = 0
+        eof = False
+        while True:
+            if not eof and len(data) - offset < self.max_size:
+                block = fp_reader.read(4 * self.max_size)
+                eof = not block
+                data = data[offset:] + block
+                offset = 0
+            if offset >= len(data):
+                return
+            cut = self.cut_point(data, offset)
+            yield data[offset:cut]
+            offset = cut
+
+
+CHUNKERS = {FixedChunker.name: FixedChunker, FastCDCChunker.name: FastCDCChunker}
+
+
+def chunker_config(chunker) -> str:
+    """Serializes a chunker for the database metadata"""
+    return json.dumps({"name": chunker.name, "params": chunker.params})
+
+
+def chunker_from_config(config: str):
+    """Creates a chunker from `chunker_config` output
+
+    Raises:
+        ValueError: When the chunking engine is unknown
+    """
+    config = json.loads(config)
+    try:
+        return CHUNKERS[config["name"]](**config.get("params", {}))
+    except KeyError as err:
+        raise ValueError(f"Unknown chunker {config['name']}") from err
+
+
+def get_chunker(name: str, **params):
+    """Creates a chunker by engine name
+
+    Raises:
+        ValueError: When the chunking engine is unknown
+    """
+    try:
+        return CHUNKERS[name](**params)
+    except KeyError as err:
+        raise ValueError(f"Unknown chunker {name}") from err
@@ -0,0 +1,997 @@
+"""
+Command line interface
+
+`python -m file_utils <command>` runs the commands of the standalone scripts,
+which are thin wrappers over it, from a single entry point. Only the modules a
+command uses are imported and output modes import their dependencies when
+they are selected.
+
+`batch` runs many commands through one database connection, so automation
+issuing thousands of small operations pays for a single process start and
+connection, and SQLite reuses the statements it keeps prepared per
+connection. Commands are read from standard input, one per line, either as
+the arguments of a command, e.g. `find "*.txt" -o ndjson`, or as a JSON
+array of them, e.g. `["restore", "12", "/tmp/out"]`. Lines starting with `#`
+are ignored. A failed command is reported on stderr with its line number and
+the batch goes on, the exit status is 1 when any command failed.
+"""
+import argparse
+import json
+import logging
+import os
+import shlex
+import sqlite3
+import sys
+from collections import namedtuple
+
+# modules are imported by the commands using them
+# pylint: disable=import-outside-toplevel
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s]: %(message)s"
+
+OUTPUTS = {
+    "json": "AsJSON",
+    "print": "AsTable",
+    "generic": "Generic",
+    "ndjson": "AsNDJSON",
+    "json-stream": "AsJSONStream",
+    "csv": "AsCSV",
+    "paged": "AsPagedTable",
+}
+
+# failures reported per command instead of a traceback
+_ERRORS = (OSError, RuntimeError, ValueError, sqlite3.Error)
+
+_STATS_HELP = "Print the time spent per phase and throughput to stderr"
+_BATCH_HELP = "Run commands read from stdin through one database connection"
+
+_logger = logging.getLogger(__file__)
+
+# `arguments(parser, batch)` adds the options of a command but the database
+# path, `run(session, args)` returns its output
+Command = namedtuple("Command", ["help", "arguments", "run"])
+
+
+def configure_logging() -> None:
+    """Logs INFO records to stderr"""
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+
+class _Session:
+    """Database used by the commands of a run
+
+    The connection is opened by the first command using it and closed, after
+    a commit unless the run failed, when the session ends.
+
+    Args:
+        db_name (str): Path to sqlite database
+        options: `SQLiteDBManager` keyword arguments
+    """
+
+    def __init__(self, db_name: str, **options) -> None:
+        from .catalog import is_archive
+
+        self.db_name = db_name
+        self.options = options
+        self.archive = is_archive(db_name)
+        self._db_conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if self._db_conn is not None:
+            self._db_conn.__exit__(exc_type, *exc_info)
+            self._db_conn = None
+
+    def connection(self, create: bool = False):
+        """Open database, it must exist unless `create` is set
+
+        Raises:
+            FileNotFoundError: When db file does not exists
+        """
+        if self._db_conn is None:
+            if not create and not os.path.isfile(self.db_name):
+                raise FileNotFoundError(f"DB file {self.db_name} does not exists")
+            from .db_managers import SQLiteDBManager
+
+            db_conn = SQLiteDBManager(self.db_name, **self.options)
+            self._db_conn = db_conn.__enter__()  # pylint: disable=C2801
+        return self._db_conn
+
+    def release(self) -> str:
+        """Commits and closes the connection for a command opening its own
+
+        Returns:
+            str: Path of the database
+        """
+        if self._db_conn is not None:
+            self._db_conn.__exit__(None, None, None)
+            self._db_conn = None
+        return self.db_name
+
+    def command_done(self) -> None:
+        """Commits the rows of finished commands once a bulk batch is due"""
+        if self._db_conn is not None:
+            self._db_conn.commit_if_due()
+
+
+class _BatchParser(argparse.ArgumentParser):
+    """Raises on invalid commands instead of exiting"""
+
+    def error(self, message):
+        raise ValueError(f"{self.prog}: {message}")
+
+    def exit(self, status=0, message=None):
+        raise ValueError(message.strip() if message else f"{self.prog} stopped")
+
+
+def _output(name: str):
+    from . import output_handlers
+
+    return getattr(output_handlers, OUTPUTS[name])()
+
+
+def _add_connection_arguments(parser) -> None:
+    from .db_managers import BATCH_BYTES, BATCH_ROWS
+
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Bulk ingest mode, commit rows in large transactions",
+    )
+    parser.add_argument(
+        "--batch-rows",
+        type=int,
+        default=BATCH_ROWS,
+        help="Rows per transaction in bulk mode",
+    )
+    parser.add_argument(
+        "--batch-bytes",
+        type=int,
+        default=BATCH_BYTES,
+        help="Stored bytes per transaction in bulk mode",
+    )
+
+
+def _connection_options(args) -> dict:
+    if not hasattr(args, "bulk"):
+        return {}
+    return {
+        "bulk": args.bulk,
+        "batch_rows": args.batch_rows,
+        "batch_bytes": args.batch_bytes,
+    }
+
+
+def _backup_arguments(parser, batch: bool) -> None:
+    from .chunkers import (
+        CHUNK_SIZE,
+        CHUNKERS,
+        FASTCDC_AVG_SIZE,
+        FASTCDC_MAX_SIZE,
+        FASTCDC_MIN_SIZE,
+    )
+    from .compression import CODECS, MIN_SAVINGS
+    from .files import INLINE_SIZE
+    from .pipeline import QUEUE_DEPTH
+    from .storage import PACK_SIZE, STORAGES
+    from .walker import SYMLINK_POLICIES, SYMLINKS_FILES
+
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="Skip unchanged files by size, mtime and inode, update changed files",
+    )
+    parser.add_argument(
+        "--chunker",
+        choices=sorted(CHUNKERS),
+        help="Chunking engine, by default the one recorded in the database",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help=f"Chunk size of the fixed chunker, {CHUNK_SIZE} by default. The first "
+        "run records it in the database, later runs use it for that run only",
+    )
+    parser.add_argument(
+        "--min-chunk-size",
+        type=int,
+        default=FASTCDC_MIN_SIZE,
+        help="Minimum chunk size of the fastcdc chunker",
+    )
+    parser.add_argument(
+        "--avg-chunk-size",
+        type=int,
+        default=FASTCDC_AVG_SIZE,
+        help="Average chunk size of the fastcdc chunker",
+    )
+    parser.add_argument(
+        "--max-chunk-size",
+        type=int,
+        default=FASTCDC_MAX_SIZE,
+        help="Maximum chunk size of the fastcdc chunker",
+    )
+    parser.add_argument(
+        "-c",
+        "--compression",
+        choices=CODECS,
+        help="Compress chunks with the codec, chunks that do not shrink are kept raw",
+    )
+    parser.add_argument(
+        "--compression-level", type=int, help="Codec compression level or preset"
+    )
+    parser.add_argument(
+        "--min-savings",
+        type=float,
+        default=MIN_SAVINGS,
+        help="Minimum share of a chunk size compression has to save",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=sorted(STORAGES),
+        help="Where chunk content is written, by default the backend recorded in "
+        "the database",
+    )
+    parser.add_argument(
+        "--pack-size",
+        type=int,
+        default=PACK_SIZE,
+        help="Maximum size of a pack file of the pack storage",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=0,
+        help="Reader threads, 0 reads files on the main thread",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=QUEUE_DEPTH,
+        help="Chunks buffered between readers and the database writer. "
+        "Memory use is bounded by (queue depth + workers) x chunk size",
+    )
+    parser.add_argument(
+        "-e",
+        "--exclude",
+        action="append",
+        default=[],
+        help="Skip files and directories matching this gitignore style pattern, "
+        "repeatable",
+    )
+    parser.add_argument(
+        "--exclude-from",
+        action="append",
+        default=[],
+        help="Read exclude patterns from this file, e.g. a .gitignore, repeatable",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        help="Store only files matching this gitignore style pattern, repeatable",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="Directory levels entered below each path, 0 stores its files only",
+    )
+    parser.add_argument(
+        "--symlinks",
+        choices=SYMLINK_POLICIES,
+        default=SYMLINKS_FILES,
+        help="skip symbolic links, follow links to files only or follow links to "
+        "files and directories",
+    )
+    parser.add_argument(
+        "-x",
+        "--one-file-system",
+        action="store_true",
+        help="Do not enter directories on other file systems",
+    )
+    parser.add_argument("--min-size", type=int, help="Smallest stored file in bytes")
+    parser.add_argument("--max-size", type=int, help="Largest stored file in bytes")
+    parser.add_argument(
+        "--walk-workers",
+        type=int,
+        default=0,
+        help="Directory scanning threads, 0 scans on the main thread",
+    )
+    parser.add_argument(
+        "--inline-size",
+        type=int,
+        default=0,
+        help="Store files up to this size in bytes on their file record instead of "
+        f"in chunks, e.g. {INLINE_SIZE}, 0 disables it",
+    )
+    if not batch:
+        # a batch configures its shared connection and does not serve archives
+        _add_connection_arguments(parser)
+        parser.add_argument(
+            "--shards",
+            type=int,
+            help="Create the database as an archive of this many shard databases",
+        )
+        parser.add_argument(
+            "--shard",
+            type=int,
+            action="append",
+            help="Write only this shard of an archive, repeatable. Processes given "
+            "different shards write the same archive in parallel",
+        )
+    parser.add_argument(
+        "files",
+        type=str,
+        help="Local file or directory path for backup",
+        nargs="+",
+    )
+
+
+def _backup_options(args) -> dict:
+    from .chunkers import get_chunker
+    from .compression import Compressor
+    from .storage import get_storage
+    from .walker import Walker, read_patterns
+
+    if args.chunker == "fastcdc" and args.chunk_size is not None:
+        raise ValueError("--chunk-size applies to the fixed chunker only")
+    chunker = None
+    if args.chunker == "fastcdc":
+        chunker = get_chunker(
+            "fastcdc",
+            min_size=args.min_chunk_size,
+            avg_size=args.avg_chunk_size,
+            max_size=args.max_chunk_size,
+        )
+    elif args.chunk_size is not None:
+        chunker = get_chunker("fixed", chunk_size=args.chunk_size)
+    elif args.chunker:
+        chunker = get_chunker(args.chunker)
+
+    compression = None
+    if args.compression:
+        compression = Compressor(
+            args.compression,
+            level=args.compression_level,
+            min_savings=args.min_savings,
+        )
+
+    storage = None
+    if args.storage == "pack":
+        storage = get_storage("pack", pack_size=args.pack_size)
+    elif args.storage:
+        storage = get_storage(args.storage)
+
+    exclude = list(args.exclude)
+    for patterns_file in args.exclude_from:
+        exclude.extend(read_patterns(patterns_file))
+    walker = Walker(
+        exclude=exclude,
+        include=args.include,
+        max_depth=args.max_depth,
+        symlinks=args.symlinks,
+        one_file_system=args.one_file_system,
+        min_size=args.min_size,
+        max_size=args.max_size,
+        workers=args.walk_workers,
+    )
+    return {
+        "incremental": args.incremental,
+        "chunker": chunker,
+        "compression": compression,
+        "storage": storage,
+        "workers": args.workers,
+        "queue_depth": args.queue_depth,
+        "walker": walker,
+        "inline_size": args.inline_size,
+    }
+
+
+def _backup(session, args) -> str:
+    options = _backup_options(args)
+    shards = getattr(args, "shards", None)
+    if shards and not session.archive:
+        from .shards import create_archive
+
+        create_archive(session.db_name, shards)
+        session.archive = True
+    if session.archive:
+        from .shards import store_archive
+
+        stats = store_archive(
+            session.db_name,
+            args.files,
+            shards=getattr(args, "shard", None),
+            **session.options,
+            **options,
+        )
+    else:
+        from .files import IngestStats, iter_ingest
+
+        stats = IngestStats()
+        for _ in iter_ingest(
+            session.connection(create=True), args.files, stats, **options
+        ):
+            pass
+    return (
+        f"Stored {stats.files} file(s), {stats.unchanged} unchanged: "
+        f"{stats.bytes_read / 1000000.0:.2f} MB read, "
+        f"{stats.bytes_stored / 1000000.0:.2f} MB stored, "
+        f"{stats.bytes_written / 1000000.0:.2f} MB written, "
+        f"dedup ratio {stats.dedup_ratio:.2f}, "
+        f"compression ratio {stats.compression_ratio:.2f}"
+    )
+
+
+def _page_arguments(parser, verb: str, outputs) -> None:
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="print",
+        choices=outputs,
+        help="Output mode, ndjson, json-stream, csv and paged are written as "
+        "rows are read",
+    )
+    parser.add_argument("--limit", type=int, help="Maximum number of files")
+    parser.add_argument("--offset", type=int, default=0, help="Number of files to skip")
+    parser.add_argument(
+        "--after", type=int, help="Files after this file ID, as ordered by name"
+    )
+    _snapshot_arguments(parser, verb)
+
+
+def _snapshot_arguments(parser, verb: str) -> None:
+    parser.add_argument(
+        "--snapshot",
+        type=int,
+        help=f"{verb} the versions of this snapshot ID instead of the current ones",
+    )
+    parser.add_argument(
+        "--at",
+        type=str,
+        help=f"{verb} the versions of the last snapshot taken at or before this "
+        "ISO time, e.g. 2024-01-31T18:00",
+    )
+
+
+def _selection_arguments(parser, verb: str) -> None:
+    parser.add_argument(
+        "--ids", type=int, nargs="+", help=f"File IDs to {verb.lower()}"
+    )
+    parser.add_argument(
+        "-g",
+        "--glob",
+        type=str,
+        help="File name to search for, use `*` as wildcard, otherwise a prefix",
+    )
+    parser.add_argument(
+        "-l",
+        "--location",
+        type=str,
+        help=f"{verb} files originally stored under this directory",
+    )
+
+
+def _list_arguments(parser, _batch: bool) -> None:
+    _page_arguments(parser, "List", [name for name in OUTPUTS if name != "generic"])
+
+
+def _find_arguments(parser, _batch: bool) -> None:
+    parser.add_argument(
+        "file_name",
+        type=str,
+        nargs="?",
+        help="Full file name or file prefix, use `*` as wildcard. "
+        "Insensitive to capital letters",
+    )
+    parser.add_argument(
+        "-l",
+        "--location",
+        type=str,
+        help="Original directory, sub directories included, or a location "
+        "pattern using `*` as wildcard",
+    )
+    _page_arguments(parser, "Search", list(OUTPUTS))
+
+
+def _find(session, args) -> str:
+    file_name = getattr(args, "file_name", None)
+    location = getattr(args, "location", None)
+    if args.command == "find" and file_name is None and location is None:
+        raise ValueError("a file name or --location is required")
+    callback = _output(args.output)
+    if session.archive:
+        if args.snapshot is not None:
+            raise ValueError("--snapshot is not supported by archives, use --at")
+        from .shards import find_archive
+
+        # every shard records its own snapshots
+        return find_archive(
+            session.db_name,
+            file_name,
+            callback,
+            location=location,
+            limit=args.limit,
+            offset=args.offset,
+            after_id=args.after,
+            at=args.at,
+        )
+    from .queries import query_files
+
+    return callback.get_all(
+        query_files(
+            session.connection(),
+            file_name,
+            location,
+            limit=args.limit,
+            offset=args.offset,
+            after_id=args.after,
+            snapshot_id=args.snapshot,
+            at=args.at,
+        )
+    )
+
+
+def _restore_arguments(parser, _batch: bool) -> None:
+    parser.add_argument(
+        "file_id",
+        type=int,
+        help="File ID to restore from backup database to local directory",
+    )
+    parser.add_argument(
+        "destination",
+        type=str,
+        help="Directory where to restore the target file",
+    )
+
+
+def _restore(session, args) -> str:
+    destination = os.path.abspath(args.destination)
+    if session.archive:
+        from .files import restore_file_by_id
+        from .shards import resolve_file_id
+
+        restore_file_by_id(*resolve_file_id(session.db_name, args.file_id), destination)
+        return ""
+    from .files import restore_file
+
+    restore_file(session.connection(), args.file_id, destination)
+    return ""
+
+
+def _remove_arguments(parser, _batch: bool) -> None:
+    parser.add_argument("file_id", type=int, help="File ID to delete")
+
+
+def _remove(session, args) -> str:
+    if session.archive:
+        raise ValueError("Removing files is not supported by archives")
+    from .files import delete_file
+
+    delete_file(session.connection(), args.file_id)
+    return ""
+
+
+def _restore_files_arguments(parser, _batch: bool) -> None:
+    parser.add_argument(
+        "destination",
+        type=str,
+        help="Directory where to restore the original directory structure",
+    )
+    _selection_arguments(parser, "Restore")
+    parser.add_argument(
+        "-w", "--workers", type=int, default=4, help="Files restored in parallel"
+    )
+    _snapshot_arguments(parser, "Restore")
+
+
+def _restore_files(session, args) -> str:
+    criteria = (args.ids, args.glob, args.location, args.snapshot, args.at)
+    if all(value is None for value in criteria):
+        raise ValueError(
+            "one of --ids, --glob, --location, --snapshot or --at is required"
+        )
+    from .files import restore_files
+
+    restore_files(
+        session.release(),
+        os.path.abspath(args.destination),
+        file_ids=args.ids,
+        pattern=args.glob,
+        location=args.location,
+        snapshot_id=args.snapshot,
+        at=args.at,
+        workers=args.workers,
+    )
+    return ""
+
+
+def _prune_arguments(parser, _batch: bool) -> None:
+    from .files import RECLAIM_PAGES
+
+    _selection_arguments(parser, "Delete")
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        help="Delete file versions replaced by a newer one more than this many "
+        "days ago, current versions are kept",
+    )
+    parser.add_argument(
+        "--created-older-than",
+        type=float,
+        help="Delete file versions stored more than this many days ago, current "
+        "versions included",
+    )
+    parser.add_argument(
+        "--reclaim-pages",
+        type=int,
+        default=RECLAIM_PAGES,
+        help="Maximum number of database pages returned to the filesystem per "
+        "run, 0 for all",
+    )
+    parser.add_argument(
+        "--enable-incremental-vacuum",
+        action="store_true",
+        help="Switch a database created by an older version to incremental "
+        "vacuum, rebuilds it once with a full VACUUM",
+    )
+
+
+def _days_ago(days):
+    from datetime import datetime, timedelta
+
+    return None if days is None else datetime.now() - timedelta(days=days)
+
+
+def _prune(session, args) -> str:
+    from .files import delete_files, reclaim_space
+
+    db_name = session.release()
+    criteria = (args.ids, args.glob, args.location)
+    criteria += (args.older_than, args.created_older_than)
+    deleted = 0
+    if any(value is not None for value in criteria):
+        deleted = delete_files(
+            db_name,
+            file_ids=args.ids,
+            pattern=args.glob,
+            location=args.location,
+            replaced_before=_days_ago(args.older_than),
+            created_before=_days_ago(args.created_older_than),
+        )
+    released = reclaim_space(
+        db_name,
+        max_pages=args.reclaim_pages or None,
+        enable=args.enable_incremental_vacuum,
+    )
+    return f"Deleted {deleted} file(s), released {released / 1000000.0:.2f} MB"
+
+
+def _verify_arguments(parser, _batch: bool) -> None:
+    parser.add_argument(
+        "-w", "--workers", type=int, help="Verifying threads, CPU count by default"
+    )
+    parser.add_argument(
+        "--rate", type=float, help="Maximum read rate in MB/s, unlimited by default"
+    )
+    parser.add_argument(
+        "--max-mb",
+        type=int,
+        help="Stop after reading this many MB, the next run continues from there",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Start over instead of resuming an interrupted scrub",
+    )
+
+
+def _verify(session, args) -> str:
+    from .scrub import affected_files, scrub
+
+    db_name = session.release()
+    report = scrub(
+        db_name,
+        workers=args.workers,
+        rate=args.rate * 1000000.0 if args.rate else None,
+        restart=args.restart,
+        max_bytes=args.max_mb * 1000000 if args.max_mb else None,
+    )
+    lines = [
+        f"Verified {report.chunks} chunk(s), {report.bytes_read / 1000000.0:.2f} MB: "
+        f"{len(report.corrupt)} corrupt, {len(report.missing)} missing, "
+        f"{len(report.mismatched_files)} mismatched file record(s)"
+        + ("" if report.completed else ", scrub not completed yet")
+    ]
+    for file_id, location, file_name in affected_files(
+        db_name, report.corrupt + report.missing
+    ):
+        lines.append(f"Damaged {file_id} {location}/{file_name}")
+    lines.extend(f"Mismatched record {file_id}" for file_id in report.mismatched_files)
+    sys.stdout.write("\n".join(lines) + "\n")
+    if not report.clean:
+        raise RuntimeError("damaged chunks or file records found")
+    return ""
+
+
+def _cat_arguments(parser, _batch: bool) -> None:
+    parser.add_argument("file_id", type=int, nargs="?", help="File ID to read")
+    parser.add_argument(
+        "-p", "--path", type=str, help="Original path of the file, instead of an ID"
+    )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        help="First byte to read, negative values count from the end",
+    )
+    parser.add_argument("--length", type=int, help="Bytes to read, all by default")
+    _snapshot_arguments(parser, "Read")
+
+
+def _cat(session, args) -> str:
+    if (args.file_id is None) == (args.path is None):
+        raise ValueError("either a file ID or --path is required")
+    if args.snapshot is not None and session.archive:
+        raise ValueError("--snapshot is not supported by archives, use --at")
+    import io
+    import shutil
+
+    from .reader import open_file
+
+    db_name, file_id = session.release(), args.file_id
+    if session.archive and file_id is not None:
+        from .shards import resolve_file_id
+
+        db_name, file_id = resolve_file_id(db_name, file_id)
+    elif session.archive:
+        from .shards import shard_index, shard_paths
+
+        paths = shard_paths(db_name)
+        location, file_name = os.path.split(args.path)
+        db_name = paths[shard_index(location, file_name, len(paths))]
+    with open_file(
+        db_name, file_id, path=args.path, snapshot_id=args.snapshot, at=args.at
+    ) as stored:
+        stored.seek(args.offset, io.SEEK_END if args.offset < 0 else io.SEEK_SET)
+        reader = io.BufferedReader(stored)
+        sys.stdout.flush()
+        if args.length is None:
+            shutil.copyfileobj(reader, sys.stdout.buffer)
+        else:
+            sys.stdout.buffer.write(reader.read(args.length))
+        sys.stdout.buffer.flush()
+    return ""
+
+
+def _export_arguments(parser, _batch: bool) -> None:
+    from .tar_stream import COMPRESSIONS
+
+    parser.add_argument(
+        "-o", "--output", type=str, help="Tar file to write, standard output by default"
+    )
+    _selection_arguments(parser, "Export")
+    _snapshot_arguments(parser, "Export")
+    parser.add_argument(
+        "-c", "--compression", choices=COMPRESSIONS, help="Compress the tar stream"
+    )
+
+
+def _export(session, args) -> str:
+    if session.archive:
+        raise ValueError("archives are exported shard by shard, pass a shard database")
+    from .tar_stream import export_tar
+
+    selection = {
+        "file_ids": args.ids,
+        "pattern": args.glob,
+        "location": args.location,
+        "snapshot_id": args.snapshot,
+        "at": args.at,
+        "compression": args.compression,
+    }
+    db_name = session.release()
+    if args.output in (None, "-"):
+        sys.stdout.flush()
+        export_tar(db_name, sys.stdout.buffer, **selection)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, "wb") as fp_writer:
+            export_tar(db_name, fp_writer, **selection)
+    return ""
+
+
+def _import_arguments(parser, batch: bool) -> None:
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        # standard input holds the commands of a batch
+        required=batch,
+        help="Tar file to read" + ("" if batch else ", standard input by default"),
+    )
+    if not batch:
+        _add_connection_arguments(parser)
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        help="Store members under this directory instead of their recorded "
+        "original path",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip members unchanged by size and mtime, store changed ones as new "
+        "versions",
+    )
+
+
+def _import(session, args) -> str:
+    if session.archive:
+        raise ValueError("archives are imported shard by shard, pass a shard database")
+    from .tar_stream import import_tar
+
+    options = {"prefix": args.prefix, "incremental": args.incremental}
+    options.update(session.options)
+    db_name = session.release()
+    if args.input in (None, "-"):
+        stats = import_tar(db_name, sys.stdin.buffer, **options)
+    else:
+        with open(args.input, "rb") as fp_reader:
+            stats = import_tar(db_name, fp_reader, **options)
+    return (
+        f"Stored {stats.files} file(s), {stats.unchanged} unchanged: "
+        f"{stats.bytes_read / 1000000.0:.2f} MB read, "
+        f"{stats.bytes_stored / 1000000.0:.2f} MB stored"
+    )
+
+
+def _snapshots(session, _args) -> str:
+    from tabulate import tabulate
+
+    from .files import list_snapshots
+
+    return tabulate(list_snapshots(session.release()), headers=["ID", "Created on"])
+
+
+COMMANDS = {
+    "backup": Command("Backup files in to database", _backup_arguments, _backup),
+    "list": Command("List of files in a local database", _list_arguments, _find),
+    "find": Command(
+        "Search by file name and original location in a local database",
+        _find_arguments,
+        _find,
+    ),
+    "restore": Command(
+        "Restore file from backup by file id", _restore_arguments, _restore
+    ),
+    "remove": Command(
+        "Remove file from backup database by file id", _remove_arguments, _remove
+    ),
+    "restore-files": Command(
+        "Restore many files from backup recreating their directories",
+        _restore_files_arguments,
+        _restore_files,
+    ),
+    "prune": Command(
+        "Delete files from backup in bulk and reclaim disk space. Without "
+        "selection criteria only disk space is reclaimed",
+        _prune_arguments,
+        _prune,
+    ),
+    "verify": Command(
+        "Verify the integrity of stored chunks, resuming an interrupted run",
+        _verify_arguments,
+        _verify,
+    ),
+    "cat": Command(
+        "Write a range of a stored file to stdout without restoring it",
+        _cat_arguments,
+        _cat,
+    ),
+    "export": Command(
+        "Write stored files as a tar stream, all current files unless a "
+        "selection is given",
+        _export_arguments,
+        _export,
+    ),
+    "import": Command(
+        "Store the files of a tar stream, as written by export or tar, without "
+        "extracting it",
+        _import_arguments,
+        _import,
+    ),
+    "snapshots": Command(
+        "List the snapshots taken by backups of a local database",
+        lambda parser, batch: None,
+        _snapshots,
+    ),
+}
+
+
+def _parser(selected: str = None, batch: bool = False):
+    """Argument parser, only the options of the `selected` command are added
+
+    All commands get their options when `selected` is None. Commands of a
+    batch have no database path and raise `ValueError` when invalid.
+    """
+    parser_class = _BatchParser if batch else argparse.ArgumentParser
+    parser = parser_class(
+        prog="file-utils", description="Backup files in to SQLite databases"
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    for name, command in COMMANDS.items():
+        sub = commands.add_parser(name, help=command.help, description=command.help)
+        if selected is not None and name != selected:
+            continue
+        if not batch:
+            sub.add_argument("db", type=str, help="Local Database path")
+        command.arguments(sub, batch)
+        if not batch:
+            sub.add_argument("--stats", action="store_true", help=_STATS_HELP)
+    if not batch:
+        sub = commands.add_parser("batch", help=_BATCH_HELP, description=_BATCH_HELP)
+        if selected in (None, "batch"):
+            sub.add_argument("db", type=str, help="Local Database path")
+            _add_connection_arguments(sub)
+            sub.add_argument("--stats", action="store_true", help=_STATS_HELP)
+    return parser
+
+
+def _run(session, args) -> None:
+    output = COMMANDS[args.command].run(session, args)
+    if output:
+        sys.stdout.write(output if output.endswith("\n") else f"{output}\n")
+    sys.stdout.flush()
+
+
+def _batch(args, stream) -> int:
+    parser = _parser(batch=True)
+    failed = 0
+    with _Session(args.db, **_connection_options(args)) as session:
+        if session.archive:
+            sys.stderr.write("Archives are not supported by batches\n")
+            return 1
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                argv = json.loads(line) if line.startswith("[") else shlex.split(line)
+                _run(session, parser.parse_args([str(item) for item in argv]))
+            except _ERRORS as err:
+                failed += 1
+                sys.stderr.write(f"line {number}: {err}\n")
+            session.command_done()
+    return 1 if failed else 0
+
+
+def main(argv=None, stream=None) -> int:
+    """Runs a command line
+
+    Args:
+        argv (list): Arguments, those of the process when None
+        stream: Commands of `batch`, stdin when None
+
+    Returns:
+        int: Exit status
+    """
+    from .stats import recording
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    configure_logging()
+    parser = _parser(argv[0] if argv else "")
+    args = parser.parse_args(argv)
+    with recording(args.stats):
+        try:
+            if args.command == "batch":
+                return _batch(args, sys.stdin if stream is None else stream)
+            with _Session(args.db, **_connection_options(args)) as session:
+                _run(session, args)
+        except _ERRORS as err:
+            sys.stderr.write(f"{parser.prog} {args.command}: error: {err}\n")
+            return 1
+    return 0
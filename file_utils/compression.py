@@ -0,0 +1,102 @@
+"""
+Chunk compression with the standard library codecs
+
+Every stored chunk carries the tag of the codec it is encoded with, chunks which
+do not shrink enough are stored `raw`.
+"""
+import bz2
+import lzma
+import zlib
+
+RAW = "raw"
+MIN_SAVINGS = 0.1
+
+# Incompressible data is detected on a sample before compressing a whole chunk
+_SAMPLE_SIZE = 65536
+
+_COMPRESSORS = {
+    "zlib": lambda data, level: zlib.compress(data, 6 if level is None else level),
+    "lzma": lambda data, level: lzma.compress(data, preset=level),
+    "bz2": lambda data, level: bz2.compress(data, 9 if level is None else level),
+}
+
+_DECOMPRESSORS = {
+    RAW: bytes,
+    "zlib": zlib.decompress,
+    "lzma": lzma.decompress,
+    "bz2": bz2.decompress,
+}
+
+_STREAM_DECOMPRESSORS = {
+    "zlib": zlib.decompressobj,
+    "lzma": lzma.LZMADecompressor,
+    "bz2": bz2.BZ2Decompressor,
+}
+
+CODECS = tuple(sorted(_COMPRESSORS))
+
+
+class Compressor:  # pylint: disable=too-few-public-methods
+    """Encodes chunks with `codec`
+
+    A chunk is stored compressed only when that saves at least `min_savings` of its
+    size. Chunks larger than the sample size are first probed with a fast zlib pass
+    over their beginning, so already compressed media is not compressed in full.
+    """
+
+    def __init__(self, codec: str = "zlib", level=None, min_savings=MIN_SAVINGS):
+        if codec not in _COMPRESSORS:
+            raise ValueError(f"Unknown codec {codec}")
+        self.codec = codec
+        self.level = level
+        self.min_savings = min_savings
+
+    def _worth_it(self, compressed_size: int, size: int) -> bool:
+        return compressed_size <= size * (1 - self.min_savings)
+
+    def encode(self, chunk):
+        """Returns (codec, data) to store for a raw chunk"""
+        if len(chunk) > _SAMPLE_SIZE:
+            sample = chunk[:_SAMPLE_SIZE]
+            if not self._worth_it(len(zlib.compress(sample, 1)), len(sample)):
+                return RAW, chunk
+        data = _COMPRESSORS[self.codec](chunk, self.level)
+        if not self._worth_it(len(data), len(chunk)):
+            return RAW, chunk
+        return self.codec, data
+
+
+def decompress(codec: str, data) -> bytes:
+    """Decodes chunk data stored with `codec`
+
+    Raises:
+        ValueError: When the codec is unknown
+    """
+    try:
+        decoder = _DECOMPRESSORS[codec]
+    except KeyError as err:
+        raise ValueError(f"Unknown codec {codec}") from err
+    return decoder(data)
+
+
+def iter_decompress(codec: str, pieces):
+    """Decodes chunk data stored with `codec` which is read in pieces
+
+    Raises:
+        ValueError: When the codec is unknown
+    """
+    if codec == RAW:
+        yield from pieces
+        return
+    try:
+        decoder = _STREAM_DECOMPRESSORS[codec]()
+    except KeyError as err:
+        raise ValueError(f"Unknown codec {codec}") from err
+    for piece in pieces:
+        data = decoder.decompress(piece)
+        if data:
+            yield data
+    if hasattr(decoder, "flush"):
+        data = decoder.flush()
+        if data:
+            yield data
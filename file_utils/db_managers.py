@@ -1,42 +1,247 @@
 """
 Database management operations
 """
+import hashlib
 import logging
 import os
 import sqlite3
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
-)
+from . import stats
+from .storage import BlobStorage, PackReader, PackWriter, pack_path
+
 _logger = logging.getLogger(__file__)
 
+_BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+BATCH_ROWS = 10000
+BATCH_BYTES = 268435456
+BLOB_PIECE_SIZE = 1048576
+
+# WAL keeps the database consistent when the process is killed mid-transaction,
+# NORMAL synchronous only syncs on checkpoints instead of every commit
+_BULK_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+# schema version -> migration script upgrading the previous version to it
+_MIGRATIONS = {
+    1: "0001_content_addressed_chunks.sql",
+    2: "0002_file_signature.sql",
+    3: "0003_metadata.sql",
+    4: "0004_chunk_codec.sql",
+    5: "0005_file_totals.sql",
+    6: "0006_packs.sql",
+    7: "0007_snapshots.sql",
+    8: "0008_inline_content.sql",
+}
+
+
+def _sha256(data):
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _split_statements(lines):
+    """Statements of a migration script without its own `BEGIN` and `COMMIT`
+
+    `executescript` commits any open transaction first, the statements are run
+    one by one in the transaction of the caller instead.
+    """
+    statement = ""
+    for line in lines:
+        if not statement and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            if statement.strip().upper() not in ("BEGIN;", "COMMIT;"):
+                yield statement
+            statement = ""
+
 
-class SQLiteDBManager:
-    def __init__(self, db_path: str) -> None:
+class _ContentHash:
+    """SQL aggregate hashing the decoded content of (codec, chunk) rows
+
+    Only migrations use it, the codecs are not loaded by every connection.
+    """
+
+    def __init__(self) -> None:
+        from .compression import decompress  # pylint: disable=C0415
+
+        self._decompress = decompress
+        self._hash = hashlib.sha256()
+
+    def step(self, codec, chunk) -> None:
+        if chunk is not None:
+            self._hash.update(self._decompress(codec, chunk))
+
+    def finalize(self) -> str:
+        return self._hash.hexdigest()
+
+
+class SQLiteDBManager:  # pylint: disable=too-many-instance-attributes
+    """SQLite database connection
+
+    By default every inserted row is committed immediately. In bulk mode rows are
+    grouped in to transactions which are committed by `commit_if_due` once
+    `batch_rows` rows or `batch_bytes` bytes are pending, or on a clean exit.
+
+    New chunk content is written by the `storage` backend, pack files live in
+    the `<db_path>.packs` directory.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        bulk: bool = False,
+        batch_rows: int = BATCH_ROWS,
+        batch_bytes: int = BATCH_BYTES,
+        storage=None,
+    ) -> None:
         self._initialize_db = not os.path.isfile(db_path)
         self._conn = sqlite3.connect(db_path)
         self._conn.execute("PRAGMA foreign_keys = ON")
+        if bulk:
+            for pragma in _BULK_PRAGMAS:
+                self._conn.execute(pragma)
         self._cursor = self._conn.cursor()
         self._db_path = db_path
+        # incremental BLOB I/O is available from Python 3.11
+        self._blob_io = hasattr(self._conn, "blobopen")
+        self._bulk = bulk
+        self._batch_rows = batch_rows
+        self._batch_bytes = batch_bytes
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self.search_index = False
+        self.storage = storage or BlobStorage()
+        self.packs_dir = f"{db_path}.packs"
+        self._pack_writer = None
+        self._pack_reader = None
 
     def _setup_db(self) -> None:
         """Creates a new sqlite database if db file path is not a file"""
         if self._initialize_db:
-            base_dir = os.path.abspath(os.path.dirname(__file__))
             with open(
-                os.path.join(base_dir, "schema/db_schema.sql"), "r", encoding="utf-8"
+                os.path.join(_BASE_DIR, "schema/db_schema.sql"), "r", encoding="utf-8"
             ) as fp_schema:
                 self._conn.executescript(fp_schema.read())
             self._conn.commit()
+        else:
+            self._migrate_db()
+        self._setup_search_index()
+
+    def _setup_search_index(self) -> None:
+        """Creates the trigram search index when this SQLite build supports it
+
+        The index is not part of the versioned schema, databases keep working
+        with plain `LIKE` scans where FTS5 or the trigram tokenizer is missing.
+        """
+        self.search_index = (
+            self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'files_fts'"
+            ).fetchone()
+            is not None
+        )
+        if self.search_index:
+            return
+        with open(
+            os.path.join(_BASE_DIR, "schema/search_index.sql"), "r", encoding="utf-8"
+        ) as fp_script:
+            try:
+                self._conn.executescript(fp_script.read())
+                self.search_index = True
+            except sqlite3.OperationalError as err:
+                self._conn.rollback()
+                _logger.debug("Search index is not available %s", err)
+
+    def _migrate_db(self) -> None:
+        """Upgrades an existing database to the latest schema version
+
+        The version is read again once the write lock is held, a connection
+        opening the database while another one migrates it waits for the lock
+        and then finds nothing left to do. All pending migrations are applied in
+        the one transaction.
+        """
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= max(_MIGRATIONS):
+            return
+        self._conn.create_function("sha256", 1, _sha256)
+        self._conn.create_aggregate("sha256_content", 2, _ContentHash)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            for target in sorted(_MIGRATIONS):
+                if target <= version:
+                    continue
+                _logger.info(
+                    "Upgrading database %s to version %s", self._db_path, target
+                )
+                with open(
+                    os.path.join(_BASE_DIR, "schema/migrations", _MIGRATIONS[target]),
+                    "r",
+                    encoding="utf-8",
+                ) as fp_migration:
+                    for statement in _split_statements(fp_migration):
+                        self._conn.execute(statement)
+        except BaseException:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
 
     def __enter__(self):
         self._setup_db()
         return self
 
-    def __exit__(self, *exc_info):
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._conn.rollback()
+        for pack_io in (self._pack_writer, self._pack_reader):
+            if pack_io is not None:
+                pack_io.close()
         self._cursor.close()
         self._conn.close()
 
+    def _row_written(self, rows: int = 1, size: int = 0) -> None:
+        if self._bulk:
+            self._pending_rows += rows
+            self._pending_bytes += size
+        else:
+            self.commit()
+
+    def commit(self) -> None:
+        """Commits all pending rows, pack content is synced first"""
+        started = stats.start()
+        if self._pack_writer is not None:
+            self._pack_writer.sync()
+        self._conn.commit()
+        stats.record(stats.COMMIT, started)
+        self._pending_rows = 0
+        self._pending_bytes = 0
+
+    def commit_if_due(self) -> bool:
+        """Commits pending rows once the batch limits are reached
+
+        Must be called only at consistent points, e.g. after a whole file is stored.
+
+        Returns:
+            True when a commit has been made
+        """
+        if (
+            self._pending_rows >= self._batch_rows
+            or self._pending_bytes >= self._batch_bytes
+        ):
+            self.commit()
+            return True
+        return False
+
     def insert_row(self, table, args):
         """Insert rows in to specific table
 
@@ -51,13 +256,120 @@ class SQLiteDBManager:
         query = f"INSERT INTO {table} ({', '.join(args)}) VALUES({stm_values})"
 
         try:
+            started = stats.start()
             self._cursor.execute(query, tuple(args.values()))
-            self._conn.commit()
+            stats.record(stats.INSERT, started, rows=1)
+            self._row_written()
             return self._cursor.lastrowid
         except sqlite3.IntegrityError as err:
             _logger.error("File already exists in database %s", err)
         return None
 
+    def update_row(self, table, record_id: int, args) -> None:
+        """Update columns of a single row by id
+
+        Args:
+            table (str): DB table name
+            record_id (int): Row id
+            args (dict): Column values to set
+        """
+        assignments = ", ".join(f"{column} = ?" for column in args)
+        started = stats.start()
+        self._cursor.execute(
+            f"UPDATE {table} SET {assignments} WHERE id = ?",
+            (*args.values(), int(record_id)),
+        )
+        stats.record(stats.INSERT, started, rows=1)
+        self._row_written()
+
+    def insert_chunk(
+        self, chunk_hash: str, chunk, size: int = None, codec: str = "raw"
+    ) -> bool:
+        """Stores chunk content once per content hash
+
+        Args:
+            chunk_hash (str): Content hash of the raw chunk
+            chunk (bytes): Chunk content encoded with `codec`
+            size (int): Raw chunk size, defaults to the size of `chunk`
+            codec (str): Codec tag of the content
+
+        Returns:
+            True when the chunk has been stored, False when the same content already exists
+        """
+        size = len(chunk) if size is None else size
+        started = stats.start()
+        if self.storage.packed:
+            stored = self._insert_packed_chunk(chunk_hash, chunk, size, codec)
+        else:
+            self._cursor.execute(
+                "INSERT OR IGNORE INTO chunks (hash, size, chunk, codec) "
+                "VALUES (?, ?, ?, ?)",
+                (chunk_hash, size, chunk, codec),
+            )
+            stored = self._cursor.rowcount == 1
+        stats.record(stats.INSERT, started, size=len(chunk) if stored else 0, rows=1)
+        self._row_written(1, len(chunk) if stored else 0)
+        return stored
+
+    def _insert_packed_chunk(self, chunk_hash: str, chunk, size: int, codec: str):
+        # the pack tail is read under the write lock, a concurrent writer can not
+        # append at the same offset
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+        self._cursor.execute("SELECT 1 FROM chunks WHERE hash = ?", (chunk_hash,))
+        if self._cursor.fetchone() is not None:
+            return False
+        self._cursor.execute("SELECT id, size FROM packs ORDER BY id DESC LIMIT 1")
+        pack = self._cursor.fetchone()
+        if pack is None or (pack[1] and pack[1] + len(chunk) > self.storage.pack_size):
+            self._cursor.execute("INSERT INTO packs (size) VALUES (0)")
+            pack = (self._cursor.lastrowid, 0)
+        if self._pack_writer is None:
+            self._pack_writer = PackWriter(self.packs_dir)
+        offset = self._pack_writer.append(pack[0], pack[1], chunk)
+        self._cursor.execute(
+            "UPDATE packs SET size = ? WHERE id = ?", (offset + len(chunk), pack[0])
+        )
+        self._cursor.execute(
+            "INSERT INTO chunks (hash, size, codec, pack_id, pack_offset, pack_length) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (chunk_hash, size, codec, pack[0], offset, len(chunk)),
+        )
+        return True
+
+    def insert_rows(self, table, columns, rows) -> None:
+        """Insert many rows in to specific table with a single statement
+
+        Args:
+            table (str): DB table name
+            columns (tuple): Column names
+            rows (list): Tuples of values, positional to `columns`
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        stm_values = ("?," * len(columns))[:-1]
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES({stm_values})"
+        started = stats.start()
+        self._cursor.executemany(query, rows)
+        stats.record(stats.INSERT, started, rows=len(rows))
+        self._row_written(len(rows))
+
+    def get_metadata(self, key: str, default=None):
+        """Database setting stored under `key`, `default` when it is not set"""
+        self._cursor.execute("SELECT value FROM metadata WHERE key = ?", (key,))
+        row = self._cursor.fetchone()
+        return default if row is None else row[0]
+
+    def set_metadata(self, key: str, value: str) -> None:
+        """Stores a database setting"""
+        started = stats.start()
+        self._cursor.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value)
+        )
+        stats.record(stats.INSERT, started, rows=1)
+        self._row_written()
+
     def query(self, query: str, params: tuple = ()):
         """
         Args:
@@ -65,7 +377,8 @@ class SQLiteDBManager:
             params (tuple): Must contain query statement parameters
 
         Yeilds:
-            Result row from the database based on the query. Fields are positional
+            Result row from the database based on the query. Fields are positional.
+            Rows are fetched lazily, one at a time.
 
         Raises:
             ValueError when
@@ -78,21 +391,212 @@ class SQLiteDBManager:
                 raise ValueError("Unsupported query operation")
         if "select" not in testing_query:
             raise ValueError("Query does not contain select statement")
+        yield from stats.timed_iter(stats.QUERY, self._iter_rows(query, params))
+
+    def _iter_rows(self, query: str, params: tuple):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(query, params)
+            yield from cursor
+        finally:
+            cursor.close()
+
+    def iter_blob(
+        self, table: str, column: str, rowid: int, piece_size=BLOB_PIECE_SIZE
+    ):
+        """Yields the content of a single BLOB value in pieces
+
+        Uses SQLite incremental BLOB I/O when available, so at most `piece_size`
+        bytes of the value are held in memory. Otherwise the value is read at once.
 
-        self._cursor.execute(query, params)
+        Args:
+            table (str): DB table name
+            column (str): BLOB column name
+            rowid (int): Row id
+            piece_size (int): Maximum size of yielded pieces
+        """
+        if not self._blob_io:
+            self._cursor.execute(
+                f"SELECT {column} FROM {table} WHERE rowid = ?", (rowid,)
+            )
+            row = self._cursor.fetchone()
+            if row is not None and row[0]:
+                yield row[0]
+            return
+        with self._conn.blobopen(table, column, rowid, readonly=True) as blob:
+            piece = blob.read(piece_size)
+            while piece:
+                yield piece
+                piece = blob.read(piece_size)
+
+    def iter_chunk(  # pylint: disable=too-many-arguments
+        self,
+        rowid: int,
+        pack_id: int = None,
+        pack_offset: int = None,
+        pack_length: int = None,
+        piece_size=BLOB_PIECE_SIZE,
+    ):
+        """Yields the stored content of a chunk in pieces
 
-        for item in self._cursor.fetchall():
-            yield item
+        Chunks with a pack location are read from the memory mapped pack file,
+        others from the `chunks.chunk` BLOB.
+
+        Args:
+            rowid (int): Chunk row id
+            pack_id (int): Pack of the chunk, None for chunks stored in the database
+            pack_offset (int): Offset of the content in the pack
+            pack_length (int): Stored size of the content
+            piece_size (int): Maximum size of yielded pieces
+        """
+        if pack_id is None:
+            pieces = self.iter_blob("chunks", "chunk", rowid, piece_size)
+        else:
+            if self._pack_reader is None:
+                self._pack_reader = PackReader(self.packs_dir)
+            pieces = self._pack_reader.iter_range(
+                pack_id, pack_offset, pack_length, piece_size
+            )
+        yield from stats.timed_iter(stats.READ, pieces, len)
 
     def delete_file_record(self, record_id: int):
         """Deletes file records from the database by id
 
+        Chunk references are released by the `file_chunks` triggers and chunks
+        which are not referenced by any file anymore are removed.
+
         Args:
             record_id (int): File id to be deleted
         """
         record_id = int(record_id)
 
+        started = stats.start()
         self._cursor.execute("DELETE FROM files WHERE id = ?", (record_id,))
-        self._conn.commit()
+        stats.record(stats.DELETE, started, rows=self._cursor.rowcount)
+        self.commit()
 
         return True
+
+    def delete_files(self, where: str = "1", params: tuple = ()) -> int:
+        """Deletes all file records matching a filter with a single statement
+
+        Chunk references are released as in `delete_file_record`. The records
+        are deleted in one transaction, committed unless in bulk mode.
+
+        Args:
+            where (str): Condition over the `files` columns aliased as `f`
+            params (tuple): Parameters of `where`
+
+        Returns:
+            int: Number of deleted file records
+        """
+        started = stats.start()
+        self._cursor.execute(
+            "DELETE FROM files WHERE id IN "
+            f"(SELECT f.id FROM files AS f WHERE {where})",
+            params,
+        )
+        deleted = self._cursor.rowcount
+        stats.record(stats.DELETE, started, rows=deleted)
+        self._row_written(deleted)
+        return deleted
+
+    def discard_chunks(self, hashes) -> int:
+        """Deletes chunks of a file which failed to be stored
+
+        Chunks are inserted before the file row referencing them, only those
+        which no file references are deleted.
+
+        Args:
+            hashes (iterable): Content hashes of the chunks
+
+        Returns:
+            int: Number of deleted chunks
+        """
+        hashes = list(hashes)
+        if not hashes:
+            return 0
+        started = stats.start()
+        self._cursor.execute(
+            f"DELETE FROM chunks WHERE hash IN ({', '.join('?' * len(hashes))}) "
+            "AND ref_count <= 0",
+            hashes,
+        )
+        deleted = self._cursor.rowcount
+        stats.record(stats.DELETE, started, rows=deleted)
+        self._row_written(deleted)
+        return deleted
+
+    def remove_empty_packs(self) -> int:
+        """Deletes pack files which do not hold any chunk anymore
+
+        Packs still holding chunks are kept whole, the space of their deleted
+        chunks is not reclaimed.
+
+        Returns:
+            int: Bytes released
+        """
+        self._cursor.execute(
+            "SELECT id, size FROM packs WHERE id NOT IN "
+            "(SELECT pack_id FROM chunks WHERE pack_id IS NOT NULL)"
+        )
+        empty = self._cursor.fetchall()
+        if not empty:
+            return 0
+        self._cursor.executemany(
+            "DELETE FROM packs WHERE id = ?", ((pack_id,) for pack_id, _ in empty)
+        )
+        self.commit()
+        if self._pack_writer is not None:
+            self._pack_writer.close()
+        released = 0
+        for pack_id, size in empty:
+            try:
+                os.remove(pack_path(self.packs_dir, pack_id))
+                released += size
+            except FileNotFoundError:
+                pass
+        return released
+
+    def reclaim_space(self, max_pages: int = None) -> int:
+        """Returns free database pages to the filesystem
+
+        Runs a step of `PRAGMA incremental_vacuum`, at most `max_pages` pages
+        are released per call, so a large database shrinks over several calls
+        without the copy of the whole database a full `VACUUM` makes. Databases
+        created before incremental vacuum was enabled need a single call of
+        `enable_incremental_vacuum` first.
+
+        Args:
+            max_pages (int): Maximum number of pages released, all when None
+
+        Returns:
+            int: Bytes released
+        """
+        self.commit()
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            _logger.warning(
+                "Database %s does not use incremental vacuum", self._db_path
+            )
+            return 0
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # a single `execute` step releases only one page, scripts run to the end
+        self._conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages or 0)})")
+        released = (
+            free_pages - self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        )
+        return released * page_size
+
+    def enable_incremental_vacuum(self) -> None:
+        """Switches the database to incremental vacuum
+
+        The database is rebuilt once by a full `VACUUM`, which needs free disk
+        space of its size.
+        """
+        self.commit()
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        _logger.info("Rebuilding %s with incremental vacuum", self._db_path)
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._conn.execute("VACUUM")
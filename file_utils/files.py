@@ -1,29 +1,98 @@
 """
 files management utils
 """
+import functools
 import logging
 import os
+import queue
+import threading
+import weakref
+from contextlib import closing
 from datetime import datetime
 
-from .db_managers import SQLiteDBManager
+from . import stats
+from .chunkers import (
+    CHUNK_SIZE,
+    BufferPool,
+    FixedChunker,
+    chunker_config,
+    chunker_from_config,
+)
+from .compression import decompress, iter_decompress
+from .db_managers import BATCH_BYTES, BATCH_ROWS, SQLiteDBManager
+from .pipeline import (
+    FILE_CHUNK,
+    FILE_END,
+    FILE_ERROR,
+    FILE_START,
+    QUEUE_DEPTH,
+    iter_file_events,
+)
+from .queries import query_files, select_files, select_versions
+from .storage import BlobStorage, storage_config, storage_from_config
+from .walker import Walker
 
-_CHUNK_SIZE = 10485760
+_CHUNK_SIZE = CHUNK_SIZE
+
+RESTORE_WORKERS = 4
+INLINE_SIZE = 4096
+INLINE_BATCH = 1000
+RECLAIM_PAGES = 16384
 
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
-)
 _logger = logging.getLogger(__file__)
 
 
-def read_file_chunks(file_path: str):
-    """Reads a file by chunks of `_CHUNK_SIZE`
+class IngestStats:  # pylint: disable=too-many-instance-attributes
+    """Counters collected while storing files
+
+    `files` counts added and updated files, `unchanged` the files an incremental
+    run skipped or read again only to find the same content. `bytes_read` is the
+    logical size of the ingested files, `bytes_stored` the raw size of chunks
+    which were not already present in the database and of inline files,
+    `bytes_written` their size after compression.
+    """
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.chunks = 0
+        self.new_chunks = 0
+        self.bytes_read = 0
+        self.bytes_stored = 0
+        self.bytes_written = 0
+
+    def add(self, other) -> None:
+        """Adds the counters of another run"""
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Logical bytes per stored byte, 1.0 when nothing has been read"""
+        if not self.bytes_read:
+            return 1.0
+        if not self.bytes_stored:
+            return float("inf")
+        return self.bytes_read / self.bytes_stored
+
+    @property
+    def compression_ratio(self) -> float:
+        """Raw bytes of new chunks per written byte"""
+        if not self.bytes_written:
+            return 1.0
+        return self.bytes_stored / self.bytes_written
+
+
+def read_file_chunks(file_path: str, chunk_size: int = None):
+    """Reads a file by chunks of `chunk_size`, `_CHUNK_SIZE` by default
 
     Yields a part of a file if the file size is larger than the size of a single chunk
     """
     chunk = True
     with open(file_path, "rb") as fp_reader:
         while chunk:
-            chunk = fp_reader.read(_CHUNK_SIZE)
+            chunk = fp_reader.read(chunk_size or _CHUNK_SIZE)
             yield chunk
 
 
@@ -34,85 +103,739 @@ def get_filepath(path: str):
         if `path` is a single file will be yeilded `path`
         if `path` is a directory will be yielded recursively only file paths stored in to `path`
     """
-    if os.path.isfile(path):
-        yield os.path.dirname(path), os.path.basename(path)
-    if os.path.isdir(path):
-        for root, _, files in os.walk(path, topdown=True):
-            for fname in files:
-                # handle broken links
-                if not os.path.isfile(os.path.join(root, fname)):
-                    continue
-                yield root, fname
+    for entry in Walker().walk([path]):
+        yield entry.dir_path, entry.file_name
 
 
-def store_files(db_name, local_paths: list):
-    with SQLiteDBManager(db_name) as db_conn:
-        for path in local_paths:
-            for dir_path, file_name in get_filepath(path):
-                _logger.info("Adding %s %s", dir_path, file_name)
-                file_id = db_conn.insert_row(
-                    "files",
-                    {
-                        "file_name": file_name,
-                        "original_file_location": dir_path,
-                        "created_on": datetime.now(),
-                    },
-                )
-                #if not file_id:
-                #    continue
-                for index, chunk in enumerate(
-                    read_file_chunks(os.path.join(dir_path, file_name)), start=1
-                ):
-                    if chunk:
-                        db_conn.insert_row(
-                            "file_chunks",
-                            {"chunk_id": index, "chunk": chunk, "file_id": file_id},
-                        )
+# writers storing through each connection, e.g. interleaved asyncio backups
+_WRITERS = weakref.WeakKeyDictionary()
+
+
+class _IngestWriter:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Database side of `store_files`, handles pipeline events on the writer thread"""
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        db_conn,
+        snapshot_id: int,
+        incremental: bool = False,
+        ingest_stats=None,
+        inline_size: int = 0,
+    ) -> None:
+        self._db_conn = db_conn
+        self._snapshot_id = snapshot_id
+        self._incremental = incremental
+        self._inline_size = inline_size
+        self._pending = {}
+        self._existing = {}
+        # chunks of files which may still be stored inline
+        self._contents = {}
+        # inline file rows waiting for a batched insert, by path
+        self._inline_rows = {}
+        self.stats = ingest_stats or IngestStats()
+        _WRITERS.setdefault(db_conn, weakref.WeakSet()).add(self)
+
+    def handle(self, event, task, chunk) -> None:
+        if event == FILE_START:
+            self._start(task)
+        elif event == FILE_CHUNK:
+            self._chunk(task, chunk)
+        elif event == FILE_END:
+            self._end(task)
+        elif event == FILE_ERROR:
+            self._discard(self._pending.pop(task, ()))
+            self._existing.pop(task, None)
+            self._contents.pop(task, None)
+            _logger.error("Failed to read %s: %s", task.path, task.error)
+
+    def _start(self, task) -> None:
+        if (task.dir_path, task.file_name) in self._inline_rows:
+            task.skip = True
+            _logger.error("File already exists in database %s", task.path)
+            return
+        query = (
+            "select id, size, mtime_ns, inode, checksum from files "
+            "where original_file_location = ? and file_name = ? "
+            "and replaced_in is null"
+        )
+        existing = next(
+            self._db_conn.query(query, (task.dir_path, task.file_name)), None
+        )
+        if existing is not None:
+            if not self._incremental:
+                task.skip = True
+                _logger.error("File already exists in database %s", task.path)
+                return
+            signature = (task.stat.st_size, task.stat.st_mtime_ns, task.stat.st_ino)
+            if tuple(existing[1:4]) == signature:
+                task.skip = True
+                self.stats.unchanged += 1
+                return
+            self._existing[task] = existing
+            _logger.info("Updating %s %s", task.dir_path, task.file_name)
+        else:
+            _logger.info("Adding %s %s", task.dir_path, task.file_name)
+        self._pending[task] = []
+        if self._inline_size and task.stat.st_size <= self._inline_size:
+            self._contents[task] = []
+
+    def _chunk(self, task, chunk) -> None:
+        self.stats.chunks += 1
+        self.stats.bytes_read += chunk.size
+        contents = self._contents.get(task)
+        if contents is None:
+            self._store_chunk(task, chunk)
+            return
+        # the chunk may be a view over a read buffer which is reused
+        contents.append(chunk._replace(data=bytes(chunk.data)))
+        if sum(item.size for item in contents) > self._inline_size:
+            # the file grew since it was listed, it is stored by chunks
+            for item in self._contents.pop(task):
+                self._store_chunk(task, item)
+
+    def _store_chunk(self, task, chunk) -> None:
+        if self._db_conn.insert_chunk(
+            chunk.digest, chunk.data, size=chunk.size, codec=chunk.codec
+        ):
+            self.stats.new_chunks += 1
+            self.stats.bytes_stored += chunk.size
+            self.stats.bytes_written += len(chunk.data)
+        self._pending[task].append((chunk.index, chunk.digest))
+
+    def _end(self, task) -> None:
+        file_chunks = self._pending.pop(task)
+        contents = self._contents.pop(task, None)
+        existing = self._existing.pop(task, None)
+        record = {
+            "created_on": datetime.now(),
+            "size": task.size,
+            "mtime_ns": task.stat.st_mtime_ns,
+            "inode": task.stat.st_ino,
+            "checksum": task.checksum,
+        }
+        if existing is not None and existing[4] == task.checksum:
+            # same content, the version only gets the new signature and the
+            # chunks inserted by reading it again are not referenced
+            self._discard(file_chunks)
+            self._db_conn.update_row("files", existing[0], record)
+            self.stats.unchanged += 1
+            self._db_conn.commit_if_due()
+            return
+        if existing is not None:
+            self._db_conn.update_row(
+                "files", existing[0], {"replaced_in": self._snapshot_id}
+            )
+        record.update(
+            {
+                "file_name": task.file_name,
+                "original_file_location": task.dir_path,
+                "chunk_count": len(file_chunks),
+                "snapshot_id": self._snapshot_id,
+            }
+        )
+        if contents is not None:
+            self._end_inline(task, record, contents, existing)
+            return
+        file_id = self._db_conn.insert_row("files", record)
+        if not file_id:
+            self._discard(file_chunks)
+            self._not_stored(existing)
+            return
+        self._db_conn.insert_rows(
+            "file_chunks",
+            ("file_id", "chunk_id", "chunk_hash"),
+            ((file_id, index, digest) for index, digest in file_chunks),
+        )
+        self._stored(existing)
+
+    def abandon(self) -> None:
+        """Deletes the new chunks of files left unfinished by a stopped run"""
+        file_chunks = [item for chunks in self._pending.values() for item in chunks]
+        self._pending.clear()
+        self._existing.clear()
+        self._contents.clear()
+        self._discard(file_chunks)
+
+    def pending_digests(self) -> set:
+        """Hashes of the chunks of files being stored"""
+        return {digest for chunks in self._pending.values() for _, digest in chunks}
+
+    def _discard(self, file_chunks) -> None:
+        """Deletes the new chunks of a file which is not stored
+
+        Chunks of files still being stored, by any writer of the connection,
+        are not referenced yet and are kept.
+        """
+        in_use = set().union(
+            *(writer.pending_digests() for writer in _WRITERS.get(self._db_conn, ()))
+        )
+        self._db_conn.discard_chunks(
+            {digest for _, digest in file_chunks if digest not in in_use}
+        )
+
+    def _end_inline(self, task, record, contents, existing) -> None:
+        record["content"] = b"".join(
+            decompress(chunk.codec, chunk.data) for chunk in contents
+        )
+        if existing is not None:
+            if not self._db_conn.insert_row("files", record):
+                self._not_stored(existing)
+                return
+            self.stats.bytes_stored += task.size
+            self.stats.bytes_written += task.size
+            self._stored(existing)
+            return
+        self.stats.bytes_stored += task.size
+        self.stats.bytes_written += task.size
+        self._inline_rows[task.dir_path, task.file_name] = record
+        self.stats.files += 1
+        if len(self._inline_rows) >= INLINE_BATCH:
+            self.flush()
+
+    def _not_stored(self, existing) -> None:
+        if existing is not None:
+            # the replaced version stays the current one
+            self._db_conn.update_row("files", existing[0], {"replaced_in": None})
+
+    def _stored(self, existing) -> None:
+        if existing is not None:
+            self.stats.updated += 1
+        self.stats.files += 1
+        self._db_conn.commit_if_due()
+
+    def flush(self) -> None:
+        """Inserts the inline file rows waiting for a batch"""
+        if not self._inline_rows:
+            return
+        rows = list(self._inline_rows.values())
+        self._inline_rows = {}
+        self._db_conn.insert_rows(
+            "files", tuple(rows[0]), (tuple(row.values()) for row in rows)
+        )
+        self._db_conn.commit_if_due()
+
+
+def store_files(  # pylint: disable=R0913,R0914
+    db_name,
+    local_paths: list,
+    *,
+    incremental: bool = False,
+    chunker=None,
+    compression=None,
+    storage=None,
+    bulk: bool = False,
+    batch_rows: int = BATCH_ROWS,
+    batch_bytes: int = BATCH_BYTES,
+    workers: int = 0,
+    queue_depth: int = QUEUE_DEPTH,
+    file_filter=None,
+    walker=None,
+    opener=None,
+    inline_size: int = 0,
+):
+    """Stores files in to the database
+
+    Chunks are addressed by their content hash, identical chunks are stored once
+    no matter how many files or paths reference them.
+
+    Every run is recorded as a snapshot. Without `incremental` files already
+    present in the database are skipped. In incremental mode a stored file is
+    skipped, without being opened, only when its size, mtime and inode are
+    unchanged, otherwise it is read again and stored as a new version while the
+    previous version stays in the earlier snapshots. Files whose content
+    checksum did not change only get the new signature. Unchanged files keep a
+    single record shared by all snapshots.
+
+    The chunking engine is a per database setting recorded in the `metadata`
+    table by the first run, fixed size chunks unless `chunker` is given. A
+    `chunker` passed to later runs is used for that run only.
+
+    With `compression` chunks are compressed by the reader threads, chunks which
+    do not shrink enough are stored raw.
+
+    The storage backend is recorded like the chunking engine, chunk content is
+    kept in the database unless `storage` is given. Stored chunks stay where
+    they were written when a later run uses another backend.
+
+    Files are read and hashed by `workers` reader threads while this thread is the
+    only database writer. A file row and its chunk references are written only
+    once the whole file has been read.
+
+    In bulk mode rows are committed in large transactions, only between files,
+    so an interrupted run loses at most the last batch and never leaves a
+    partially stored file behind.
+
+    Files of at most `inline_size` bytes are kept raw on their `files` row
+    instead of in chunks, new ones are inserted `INLINE_BATCH` rows at a time.
+    This saves the chunk rows and per file commits of trees of many small
+    files, inline content is not deduplicated.
+
+    Args:
+        db_name (str): Path to sqlite database, created when it does not exist
+        local_paths (list): Files or directories to store
+        incremental (bool): Re-ingest changed files, skip unchanged ones
+        chunker (FixedChunker|FastCDCChunker): Chunking engine
+        compression (Compressor): Chunk compression, chunks are stored raw when None
+        storage (BlobStorage|PackStorage): Storage backend of new chunks
+        bulk (bool): Group rows in to transactions instead of commit per row
+        batch_rows (int): Rows per transaction in bulk mode
+        batch_bytes (int): New chunk bytes per transaction in bulk mode
+        workers (int): Reader threads, 0 reads files on the caller's thread
+        queue_depth (int): Chunks buffered between readers and the writer
+        file_filter (callable): Called with (directory, file name), files it
+            rejects are not stored nor opened
+        walker (Walker): Tree walking rules, every file below `local_paths`
+            is stored when None. Any object whose `walk(local_paths)` yields
+            (directory, file name, stat) tuples is a file source
+        opener (callable): Returns a binary file object for a file path, files
+            are opened from the file system when None
+        inline_size (int): Largest file stored inline, 0 stores every file
+            by chunks
+
+    Returns:
+        IngestStats: counters of the run
+    """
+    ingest_stats = IngestStats()
+    with SQLiteDBManager(
+        db_name, bulk=bulk, batch_rows=batch_rows, batch_bytes=batch_bytes
+    ) as db_conn:
+        for _ in iter_ingest(
+            db_conn,
+            local_paths,
+            ingest_stats,
+            incremental=incremental,
+            chunker=chunker,
+            compression=compression,
+            storage=storage,
+            workers=workers,
+            queue_depth=queue_depth,
+            file_filter=file_filter,
+            walker=walker,
+            opener=opener,
+            inline_size=inline_size,
+        ):
+            pass
+    return ingest_stats
+
+
+def iter_ingest(  # pylint: disable=R0913,R0914
+    db_conn,
+    local_paths: list,
+    ingest_stats: IngestStats,
+    *,
+    incremental: bool = False,
+    chunker=None,
+    compression=None,
+    storage=None,
+    workers: int = 0,
+    queue_depth: int = QUEUE_DEPTH,
+    file_filter=None,
+    walker=None,
+    opener=None,
+    inline_size: int = 0,
+):
+    """Stores files through an open database one pipeline event at a time
+
+    The generator yields after every handled event, so the caller can run
+    other work on the connection's thread between them. Closing it early stops
+    the reader threads, files already handled stay stored and the chunks of
+    files left unfinished are deleted. Options are those of `store_files`.
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        local_paths (list): Files or directories to store
+        ingest_stats (IngestStats): Counters updated by the run
+    """
+    file_paths = (walker or Walker()).walk(local_paths)
+    if file_filter is not None:
+        file_paths = (item for item in file_paths if file_filter(*item[:2]))
+    chunker = _resolve_setting(
+        db_conn,
+        "chunker",
+        chunker,
+        default=FixedChunker,
+        to_config=chunker_config,
+        from_config=chunker_from_config,
+    )
+    db_conn.storage = _resolve_setting(
+        db_conn,
+        "storage",
+        storage,
+        default=BlobStorage,
+        to_config=storage_config,
+        from_config=storage_from_config,
+    )
+    snapshot_id = db_conn.insert_row("snapshots", {"created_on": datetime.now()})
+    writer = _IngestWriter(
+        db_conn,
+        snapshot_id,
+        incremental=incremental,
+        ingest_stats=ingest_stats,
+        inline_size=inline_size,
+    )
+    buffers = BufferPool()
+    read_chunks = functools.partial(chunker.read_file, buffers=buffers)
+    if opener is not None:
+        read_chunks = functools.partial(_split_opened, chunker, opener, buffers=buffers)
+
+    events = iter_file_events(
+        file_paths,
+        read_chunks,
+        workers=workers,
+        queue_depth=queue_depth,
+        encode=compression.encode if compression else None,
+        release=buffers.release,
+    )
+    try:
+        for event in events:
+            writer.handle(*event)
+            yield
+    finally:
+        if hasattr(events, "close"):
+            events.close()
+        writer.abandon()
+        writer.flush()
+
+
+def _split_opened(chunker, opener, file_path: str, buffers=None):
+    """Yields the chunks of a file opened by `opener`"""
+    with opener(file_path) as fp_reader:
+        yield from chunker.split(fp_reader, buffers)
+
+
+def _resolve_setting(  # pylint: disable=R0913
+    db_conn, key, value, *, default, to_config, from_config
+):
+    """Database setting recorded by the first run, `value` overrides it for a run"""
+    stored = db_conn.get_metadata(key)
+    if stored is None:
+        value = value or default()
+        db_conn.set_metadata(key, to_config(value))
+        return value
+    if value is None:
+        return from_config(stored)
+    if to_config(value) != stored:
+        _logger.warning(
+            "Database %s is %s, using %s for this run", key, stored, to_config(value)
+        )
+    return value
+
+
+def iter_file_content(db_conn, file_id: int):
+    """Yields the content of a stored file in pieces
+
+    Chunk rows are fetched lazily and chunk content is read from pack files or
+    through incremental BLOB I/O where available, so memory use does not depend
+    on the file size. Content of files stored inline is yielded whole.
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        file_id (int): File record id
+    """
+    content = next(
+        db_conn.query("select content from files where id = ?", (file_id,)), (None,)
+    )[0]
+    if content is not None:
+        if content:
+            yield content
+        return
+    chunks_query = (
+        "select c.codec, c.id, c.pack_id, c.pack_offset, c.pack_length "
+        "from file_chunks as fc join chunks as c on c.hash = fc.chunk_hash "
+        "where fc.file_id = ? order by fc.chunk_id ASC"
+    )
+    for codec, *location in db_conn.query(chunks_query, (file_id,)):
+        # closed here, content which fails to decode must not keep a BLOB open
+        with closing(db_conn.iter_chunk(*location)) as pieces:
+            yield from iter_decompress(codec, pieces)
+
+
+def _write_content(db_conn, file_id: int, fp_writer) -> None:
+    for piece in iter_file_content(db_conn, file_id):
+        started = stats.start()
+        fp_writer.write(piece)
+        stats.record(stats.WRITE, started, size=len(piece))
+
+
+def restore_destination(db_conn, file_id: int, dest_location: str) -> str:
+    """Path a stored file is restored to in `dest_location`
+
+    Raises:
+        RuntimeError: When the file id does not exist
+    """
+    row = next(
+        db_conn.query("select file_name from files where id = ?", (int(file_id),)),
+        None,
+    )
+    if row is None:
+        raise RuntimeError("File id does not exists")
+    return os.path.join(dest_location, row[0])
+
+
+def restore_file(db_conn, file_id: int, dest_location: str) -> str:
+    """Restores a file of an open database to `dest_location`
+
+    Returns:
+        str: Path of the restored file
+
+    Raises:
+        RuntimeError: When the file id does not exist
+    """
+    destination = restore_destination(db_conn, file_id, dest_location)
+    with open(destination, "wb") as fp_writer:
+        _write_content(db_conn, file_id, fp_writer)
+    _logger.info("File has been restored %s", destination)
+    return destination
 
 
 def restore_file_by_id(db_name, file_id, dest_location):
     if not os.path.isfile(db_name):
         raise FileNotFoundError(f"DB file {db_name} does not exists")
-    find_query = "select id, file_name from files where id = ? limit 1"
-    chunks_query = (
-        "select chunk from file_chunks where file_id = ? order by chunk_id ASC"
-    )
     with SQLiteDBManager(db_name) as db_conn:
+        restore_file(db_conn, file_id, dest_location)
+
+
+def _restore_path(dest_location: str, location: str, file_name: str) -> str:
+    """Destination of a file restored with its original directory structure
+
+    Raises:
+        ValueError: When the stored path would escape `dest_location`
+    """
+    dest_location = os.path.abspath(dest_location)
+    relative = os.path.normpath(os.path.join(location, file_name)).lstrip(os.sep)
+    destination = os.path.normpath(os.path.join(dest_location, relative))
+    if os.path.commonpath((dest_location, destination)) != dest_location:
+        raise ValueError(f"Path {location}/{file_name} escapes {dest_location}")
+    return destination
+
+
+def _restore_worker(db_name, tasks, restored, failed):
+    """Restores queued files, a file which fails is recorded and not left behind"""
+    with SQLiteDBManager(db_name) as db_conn:
+        for file_id, destination, mtime_ns in iter(tasks.get, None):
+            opened = False
+            try:
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                with open(destination, "wb") as fp_writer:
+                    opened = True
+                    _write_content(db_conn, file_id, fp_writer)
+                if mtime_ns is not None:
+                    os.utime(destination, ns=(mtime_ns, mtime_ns))
+                restored.append(destination)
+            except Exception as err:  # pylint: disable=broad-except
+                _logger.error("Failed to restore %s: %s", destination, err)
+                failed.append(file_id)
+                if opened and os.path.isfile(destination):
+                    os.remove(destination)
+
+
+def restore_files(  # pylint: disable=R0913,R0914
+    db_name,
+    dest_location,
+    *,
+    file_ids=None,
+    pattern=None,
+    location=None,
+    snapshot_id=None,
+    at=None,
+    workers: int = RESTORE_WORKERS,
+):
+    """Restores many files recreating their original directory structure
+
+    Files are selected by ids, by a file name pattern as in `find_files` and/or
+    by an original location prefix; all given criteria must match. Each file is
+    restored to `dest_location` joined with its original location. Files are
+    restored by `workers` threads with their own database connection and are
+    handed out in the order of their first chunk rowid, so database reads stay
+    close to sequential.
+
+    Args:
+        db_name (str): Path to sqlite database
+        dest_location (str): Directory where files are restored
+        file_ids (list): File record ids
+        pattern (str): File name search, `*` is a wildcard otherwise a prefix
+        location (str): Original location prefix, sub directories included
+        snapshot_id (int): Restore the versions of this snapshot, current
+            versions are restored by default unless `file_ids` are given
+        at (datetime|str): Restore the versions of the last snapshot taken at
+            or before this time
+        workers (int): Restoring threads
+
+    Returns:
+        list: Paths of the restored files
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+        RuntimeError: When some of the selected files could not be restored
+    """
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    with SQLiteDBManager(db_name) as db_conn:
+        where, params = select_versions(
+            db_conn, file_ids, pattern, location, snapshot_id=snapshot_id, at=at
+        )
+        select_query = (
+            "select f.id, f.original_file_location, f.file_name, f.mtime_ns, "
+            "min(c.id) as first_chunk from files as f "
+            "left join file_chunks as fc on fc.file_id = f.id "
+            "left join chunks as c on c.hash = fc.chunk_hash "
+            f"where {where} group by f.id order by first_chunk ASC"
+        )
+        selected = list(db_conn.query(select_query, params))
+
+    tasks = queue.Queue()
+    failed = []
+    for file_id, file_location, file_name, mtime_ns, _ in selected:
         try:
-            ret = list(db_conn.query(find_query, (file_id,)))[0]
-            file_name = ret[1]
-        except IndexError as err:
-            raise RuntimeError("File id does not exists") from err
-        destination = f"{dest_location}/{file_name}"
-        with open(destination, "wb") as fp_writer:
-            for chunk in db_conn.query(chunks_query, (file_id,)):
-                fp_writer.write(chunk[0])
-        _logger.info("File has been restored %s", destination)
-
-
-def list_files(db_name, callback):  # pylint: disable=R1710
+            destination = _restore_path(dest_location, file_location, file_name)
+        except ValueError as err:
+            _logger.error("Skipping file %s: %s", file_id, err)
+            failed.append(file_id)
+            continue
+        tasks.put((file_id, destination, mtime_ns))
+
+    restored = []
+    threads = [
+        threading.Thread(
+            target=_restore_worker, args=(db_name, tasks, restored, failed)
+        )
+        for _ in range(max(workers, 1))
+    ]
+    for thread in threads:
+        tasks.put(None)
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    _logger.info("%s file(s) have been restored to %s", len(restored), dest_location)
+    # files a worker did not get to, e.g. when its connection failed, are missing
+    missing = len(selected) - len(restored)
+    if missing:
+        raise RuntimeError(f"{missing} file(s) could not be restored")
+    return restored
+
+
+def list_snapshots(db_name):
+    """(id, created on) of all snapshots, oldest first
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+    """
     if not os.path.isfile(db_name):
         raise FileNotFoundError(f"DB file {db_name} does not exists")
     with SQLiteDBManager(db_name) as db_conn:
-        if hasattr(callback, "get_all"):
-            return getattr(callback, "get_all")(
-                db_conn.query("select * from v_files order by file_name ASC")
-            )
+        return list(
+            db_conn.query("select id, created_on from snapshots order by id ASC")
+        )
+
 
+def list_files(  # pylint: disable=R0913
+    db_name,
+    callback,
+    *,
+    limit=None,
+    offset=0,
+    after_id=None,
+    snapshot_id=None,
+    at=None,
+):
+    """Lists files ordered by name
 
-def find_files(db_name, file_name, callback):  # pylint: disable=R1710
+    Args:
+        db_name (str): Path to sqlite database
+        callback: Output handler, rows are fetched lazily
+        limit (int): Maximum number of rows, all when None
+        offset (int): Rows skipped from the beginning
+        after_id (int): List files after this record, keyset pagination
+        snapshot_id (int): List the versions of this snapshot instead of the
+            current ones
+        at (datetime|str): List the versions of the last snapshot taken at or
+            before this time
+    """
+    return find_files(
+        db_name,
+        None,
+        callback,
+        limit=limit,
+        offset=offset,
+        after_id=after_id,
+        snapshot_id=snapshot_id,
+        at=at,
+    )
+
+
+def find_files(  # pylint: disable=R0913,R1710
+    db_name,
+    file_name,
+    callback,
+    location=None,
+    *,
+    limit=None,
+    offset=0,
+    after_id=None,
+    snapshot_id=None,
+    at=None,
+):
+    """Searches files by name and/or original location
+
+    Patterns are served by the trigram index where SQLite supports it, so
+    infix and suffix searches such as `*.parquet` do not scan the catalog.
+    Matches are ordered by name and paginated as in `list_files`.
+
+    Args:
+        db_name (str): Path to sqlite database
+        file_name (str): File name, `*` is a wildcard otherwise a prefix, None
+            matches any name
+        callback: Output handler, rows are fetched lazily
+        location (str): Original location, `*` is a wildcard otherwise the
+            directory and its sub directories
+        limit (int): Maximum number of rows, all when None
+        offset (int): Rows skipped from the beginning
+        after_id (int): Matches after this record, keyset pagination
+        snapshot_id (int): Search the versions of this snapshot instead of the
+            current ones
+        at (datetime|str): Search the versions of the last snapshot taken at
+            or before this time
+    """
     if not os.path.isfile(db_name):
         raise FileNotFoundError(f"DB file {db_name} does not exists")
-    find_query = "select * from v_files where file_name LIKE ? "
-    params = (file_name.replace("*", "%") if "*" in file_name else f"{file_name}%",)
     with SQLiteDBManager(db_name) as db_conn:
         if hasattr(callback, "get_all"):
-            return getattr(callback, "get_all")(db_conn.query(find_query, params))
+            return getattr(callback, "get_all")(
+                query_files(
+                    db_conn,
+                    file_name,
+                    location,
+                    limit=limit,
+                    offset=offset,
+                    after_id=after_id,
+                    snapshot_id=snapshot_id,
+                    at=at,
+                )
+            )
+
+
+def delete_file(db_conn, file_id: int) -> None:
+    """Removes a file record of an open database as `delete_file_by_id` does
+
+    Raises:
+        RuntimeError: When record id does not exists
+    """
+    found = next(db_conn.query("select id from files where id = ?", (file_id,)), None)
+    if found is None:
+        err_msg = f"Record {file_id} does not exist"
+        _logger.error(err_msg)
+        raise RuntimeError(err_msg)
+    db_conn.delete_file_record(file_id)
+    _logger.info("File %s has been deleted", file_id)
 
 
 def delete_file_by_id(db_name, file_id: int):
     """Removes file record from sqlite database
 
+    Chunks shared with other files are kept, chunks referenced only by the
+    removed file are deleted.
+
     Args:
         db_name (str): Path to sqldatabse
         file_id (int): File record id
@@ -126,11 +849,114 @@ def delete_file_by_id(db_name, file_id: int):
         _logger.error(err_msg)
         raise FileNotFoundError(err_msg)
     with SQLiteDBManager(db_name) as db_conn:
-        try:
-            _ = next(db_conn.query("select id from files where id = ? ", (file_id,)))
-        except StopIteration as err:
-            err_msg = f"Record {file_id} does not exist"
-            _logger.error(err_msg)
-            raise RuntimeError(err_msg) from err
-        db_conn.delete_file_record(file_id)
-        _logger.info("File %s has been deleted", file_id)
+        delete_file(db_conn, file_id)
+
+
+def delete_matching(  # pylint: disable=R0913
+    db_conn,
+    *,
+    file_ids=None,
+    pattern=None,
+    location=None,
+    replaced_before=None,
+    created_before=None,
+) -> int:
+    """Removes the file records of an open database selected as in `delete_files`
+
+    Returns:
+        int: Number of deleted files
+
+    Raises:
+        ValueError: When no selection criteria is given
+    """
+    criteria = (file_ids, pattern, location, replaced_before, created_before)
+    if all(value is None for value in criteria):
+        raise ValueError("At least one selection criteria is required")
+    where, params = select_files(
+        db_conn,
+        file_ids,
+        pattern,
+        location,
+        replaced_before=replaced_before,
+        created_before=created_before,
+    )
+    deleted = db_conn.delete_files(where, params)
+    _logger.info("%s file(s) have been deleted", deleted)
+    return deleted
+
+
+def delete_files(  # pylint: disable=R0913
+    db_name,
+    *,
+    file_ids=None,
+    pattern=None,
+    location=None,
+    replaced_before=None,
+    created_before=None,
+):
+    """Removes many file records in a single transaction
+
+    Files are selected as in `restore_files` and/or, for retention, by age;
+    all given criteria must match. `replaced_before` never selects current
+    versions, `created_before` selects any version stored before the given
+    time, current ones included. Chunks are released as in
+    `delete_file_by_id`, the freed space is returned to the filesystem by
+    `reclaim_space`.
+
+    Args:
+        db_name (str): Path to sqlite database
+        file_ids (list): File record ids
+        pattern (str): File name search, `*` is a wildcard otherwise a prefix
+        location (str): Original location prefix, sub directories included
+        replaced_before (datetime): Versions replaced by a snapshot taken
+            before this time
+        created_before (datetime): Versions stored before this time
+
+    Returns:
+        int: Number of deleted files
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+        ValueError: When no selection criteria is given
+    """
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    with SQLiteDBManager(db_name) as db_conn:
+        return delete_matching(
+            db_conn,
+            file_ids=file_ids,
+            pattern=pattern,
+            location=location,
+            replaced_before=replaced_before,
+            created_before=created_before,
+        )
+
+
+def reclaim_space(db_name, *, max_pages=RECLAIM_PAGES, enable: bool = False):
+    """Returns space of deleted content to the filesystem
+
+    Pack files without chunks are deleted and a bounded step of incremental
+    vacuum releases free database pages, repeated calls shrink the database
+    gradually. Packs are not compacted: one still holding a live chunk keeps
+    the space of its deleted chunks.
+
+    Args:
+        db_name (str): Path to sqlite database
+        max_pages (int): Maximum number of database pages released, all when None
+        enable (bool): Switch a database created without incremental vacuum,
+            rebuilding it once with a full `VACUUM`
+
+    Returns:
+        int: Bytes released
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+    """
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    with SQLiteDBManager(db_name) as db_conn:
+        released = db_conn.remove_empty_packs()
+        if enable:
+            db_conn.enable_incremental_vacuum()
+        released += db_conn.reclaim_space(max_pages)
+    return released
@@ -1,39 +1,109 @@
+import csv
+import itertools
 import json
-
-from tabulate import tabulate
+import sys
 
 # pylint: disable=too-few-public-methods
 
+_HEADERS = [
+    "Id",
+    "original file path",
+    "file name",
+    "created on",
+    "file size (MB)",
+]
+
+PAGE_SIZE = 1000
+
+
+def _as_dict(row):
+    return {
+        "id": row[0],
+        "file_path": f"{row[1]}/{row[2]}",
+        "created": row[3],
+        "file_size_mb": row[4],
+    }
+
+
+def _tabulate(rows) -> str:
+    # imported on first use, other output modes start without it
+    from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
+    return tabulate(rows, headers=_HEADERS)
+
 
 class AsTable:
     @staticmethod
     def get_all(data):
-        return tabulate(
-            data,
-            headers=[
-                "Id",
-                "original file path",
-                "file name",
-                "created on",
-                "file size (MB)",
-            ],
-        )
+        return _tabulate(data)
 
 
 class AsJSON:
     @staticmethod
     def get_all(data):  # pylint: disable=R0903
-        return json.dumps(
-            [
-                {
-                    "id": row[0],
-                    "file_path": f"{row[1]}/{row[2]}",
-                    "created": row[3],
-                    "file_size_mb": row[4],
-                }
-                for row in data
-            ]
-        )
+        return json.dumps([_as_dict(row) for row in data])
+
+
+class _Streaming:
+    """Writes rows to `stream` as they are fetched, stdout by default
+
+    `get_all` consumes the rows lazily and returns an empty string, so memory
+    use does not depend on the number of rows.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self._stream = stream
+
+    @property
+    def stream(self):
+        return sys.stdout if self._stream is None else self._stream
+
+
+class AsNDJSON(_Streaming):
+    """One JSON object per line"""
+
+    def get_all(self, data):
+        for row in data:
+            self.stream.write(json.dumps(_as_dict(row)) + "\n")
+        return ""
+
+
+class AsJSONStream(_Streaming):
+    """The `AsJSON` array written one element at a time"""
+
+    def get_all(self, data):
+        separator = "["
+        for row in data:
+            self.stream.write(separator + json.dumps(_as_dict(row)))
+            separator = ", "
+        self.stream.write("[]" if separator == "[" else "]")
+        return ""
+
+
+class AsCSV(_Streaming):
+    def get_all(self, data):
+        writer = csv.writer(self.stream)
+        writer.writerow(_HEADERS)
+        writer.writerows(data)
+        return ""
+
+
+class AsPagedTable(_Streaming):
+    """Tables of at most `page_size` rows, each page is written once it is full"""
+
+    def __init__(self, stream=None, page_size: int = PAGE_SIZE) -> None:
+        super().__init__(stream)
+        self._page_size = page_size
+
+    def get_all(self, data):
+        data = iter(data)
+        page = list(itertools.islice(data, self._page_size))
+        while page:
+            self.stream.write(_tabulate(page) + "\n")
+            page = list(itertools.islice(data, self._page_size))
+            if page:
+                self.stream.write("\n")
+        return ""
 
 
 class Generic:
@@ -0,0 +1,241 @@
+"""
+Read and hash pipeline feeding a single database writer
+
+Files are read and their chunks hashed either on the caller's thread or by a pool
+of reader threads. The consumer, which owns the database connection, receives a
+stream of events and decides at `FILE_START` whether the file is read at all by
+setting `FileTask.skip`.
+
+Memory held by in-flight chunks is bounded by (queue_depth + workers) * chunk size.
+A chunk is handed to `release` once the consumer asks for the next event, so
+read buffers are reused instead of allocated per chunk.
+Threads are enough for parallel hashing as `hashlib` releases the GIL while
+hashing large buffers.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+
+from . import stats
+
+_logger = logging.getLogger(__file__)
+
+FILE_START = "start"
+FILE_CHUNK = "chunk"
+FILE_END = "end"
+FILE_ERROR = "error"
+
+QUEUE_DEPTH = 8
+
+_WORKER_DONE = "done"
+_POLL_INTERVAL = 0.1
+
+# `data` is the chunk as it is stored, encoded with `codec`, `size` is its raw size
+Chunk = namedtuple("Chunk", ["index", "digest", "size", "data", "codec"])
+
+
+def chunk_hash(chunk) -> str:
+    """Content address of a chunk"""
+    return hashlib.sha256(chunk).hexdigest()
+
+
+class FileTask:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """A file travelling through the pipeline
+
+    `stat` is available from `FILE_START` on, taken from the walker when it is
+    given and read by the pipeline otherwise. `skip` is set by the consumer while
+    handling `FILE_START`. `size` and `checksum` of the read content are set at
+    `FILE_END` and `error` when the file could not be read.
+    """
+
+    def __init__(self, dir_path: str, file_name: str, stat=None) -> None:
+        self.dir_path = dir_path
+        self.file_name = file_name
+        self.stat = stat
+        self.skip = False
+        self.size = 0
+        self.checksum = None
+        self.error = None
+        self._decided = threading.Event()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.dir_path, self.file_name)
+
+
+def _raw(chunk):
+    return "raw", chunk
+
+
+def _keep(_chunk) -> None:
+    pass
+
+
+def _read_task(task, read_chunks, encode, release):
+    """Yields the events of reading a single file"""
+    try:
+        if task.stat is None:
+            task.stat = os.stat(task.path)
+    except OSError as err:
+        task.error = err
+        yield FILE_ERROR, task, None
+        return
+    yield FILE_START, task, None
+    if task.skip:
+        return
+    content_hash = hashlib.sha256()
+    try:
+        chunks = stats.timed_iter(stats.READ, read_chunks(task.path), len)
+        for index, chunk in enumerate(chunks, start=1):
+            if chunk:
+                content_hash.update(chunk)
+                task.size += len(chunk)
+                codec, data = encode(chunk)
+                read = Chunk(index, chunk_hash(chunk), len(chunk), data, codec)
+                if data is not chunk:
+                    release(chunk)
+                yield FILE_CHUNK, task, read
+    except OSError as err:
+        task.error = err
+        yield FILE_ERROR, task, None
+        return
+    task.checksum = content_hash.hexdigest()
+    yield FILE_END, task, None
+
+
+def _iter_serial(file_paths, read_chunks, encode, release):
+    for item in file_paths:
+        for event in _read_task(FileTask(*item), read_chunks, encode, release):
+            yield event
+            if event[0] == FILE_CHUNK:
+                release(event[2].data)
+
+
+class _ReaderPool:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    def __init__(
+        self,
+        file_paths,
+        read_chunks,
+        *,
+        encode,
+        release,
+        workers: int,
+        queue_depth: int,
+    ):  # pylint: disable=too-many-arguments
+        self._file_paths = iter(file_paths)
+        self._paths_lock = threading.Lock()
+        self._read_chunks = read_chunks
+        self._encode = encode
+        self._release = release
+        self._events = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"reader-{index}", daemon=True)
+            for index in range(workers)
+        ]
+
+    def _next_task(self):
+        with self._paths_lock:
+            item = next(self._file_paths, None)
+        return None if item is None else FileTask(*item)
+
+    def _put(self, event) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._events.put(event, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _wait_decision(self, task) -> bool:
+        while not task._decided.wait(_POLL_INTERVAL):  # pylint: disable=W0212
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _run(self):
+        try:
+            task = self._next_task()
+            while task is not None and not self._stop.is_set():
+                for event in _read_task(
+                    task, self._read_chunks, self._encode, self._release
+                ):
+                    if not self._put(event):
+                        return
+                    if event[0] == FILE_START and not self._wait_decision(task):
+                        return
+                task = self._next_task()
+        except Exception as err:  # pylint: disable=broad-except
+            self._put((FILE_ERROR, None, err))
+        finally:
+            self._put((_WORKER_DONE, None, None))
+
+    def __iter__(self):
+        for thread in self._threads:
+            thread.start()
+        running = len(self._threads)
+        try:
+            while running:
+                event = self._events.get()
+                if event[0] == _WORKER_DONE:
+                    running -= 1
+                    continue
+                if event[1] is None:
+                    raise event[2]
+                yield event
+                if event[0] == FILE_START:
+                    event[1]._decided.set()  # pylint: disable=W0212
+                elif event[0] == FILE_CHUNK:
+                    self._release(event[2].data)
+        finally:
+            self._stop.set()
+            for thread in self._threads:
+                thread.join()
+
+
+def iter_file_events(
+    file_paths,
+    read_chunks,
+    *,
+    workers: int = 0,
+    queue_depth: int = QUEUE_DEPTH,
+    encode=None,
+    release=None,
+):  # pylint: disable=too-many-arguments
+    """Reads, hashes and encodes files, yields pipeline events
+
+    Args:
+        file_paths (iterable): (directory, file name) pairs as yielded by
+            `get_filepath` or `WalkEntry` tuples carrying their stat result
+        read_chunks (callable): Yields the chunks of a file path
+        workers (int): Reader threads, 0 reads on the caller's thread
+        queue_depth (int): Maximum number of chunks waiting for the consumer
+        encode (callable): Returns (codec, data) for a raw chunk, chunks are kept
+            raw when not given
+        release (callable): Called with every read chunk once it is no longer
+            used, e.g. `BufferPool.release`
+
+    Yields:
+        (event, task, chunk) tuples, `chunk` is a `Chunk` for `FILE_CHUNK` events and
+        None otherwise. Chunks of different files are interleaved, chunks of the
+        same file arrive in order. Chunk data is only valid until the next event
+        is requested, consumers keeping it must copy it.
+    """
+    encode = encode or _raw
+    release = release or _keep
+    if workers <= 0:
+        return _iter_serial(file_paths, read_chunks, encode, release)
+    return iter(
+        _ReaderPool(
+            file_paths,
+            read_chunks,
+            encode=encode,
+            release=release,
+            workers=workers,
+            queue_depth=max(queue_depth, 1),
+        )
+    )
@@ -0,0 +1,196 @@
+"""
+File selection queries
+
+Filters, searches and listings of file records over an open database, shared by
+the blocking, asyncio, archive and command line interfaces.
+"""
+from datetime import datetime
+
+
+def _name_pattern(file_name: str) -> str:
+    """LIKE pattern of a file name search, `*` is a wildcard otherwise a prefix"""
+    return file_name.replace("*", "%") if "*" in file_name else f"{file_name}%"
+
+
+def select_files(  # pylint: disable=R0913
+    db_conn,
+    file_ids=None,
+    pattern=None,
+    location=None,
+    *,
+    replaced_before=None,
+    created_before=None,
+    snapshot_id=None,
+    at=None,
+    current: bool = False,
+):
+    """Builds the filter of a file selection
+
+    A `location` containing `*` is matched as a pattern, like `pattern` is
+    matched against file names, otherwise it selects the directory and its sub
+    directories through a range scan of the `(original_file_location,
+    file_name)` index. Patterns are served by the trigram index where the
+    database has one.
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        file_ids (list): File record ids
+        pattern (str): File name search as accepted by `find_files`
+        location (str): Original location pattern or prefix
+        replaced_before (datetime): Only versions superseded by a snapshot
+            taken before this time, current versions are never selected
+        created_before (datetime): Only versions stored before this time,
+            current versions included
+        snapshot_id (int): Only versions belonging to the snapshot
+        at (datetime|str): Only versions of the last snapshot taken at or
+            before this time
+        current (bool): Only current versions, unless a snapshot is targeted
+
+    Returns:
+        (where clause, params) over a table or view with the `files` columns
+        aliased as `f`, all given criteria must match
+    """
+    if at is not None:
+        snapshot_id = snapshot_at(db_conn, at)
+    clauses = []
+    params = []
+    if snapshot_id is not None:
+        clauses.append(
+            "f.snapshot_id <= ? AND (f.replaced_in IS NULL OR f.replaced_in > ?)"
+        )
+        params.extend((int(snapshot_id), int(snapshot_id)))
+    elif current:
+        clauses.append("f.replaced_in IS NULL")
+    if file_ids is not None:
+        file_ids = [int(file_id) for file_id in file_ids]
+        clauses.append(f"f.id IN ({', '.join('?' * len(file_ids)) or 'NULL'})")
+        params.extend(file_ids)
+    matches = []
+    if pattern is not None:
+        matches.append(("file_name", _name_pattern(pattern)))
+    if location is not None and "*" in location:
+        matches.append(("original_file_location", location.replace("*", "%")))
+    elif location is not None:
+        base = location.rstrip("/")
+        # "0" is the character following "/", the range holds all sub directories
+        clauses.append(
+            "(f.original_file_location = ? OR "
+            "(f.original_file_location >= ? AND f.original_file_location < ?))"
+        )
+        params.extend((base or "/", f"{base}/", f"{base}0"))
+    if replaced_before is not None:
+        clauses.append(
+            "f.replaced_in IN (SELECT id FROM snapshots WHERE created_on < ?)"
+        )
+        params.append(str(replaced_before))
+    if created_before is not None:
+        clauses.append("f.created_on < ?")
+        params.append(str(created_before))
+    for column, like in matches:
+        if db_conn.search_index:
+            clauses.append(
+                f"f.id IN (SELECT rowid FROM files_fts WHERE {column} LIKE ?)"
+            )
+        else:
+            clauses.append(f"f.{column} LIKE ?")
+        params.append(like)
+    return " AND ".join(clauses) or "1", tuple(params)
+
+
+def select_versions(  # pylint: disable=R0913
+    db_conn, file_ids=None, pattern=None, location=None, *, snapshot_id=None, at=None
+):
+    """Filter of the versions a restore or an export selects
+
+    Current versions are selected unless file ids or a snapshot are given,
+    criteria are those of `select_files`.
+    """
+    return select_files(
+        db_conn,
+        file_ids,
+        pattern,
+        location,
+        snapshot_id=snapshot_id,
+        at=at,
+        current=file_ids is None,
+    )
+
+
+def query_files(  # pylint: disable=R0913
+    db_conn,
+    file_name=None,
+    location=None,
+    *,
+    limit=None,
+    offset=0,
+    after=None,
+    after_id=None,
+    snapshot_id=None,
+    at=None,
+):
+    """Yields `v_files` rows ordered by (file_name, id)
+
+    Current versions are listed unless a snapshot is targeted by id or by time.
+    Nothing is queried before the first row is requested.
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        file_name (str): File name, `*` is a wildcard otherwise a prefix, None
+            matches any name
+        location (str): Original location, `*` is a wildcard otherwise the
+            directory and its sub directories, None matches any location
+        limit (int): Maximum number of rows, all when None
+        offset (int): Rows skipped from the beginning
+        after (tuple): (file_name, id) keyset, rows start after it
+        after_id (int): Rows start after this record, keyset pagination
+        snapshot_id (int): Versions of this snapshot
+        at (datetime|str): Versions of the last snapshot taken at or before it
+    """
+    if after_id is not None:
+        after = file_key(db_conn, after_id)
+    where, params = select_files(
+        db_conn,
+        pattern=file_name,
+        location=location,
+        snapshot_id=snapshot_id,
+        at=at,
+        current=True,
+    )
+    if after is not None:
+        where = f"({where}) AND (f.file_name, f.id) > (?, ?)"
+        params = (*params, *after)
+    page_query = (
+        "select f.id, f.original_file_location, f.file_name, f.created_on, "
+        f"f.file_size_mb from v_files as f where {where} "
+        "order by f.file_name ASC, f.id ASC limit ? offset ?"
+    )
+    yield from db_conn.query(
+        page_query, (*params, -1 if limit is None else int(limit), int(offset))
+    )
+
+
+def snapshot_at(db_conn, at) -> int:
+    """Id of the last snapshot taken at or before `at`, 0 when there is none
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        at (datetime|str): Time, ISO format when a string
+    """
+    if isinstance(at, str):
+        at = datetime.fromisoformat(at)
+    return next(
+        db_conn.query(
+            "select id from snapshots where created_on <= ? "
+            "order by created_on DESC, id DESC limit 1",
+            (str(at),),
+        ),
+        (0,),
+    )[0]
+
+
+def file_key(db_conn, file_id):
+    """(file_name, id) keyset of a record, (None, None) matches no row when unknown"""
+    return next(
+        db_conn.query("select file_name, id from files where id = ?", (int(file_id),)),
+        (None, None),
+    )
@@ -0,0 +1,223 @@
+"""
+Random access to stored files
+
+`StoredFile` is a read-only, seekable raw stream over the chunks of a stored
+file, so tools such as `tarfile`, `zipfile` or pandas read it in place instead
+of restoring it first. The chunk list of the file is loaded once, a read only
+fetches and decodes the chunks its range touches and recently used chunks are
+kept in a size bounded LRU cache, so I/O is proportional to the bytes read.
+"""
+import bisect
+import io
+import os
+from collections import OrderedDict
+
+from .chunkers import CHUNK_SIZE
+from .compression import iter_decompress
+from .db_managers import SQLiteDBManager
+from .queries import snapshot_at
+
+CACHE_SIZE = 4 * CHUNK_SIZE
+
+
+class StoredFile(io.RawIOBase):  # pylint: disable=R0902
+    """Read-only stream over a stored file
+
+    Like the connection it reads through, the stream must be used on the
+    thread which opened the connection. Wrap it in `io.BufferedReader` when
+    reading many small pieces sequentially.
+
+    Args:
+        db_conn (SQLiteDBManager): Open database
+        file_id (int): File record id
+        cache_size (int): Bytes of decoded chunks kept for later reads, the
+            last read chunk is kept whatever its size
+        owns_connection (bool): Close `db_conn` when the stream is closed
+
+    Reads raise `OSError` when a chunk does not decode to its recorded size.
+
+    Raises:
+        RuntimeError: When the file id does not exist
+    """
+
+    def __init__(
+        self,
+        db_conn,
+        file_id: int,
+        *,
+        cache_size: int = CACHE_SIZE,
+        owns_connection: bool = False,
+    ) -> None:
+        super().__init__()
+        self._db_conn = db_conn
+        self._owns_connection = owns_connection
+        row = next(
+            db_conn.query(
+                "select original_file_location, file_name, content from files "
+                "where id = ?",
+                (int(file_id),),
+            ),
+            None,
+        )
+        if row is None:
+            raise RuntimeError("File id does not exists")
+        self.file_id = int(file_id)
+        self.name = os.path.join(*row[:2])
+        # a file stored inline is a single chunk which is never evicted, it has
+        # no chunk rows
+        self._inline = row[2]
+        self._starts = []
+        self._locations = []
+        size = 0
+        if self._inline:
+            self._starts.append(0)
+            self._locations.append(None)
+            size = len(self._inline)
+        chunks_query = (
+            "select c.size, c.codec, c.id, c.pack_id, c.pack_offset, c.pack_length "
+            "from file_chunks as fc join chunks as c on c.hash = fc.chunk_hash "
+            "where fc.file_id = ? order by fc.chunk_id ASC"
+        )
+        for chunk_size, *location in db_conn.query(chunks_query, (self.file_id,)):
+            self._starts.append(size)
+            self._locations.append(location)
+            size += chunk_size
+        self.size = size
+        self._position = 0
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._cache_size = cache_size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        self._checkClosed()
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position {position}")
+        self._position = position
+        return position
+
+    def _chunk(self, index: int) -> bytes:
+        """Decoded content of a chunk, from the cache when it is there"""
+        if self._inline:
+            return self._inline
+        data = self._cache.get(index)
+        if data is not None:
+            self._cache.move_to_end(index)
+            return data
+        codec, *location = self._locations[index]
+        data = b"".join(iter_decompress(codec, self._db_conn.iter_chunk(*location)))
+        end = self.size if index + 1 == len(self._starts) else self._starts[index + 1]
+        if len(data) != end - self._starts[index]:
+            raise OSError(
+                f"Chunk {index} of file {self.file_id} decodes to {len(data)} bytes, "
+                f"{end - self._starts[index]} are recorded"
+            )
+        self._cache[index] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self._cache_size and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+        return data
+
+    def readinto(self, buffer) -> int:
+        self._checkClosed()
+        target = memoryview(buffer).cast("B")
+        end = min(self._position + len(target), self.size)
+        written = 0
+        while self._position < end:
+            index = bisect.bisect_right(self._starts, self._position) - 1
+            data = self._chunk(index)
+            offset = self._position - self._starts[index]
+            count = min(len(data) - offset, end - self._position)
+            target[written : written + count] = data[offset : offset + count]
+            written += count
+            self._position += count
+        return written
+
+    def readall(self) -> bytes:
+        return self.read(max(self.size - self._position, 0))
+
+    def close(self) -> None:
+        if not self.closed:
+            self._cache.clear()
+            self._cached_bytes = 0
+            if self._owns_connection:
+                self._db_conn.__exit__(None, None, None)
+        super().close()
+
+
+def open_file(  # pylint: disable=R0913
+    db_name,
+    file_id: int = None,
+    *,
+    path: str = None,
+    snapshot_id: int = None,
+    at=None,
+    cache_size: int = CACHE_SIZE,
+) -> StoredFile:
+    """Opens a stored file for reading, by record id or by original path
+
+    A path opens its current version unless a snapshot is targeted by id or
+    by time as in `list_files`. The stream owns its connection, close it or
+    use it as a context manager.
+
+    Args:
+        db_name (str): Path to sqlite database
+        file_id (int): File record id
+        path (str): Original path of the file
+        snapshot_id (int): Open the version of this snapshot
+        at (datetime|str): Open the version of the last snapshot taken at or
+            before this time
+        cache_size (int): Bytes of decoded chunks kept for later reads
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+        ValueError: When neither or both of `file_id` and `path` are given
+        RuntimeError: When the file does not exist
+    """
+    if (file_id is None) == (path is None):
+        raise ValueError("Either a file id or a path is required")
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    db_conn = SQLiteDBManager(db_name).__enter__()  # pylint: disable=C2801
+    try:
+        if path is not None:
+            file_id = _version_id(db_conn, path, snapshot_id, at)
+        return StoredFile(db_conn, file_id, cache_size=cache_size, owns_connection=True)
+    except BaseException:
+        db_conn.__exit__(None, None, None)
+        raise
+
+
+def _version_id(db_conn, path: str, snapshot_id=None, at=None) -> int:
+    """Record id of the version of `path` in a snapshot, the current one by default"""
+    if at is not None:
+        snapshot_id = snapshot_at(db_conn, at)
+    query = "select id from files where original_file_location = ? and file_name = ? "
+    params = [os.path.dirname(path), os.path.basename(path)]
+    if snapshot_id is None:
+        query += "and replaced_in is null"
+    else:
+        query += "and snapshot_id <= ? and (replaced_in is null or replaced_in > ?)"
+        params += [snapshot_id, snapshot_id]
+    row = next(db_conn.query(query, params), None)
+    if row is None:
+        raise RuntimeError(f"File {path} does not exist")
+    return row[0]
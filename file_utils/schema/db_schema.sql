@@ -1,29 +1,72 @@
+-- must precede the first table, existing databases switch with a full VACUUM
+PRAGMA auto_vacuum = INCREMENTAL;
 CREATE TABLE files (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     original_file_location TEXT NOT NULL,
     file_name VARCHAR(200) NOT NULL,
+    created_on DATETIME NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    checksum CHAR(64),
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    snapshot_id INTEGER REFERENCES snapshots(id),
+    replaced_in INTEGER REFERENCES snapshots(id),
+    content BLOB
+);
+CREATE TABLE snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     created_on DATETIME NOT NULL
 );
+CREATE TABLE packs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash CHAR(64) NOT NULL,
+    size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    chunk BLOB,
+    codec VARCHAR(10) NOT NULL DEFAULT 'raw',
+    pack_id INTEGER REFERENCES packs(id),
+    pack_offset INTEGER,
+    pack_length INTEGER
+);
 CREATE TABLE file_chunks (
     file_id INTEGER NOT NULL,
     chunk_id INTEGER NOT NULL,
-    chunk BLOB,
-    FOREIGN KEY (file_id) REFERENCES files(id) ON UPDATE CASCADE ON DELETE CASCADE
+    chunk_hash CHAR(64) NOT NULL,
+    FOREIGN KEY (file_id) REFERENCES files(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    FOREIGN KEY (chunk_hash) REFERENCES chunks(hash)
+);
+CREATE TABLE metadata (
+    key VARCHAR(100) PRIMARY KEY,
+    value TEXT NOT NULL
 );
 CREATE INDEX idx_file_name ON files (file_name);
-CREATE UNIQUE INDEX idx_file ON files (original_file_location, file_name);
+CREATE UNIQUE INDEX idx_file ON files (original_file_location, file_name)
+WHERE replaced_in IS NULL;
+CREATE INDEX idx_file_versions ON files (original_file_location, file_name, snapshot_id);
+CREATE INDEX idx_snapshot_created ON snapshots (created_on);
+CREATE UNIQUE INDEX idx_chunk_hash ON chunks (hash);
 CREATE INDEX idx_file_chunks ON file_chunks(file_id);
 CREATE INDEX idx_file_chunk_id ON file_chunks(chunk_id);
-CREATE VIEW v_files AS WITH file_size AS (
-    SELECT file_id,
-        (SUM(LENGTH(chunk)) / 1000000.0) as file_size_mb
-    FROM file_chunks
-    GROUP BY file_id
-)
+CREATE INDEX idx_file_chunk_hash ON file_chunks(chunk_hash);
+CREATE TRIGGER trg_file_chunks_ref AFTER INSERT ON file_chunks BEGIN
+    UPDATE chunks SET ref_count = ref_count + 1 WHERE hash = NEW.chunk_hash;
+END;
+CREATE TRIGGER trg_file_chunks_unref AFTER DELETE ON file_chunks BEGIN
+    UPDATE chunks SET ref_count = ref_count - 1 WHERE hash = OLD.chunk_hash;
+    DELETE FROM chunks WHERE hash = OLD.chunk_hash AND ref_count <= 0;
+END;
+CREATE VIEW v_files AS
 SELECT f.id,
     f.original_file_location,
     f.file_name,
     f.created_on,
-    file_size.file_size_mb
-FROM files as f
-    JOIN file_size ON f.id = file_size.file_id;
\ No newline at end of file
+    (f.size / 1000000.0) as file_size_mb,
+    f.snapshot_id,
+    f.replaced_in
+FROM files as f;
+PRAGMA user_version = 8;
@@ -0,0 +1,59 @@
+-- Moves chunk content out of `file_chunks` in to the content-addressed `chunks`
+-- table. Requires the `sha256` SQL function registered by SQLiteDBManager.
+BEGIN;
+DROP VIEW IF EXISTS v_files;
+DROP INDEX IF EXISTS idx_file_chunks;
+DROP INDEX IF EXISTS idx_file_chunk_id;
+ALTER TABLE file_chunks RENAME TO legacy_file_chunks;
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hash CHAR(64) NOT NULL,
+    size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    chunk BLOB
+);
+CREATE UNIQUE INDEX idx_chunk_hash ON chunks (hash);
+CREATE TABLE file_chunks (
+    file_id INTEGER NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    chunk_hash CHAR(64) NOT NULL,
+    FOREIGN KEY (file_id) REFERENCES files(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    FOREIGN KEY (chunk_hash) REFERENCES chunks(hash)
+);
+CREATE INDEX idx_file_chunks ON file_chunks(file_id);
+CREATE INDEX idx_file_chunk_id ON file_chunks(chunk_id);
+CREATE INDEX idx_file_chunk_hash ON file_chunks(chunk_hash);
+CREATE TRIGGER trg_file_chunks_ref AFTER INSERT ON file_chunks BEGIN
+    UPDATE chunks SET ref_count = ref_count + 1 WHERE hash = NEW.chunk_hash;
+END;
+CREATE TRIGGER trg_file_chunks_unref AFTER DELETE ON file_chunks BEGIN
+    UPDATE chunks SET ref_count = ref_count - 1 WHERE hash = OLD.chunk_hash;
+    DELETE FROM chunks WHERE hash = OLD.chunk_hash AND ref_count <= 0;
+END;
+INSERT OR IGNORE INTO chunks (hash, size, chunk)
+    SELECT sha256(chunk), LENGTH(chunk), chunk
+    FROM legacy_file_chunks
+    WHERE file_id IS NOT NULL AND chunk IS NOT NULL
+    ORDER BY file_id, chunk_id;
+INSERT INTO file_chunks (file_id, chunk_id, chunk_hash)
+    SELECT file_id, chunk_id, sha256(chunk)
+    FROM legacy_file_chunks
+    WHERE file_id IS NOT NULL AND chunk IS NOT NULL
+    ORDER BY file_id, chunk_id;
+DROP TABLE legacy_file_chunks;
+CREATE VIEW v_files AS WITH file_size AS (
+    SELECT fc.file_id,
+        (SUM(c.size) / 1000000.0) as file_size_mb
+    FROM file_chunks AS fc
+        JOIN chunks AS c ON c.hash = fc.chunk_hash
+    GROUP BY fc.file_id
+)
+SELECT f.id,
+    f.original_file_location,
+    f.file_name,
+    f.created_on,
+    file_size.file_size_mb
+FROM files as f
+    JOIN file_size ON f.id = file_size.file_id;
+PRAGMA user_version = 1;
+COMMIT;
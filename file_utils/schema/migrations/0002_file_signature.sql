@@ -0,0 +1,8 @@
+-- Stat signature and content checksum used by incremental backups
+BEGIN;
+ALTER TABLE files ADD COLUMN size INTEGER;
+ALTER TABLE files ADD COLUMN mtime_ns INTEGER;
+ALTER TABLE files ADD COLUMN inode INTEGER;
+ALTER TABLE files ADD COLUMN checksum CHAR(64);
+PRAGMA user_version = 2;
+COMMIT;
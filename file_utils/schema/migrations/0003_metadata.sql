@@ -0,0 +1,8 @@
+-- Database wide settings, e.g. the chunking engine
+BEGIN;
+CREATE TABLE metadata (
+    key VARCHAR(100) PRIMARY KEY,
+    value TEXT NOT NULL
+);
+PRAGMA user_version = 3;
+COMMIT;
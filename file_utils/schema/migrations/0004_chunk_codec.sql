@@ -0,0 +1,5 @@
+-- Codec the chunk content is encoded with, `size` stays the raw chunk size
+BEGIN;
+ALTER TABLE chunks ADD COLUMN codec VARCHAR(10) NOT NULL DEFAULT 'raw';
+PRAGMA user_version = 4;
+COMMIT;
@@ -0,0 +1,34 @@
+-- Size, chunk count and checksum kept on the file row, backfilled once
+BEGIN;
+ALTER TABLE files ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 0;
+UPDATE files SET chunk_count = (
+        SELECT COUNT(*) FROM file_chunks WHERE file_id = files.id
+    );
+UPDATE files SET size = (
+        SELECT COALESCE(SUM(c.size), 0)
+        FROM file_chunks AS fc
+            JOIN chunks AS c ON c.hash = fc.chunk_hash
+        WHERE fc.file_id = files.id
+    )
+WHERE size IS NULL;
+-- chunks are aggregated in file order, an aggregate query keeps the order of its subquery
+UPDATE files SET checksum = (
+        SELECT sha256_content(codec, chunk) FROM (
+            SELECT c.codec, c.chunk
+            FROM file_chunks AS fc
+                JOIN chunks AS c ON c.hash = fc.chunk_hash
+            WHERE fc.file_id = files.id
+            ORDER BY fc.chunk_id
+        )
+    )
+WHERE checksum IS NULL;
+DROP VIEW v_files;
+CREATE VIEW v_files AS
+SELECT f.id,
+    f.original_file_location,
+    f.file_name,
+    f.created_on,
+    (f.size / 1000000.0) as file_size_mb
+FROM files as f;
+PRAGMA user_version = 5;
+COMMIT;
@@ -0,0 +1,11 @@
+-- Chunk content may live in append-only pack files instead of the chunk BLOB
+BEGIN;
+CREATE TABLE packs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    size INTEGER NOT NULL DEFAULT 0
+);
+ALTER TABLE chunks ADD COLUMN pack_id INTEGER REFERENCES packs(id);
+ALTER TABLE chunks ADD COLUMN pack_offset INTEGER;
+ALTER TABLE chunks ADD COLUMN pack_length INTEGER;
+PRAGMA user_version = 6;
+COMMIT;
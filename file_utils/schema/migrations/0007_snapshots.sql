@@ -0,0 +1,35 @@
+-- Every run is a snapshot, a path keeps one row per stored version, valid from
+-- the snapshot which stored it until the snapshot which replaced it
+BEGIN;
+CREATE TABLE snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_on DATETIME NOT NULL
+);
+CREATE INDEX idx_snapshot_created ON snapshots (created_on);
+-- files stored so far form the first snapshot
+INSERT INTO snapshots (created_on)
+SELECT MIN(created_on) FROM files HAVING COUNT(*) > 0;
+ALTER TABLE files ADD COLUMN snapshot_id INTEGER REFERENCES snapshots(id);
+ALTER TABLE files ADD COLUMN replaced_in INTEGER REFERENCES snapshots(id);
+UPDATE files SET snapshot_id = (SELECT MIN(id) FROM snapshots);
+-- databases from before the unique path index may hold a path more than once
+UPDATE files SET replaced_in = snapshot_id
+WHERE id NOT IN (
+        SELECT MAX(id) FROM files GROUP BY original_file_location, file_name
+    );
+DROP INDEX IF EXISTS idx_file;
+CREATE UNIQUE INDEX idx_file ON files (original_file_location, file_name)
+WHERE replaced_in IS NULL;
+CREATE INDEX idx_file_versions ON files (original_file_location, file_name, snapshot_id);
+DROP VIEW v_files;
+CREATE VIEW v_files AS
+SELECT f.id,
+    f.original_file_location,
+    f.file_name,
+    f.created_on,
+    (f.size / 1000000.0) as file_size_mb,
+    f.snapshot_id,
+    f.replaced_in
+FROM files as f;
+PRAGMA user_version = 7;
+COMMIT;
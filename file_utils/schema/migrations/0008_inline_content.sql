@@ -0,0 +1,5 @@
+-- Small files may keep their content on their row instead of in chunks
+BEGIN;
+ALTER TABLE files ADD COLUMN content BLOB;
+PRAGMA user_version = 8;
+COMMIT;
@@ -0,0 +1,25 @@
+-- Optional trigram index over file names and locations, needs FTS5 and SQLite 3.34+
+BEGIN;
+CREATE VIRTUAL TABLE files_fts USING fts5(
+    file_name,
+    original_file_location,
+    content = 'files',
+    content_rowid = 'id',
+    tokenize = 'trigram'
+);
+CREATE TRIGGER trg_files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, file_name, original_file_location)
+    VALUES (NEW.id, NEW.file_name, NEW.original_file_location);
+END;
+CREATE TRIGGER trg_files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, file_name, original_file_location)
+    VALUES ('delete', OLD.id, OLD.file_name, OLD.original_file_location);
+END;
+CREATE TRIGGER trg_files_fts_update AFTER UPDATE OF file_name, original_file_location ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, file_name, original_file_location)
+    VALUES ('delete', OLD.id, OLD.file_name, OLD.original_file_location);
+    INSERT INTO files_fts (rowid, file_name, original_file_location)
+    VALUES (NEW.id, NEW.file_name, NEW.original_file_location);
+END;
+INSERT INTO files_fts (files_fts) VALUES ('rebuild');
+COMMIT;
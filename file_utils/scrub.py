@@ -0,0 +1,254 @@
+"""
+Integrity scrub
+
+Every chunk is addressed by the SHA-256 of its raw content and every file row
+keeps the SHA-256 of the whole file, so stored content is verified by decoding
+chunks and hashing them again. Chunks are verified by a pool of threads, each
+with its own connection, `hashlib` and the decompressors release the GIL on
+large buffers.
+
+Progress is recorded in the `metadata` table after every verified batch of
+chunks, an interrupted scrub resumes where it stopped.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+from .compression import iter_decompress
+from .db_managers import SQLiteDBManager
+
+_logger = logging.getLogger(__file__)
+
+SCRUB_BATCH = 64
+
+_POSITION_KEY = "scrub_position"
+_COMPLETED_KEY = "scrub_completed"
+
+
+class ScrubReport:
+    """Outcome of a scrub
+
+    `corrupt` holds hashes of chunks whose content does not decode or does not
+    match the hash, `missing` hashes of chunks without content, including
+    chunks referenced by files but not stored at all, and `mismatched_files`
+    ids of files whose size or chunk count disagree with their chunks, or whose
+    inline content does not match their checksum.
+    """
+
+    def __init__(self) -> None:
+        self.chunks = 0
+        self.bytes_read = 0
+        self.corrupt = []
+        self.missing = []
+        self.mismatched_files = []
+        self.completed = False
+
+    def record(self, chunk_hash: str, size: int, problem: str = None) -> None:
+        """Counts a verified chunk, `problem` is "corrupt", "missing" or None"""
+        self.chunks += 1
+        self.bytes_read += size
+        if problem == "corrupt":
+            self.corrupt.append(chunk_hash)
+        elif problem == "missing":
+            self.missing.append(chunk_hash)
+
+    @property
+    def clean(self) -> bool:
+        return not (self.corrupt or self.missing or self.mismatched_files)
+
+
+class _MissingContent(Exception):
+    pass
+
+
+class _RateLimiter:  # pylint: disable=too-few-public-methods
+    """Spaces reads shared by all threads to `rate` bytes per second"""
+
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, size: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self._rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _raw_pieces(db_conn, location):
+    try:
+        yield from db_conn.iter_chunk(*location)
+    except OSError as err:
+        raise _MissingContent(err) from err
+
+
+def _verify_chunk(db_conn, row) -> str:
+    """Returns None for a sound chunk, otherwise "corrupt" or "missing" """
+    rowid, chunk_hash, codec, unavailable, _, *pack = row
+    if unavailable:
+        return "missing"
+    digest = hashlib.sha256()
+    try:
+        pieces = _raw_pieces(db_conn, (rowid, *pack))
+        for piece in iter_decompress(codec, pieces):
+            digest.update(piece)
+    except _MissingContent as err:
+        _logger.error("Chunk %s can not be read: %s", chunk_hash, err)
+        return "missing"
+    except Exception as err:  # pylint: disable=broad-except
+        _logger.error("Chunk %s can not be decoded: %s", chunk_hash, err)
+        return "corrupt"
+    return None if digest.hexdigest() == chunk_hash else "corrupt"
+
+
+def _verify_worker(db_name, tasks, limiter):
+    """Verifies queued batches, without a connection they fail instead"""
+    pending = iter(tasks.get, None)
+    try:
+        with SQLiteDBManager(db_name) as db_conn:
+            for rows, future in pending:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    results = []
+                    for row in rows:
+                        if limiter is not None:
+                            limiter.consume(row[4] or 0)
+                        results.append((row, _verify_chunk(db_conn, row)))
+                    future.set_result(results)
+                except Exception as err:  # pylint: disable=broad-except
+                    future.set_exception(err)
+    except Exception as err:  # pylint: disable=broad-except
+        _logger.error("Scrub worker failed: %s", err)
+        for _, future in pending:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(err)
+
+
+def _unreferenced_checks(db_conn, report) -> None:
+    missing_query = (
+        "select distinct fc.chunk_hash from file_chunks as fc "
+        "left join chunks as c on c.hash = fc.chunk_hash where c.id is null"
+    )
+    report.missing.extend(row[0] for row in db_conn.query(missing_query))
+    files_query = (
+        "select f.id from files as f left join ("
+        "select fc.file_id, count(*) as chunk_count, sum(c.size) as size "
+        "from file_chunks as fc join chunks as c on c.hash = fc.chunk_hash "
+        "group by fc.file_id) as t on t.file_id = f.id "
+        "where f.chunk_count != coalesce(t.chunk_count, 0) "
+        "or coalesce(f.size, 0) != coalesce(t.size, length(f.content), 0)"
+    )
+    report.mismatched_files.extend(row[0] for row in db_conn.query(files_query))
+    inline_query = "select id, checksum, content from files where content is not null"
+    report.mismatched_files.extend(
+        file_id
+        for file_id, checksum, content in db_conn.query(inline_query)
+        if checksum is not None and hashlib.sha256(content).hexdigest() != checksum
+    )
+
+
+def scrub(  # pylint: disable=R0912,R0913,R0914
+    db_name,
+    *,
+    workers: int = None,
+    rate: float = None,
+    restart: bool = False,
+    max_bytes: int = None,
+    batch_size: int = SCRUB_BATCH,
+):
+    """Verifies stored chunks and file records
+
+    Args:
+        db_name (str): Path to sqlite database
+        workers (int): Verifying threads, the number of CPUs by default
+        rate (float): Maximum bytes read per second, unlimited when None
+        restart (bool): Start over instead of resuming an interrupted scrub
+        max_bytes (int): Stop once this many stored bytes have been read, the
+            next call resumes from there
+        batch_size (int): Chunks per unit of work and of recorded progress
+
+    Returns:
+        ScrubReport: findings of this call, `completed` once all chunks have
+        been verified
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+    """
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    workers = workers or os.cpu_count() or 1
+    report = ScrubReport()
+    chunks_query = (
+        "select id, hash, codec, chunk is null and pack_id is null, "
+        "coalesce(pack_length, length(chunk)), pack_id, pack_offset, pack_length "
+        "from chunks where id > ? order by id ASC limit ?"
+    )
+    tasks = queue.Queue()
+    limiter = _RateLimiter(rate) if rate else None
+    # workers connect once the database has been migrated by this connection
+    with SQLiteDBManager(db_name) as db_conn:
+        position = 0 if restart else int(db_conn.get_metadata(_POSITION_KEY, 0))
+        if position:
+            _logger.info("Resuming scrub of %s after chunk %s", db_name, position)
+        threads = [
+            threading.Thread(target=_verify_worker, args=(db_name, tasks, limiter))
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        in_flight = deque()
+        exhausted = False
+        submitted = 0
+        try:
+            while not exhausted or in_flight:
+                while not exhausted and len(in_flight) < 2 * workers:
+                    if max_bytes is not None and submitted >= max_bytes:
+                        break
+                    rows = list(db_conn.query(chunks_query, (position, batch_size)))
+                    exhausted = len(rows) < batch_size
+                    if rows:
+                        position = rows[-1][0]
+                        submitted += sum(row[4] or 0 for row in rows)
+                        in_flight.append((position, Future()))
+                        tasks.put((rows, in_flight[-1][1]))
+                if not in_flight:
+                    break
+                batch_end, future = in_flight.popleft()
+                for row, problem in future.result():
+                    report.record(row[1], row[4] or 0, problem)
+                db_conn.set_metadata(_POSITION_KEY, str(batch_end))
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+            for thread in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        if exhausted and not in_flight:
+            _unreferenced_checks(db_conn, report)
+            db_conn.set_metadata(_POSITION_KEY, "0")
+            db_conn.set_metadata(_COMPLETED_KEY, datetime.now().isoformat())
+            report.completed = True
+    return report
+
+
+def affected_files(db_name, chunk_hashes):
+    """Yields (id, original location, file name) of files using any of the chunks"""
+    with SQLiteDBManager(db_name) as db_conn:
+        for chunk_hash in chunk_hashes:
+            yield from db_conn.query(
+                "select distinct f.id, f.original_file_location, f.file_name "
+                "from file_chunks as fc join files as f on f.id = fc.file_id "
+                "where fc.chunk_hash = ?",
+                (chunk_hash,),
+            )
@@ -0,0 +1,217 @@
+"""
+Sharded archives
+
+An archive is a small catalog database listing N shard databases, each one a
+regular file database. Every file belongs to the shard picked by the hash of its
+path, so shards can be written by separate processes at once, each one storing
+a different subset of shards. Listings and searches fan out over the shards and
+merge their ordered results.
+
+File ids of an archive encode the shard, `local id * shards + shard index`.
+"""
+import hashlib
+import heapq
+import itertools
+import os
+import queue
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, closing
+
+from .db_managers import SQLiteDBManager
+from .files import IngestStats, store_files
+from .queries import file_key, query_files
+from .walker import Walker
+
+# walked entries buffered per shard while its run is busy storing files
+FEED_DEPTH = 1024
+
+_CATALOG_SCHEMA = """
+CREATE TABLE shards (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL
+);
+"""
+
+
+def shard_index(dir_path: str, file_name: str, shards: int) -> int:
+    """Shard of a file, stable for its path"""
+    digest = hashlib.sha256(os.path.join(dir_path, file_name).encode("utf-8"))
+    return int.from_bytes(digest.digest()[:8], "big") % shards
+
+
+def create_archive(catalog_path: str, shards: int) -> list:
+    """Creates an archive of `shards` empty shard databases
+
+    Shards are kept in the `<catalog>.shards` directory.
+
+    Raises:
+        FileExistsError: When the catalog already exists
+        ValueError: When the number of shards is not positive
+
+    Returns:
+        list: Shard database paths
+    """
+    if shards <= 0:
+        raise ValueError("Number of shards must be positive")
+    if os.path.exists(catalog_path):
+        raise FileExistsError(f"Archive {catalog_path} already exists")
+    shards_dir = f"{os.path.basename(catalog_path)}.shards"
+    os.makedirs(os.path.join(os.path.dirname(catalog_path), shards_dir))
+    with closing(sqlite3.connect(catalog_path)) as conn:
+        conn.executescript(_CATALOG_SCHEMA)
+        conn.executemany(
+            "INSERT INTO shards (id, path) VALUES (?, ?)",
+            ((index, f"{shards_dir}/{index:04d}.db") for index in range(shards)),
+        )
+        conn.commit()
+    paths = shard_paths(catalog_path)
+    for path in paths:
+        with SQLiteDBManager(path):
+            pass
+    return paths
+
+
+def shard_paths(catalog_path: str) -> list:
+    """Shard database paths of an archive ordered by shard index
+
+    Raises:
+        FileNotFoundError: When the catalog does not exists
+    """
+    if not os.path.isfile(catalog_path):
+        raise FileNotFoundError(f"DB file {catalog_path} does not exists")
+    with closing(sqlite3.connect(catalog_path)) as conn:
+        rows = conn.execute("SELECT path FROM shards ORDER BY id").fetchall()
+    base_dir = os.path.dirname(catalog_path)
+    return [os.path.join(base_dir, row[0]) for row in rows]
+
+
+def resolve_file_id(catalog_path: str, file_id: int):
+    """Shard database and id in it of an archive file id"""
+    paths = shard_paths(catalog_path)
+    local_id, index = divmod(int(file_id), len(paths))
+    return paths[index], local_id
+
+
+class _ShardFeed:  # pylint: disable=too-few-public-methods
+    """Walker of one shard run, yields the entries routed to it"""
+
+    def __init__(self) -> None:
+        self.entries = queue.Queue(FEED_DEPTH)
+
+    def walk(self, local_paths):  # pylint: disable=unused-argument
+        return iter(self.entries.get, None)
+
+    def put(self, entry, run) -> None:
+        """Queues an entry, dropped once the run ended e.g. on an error"""
+        while not run.done():
+            try:
+                self.entries.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+def store_archive(catalog_path: str, local_paths: list, *, shards=None, **options):
+    """Stores files in to the shards of an archive
+
+    The tree is walked once, each file is routed to the run storing its shard.
+    Shards are stored at once by a thread each.
+
+    Args:
+        catalog_path (str): Archive catalog
+        local_paths (list): Files or directories to store
+        shards (list): Shard indexes written by this call, all when None. Files
+            of other shards are skipped without being opened, so processes given
+            disjoint shards write the same archive in parallel
+        options: `store_files` keyword arguments
+
+    Returns:
+        IngestStats: counters of all written shards
+    """
+    paths = shard_paths(catalog_path)
+    selected = range(len(paths)) if shards is None else sorted(set(shards))
+    walker = options.pop("walker", None) or Walker()
+    feeds = {index: _ShardFeed() for index in selected}
+    stats = IngestStats()
+    with ThreadPoolExecutor(max(len(feeds), 1)) as executor:
+        runs = {
+            index: executor.submit(
+                store_files, paths[index], local_paths, walker=feed, **options
+            )
+            for index, feed in feeds.items()
+        }
+        try:
+            for entry in walker.walk(local_paths):
+                index = shard_index(entry[0], entry[1], len(paths))
+                if index in feeds:
+                    feeds[index].put(entry, runs[index])
+        finally:
+            for index, feed in feeds.items():
+                feed.put(None, runs[index])
+        for run in runs.values():
+            stats.add(run.result())
+    return stats
+
+
+def _iter_shard(db_conn, index, shards, after, **filters):
+    if after is not None:
+        # last local id of this shard whose archive id is not above `after`
+        after = (after[0], (after[1] - index) // shards)
+    with closing(query_files(db_conn, after=after, **filters)) as rows:
+        for row in rows:
+            yield (row[0] * shards + index, *row[1:])
+
+
+def find_archive(  # pylint: disable=R0913,R0914,R1710
+    catalog_path,
+    file_name,
+    callback,
+    location=None,
+    *,
+    limit=None,
+    offset=0,
+    after_id=None,
+    at=None,
+):
+    """Searches files of an archive as `find_files` does
+
+    Shards are queried lazily and merged by (file_name, id), ids are archive
+    file ids. Every shard records its own snapshots, so past versions are
+    selected by time with `at` only.
+    """
+    paths = shard_paths(catalog_path)
+    shards = len(paths)
+    with ExitStack() as stack:
+        connections = [stack.enter_context(SQLiteDBManager(path)) for path in paths]
+        after = None
+        if after_id is not None:
+            local_id, index = divmod(int(after_id), shards)
+            after = (file_key(connections[index], local_id)[0], int(after_id))
+        stop = None if limit is None else int(offset) + int(limit)
+        shard_rows = [
+            _iter_shard(
+                db_conn,
+                index,
+                shards,
+                after,
+                file_name=file_name,
+                location=location,
+                limit=stop,
+                at=at,
+            )
+            for index, db_conn in enumerate(connections)
+        ]
+        # cursors left open by a partial read are closed before their connections
+        for rows in shard_rows:
+            stack.callback(rows.close)
+        rows = heapq.merge(*shard_rows, key=lambda row: (row[2], row[0]))
+        if hasattr(callback, "get_all"):
+            return getattr(callback, "get_all")(
+                itertools.islice(rows, int(offset), stop)
+            )
+
+
+def list_archive(catalog_path, callback, **options):
+    """Lists files of an archive ordered by name, options as in `find_archive`"""
+    return find_archive(catalog_path, None, callback, **options)
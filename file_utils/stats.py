@@ -0,0 +1,157 @@
+"""
+Hot path instrumentation
+
+Walking directories, reading files, database inserts, commits and queries and
+restored file writes report their duration to the hooks registered with
+`add_hook`. A hook is called as `hook(phase, seconds, size, rows)` from the
+thread which did the work, so hooks must be thread safe.
+
+Without hooks instrumented code only checks whether the hook list is empty.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+WALK = "walk"
+READ = "read"
+INSERT = "insert"
+DELETE = "delete"
+COMMIT = "commit"
+QUERY = "query"
+WRITE = "write"
+
+PHASES = (WALK, READ, INSERT, DELETE, COMMIT, QUERY, WRITE)
+
+_hooks = []
+
+
+def add_hook(hook) -> None:
+    """Registers a callable receiving (phase, seconds, size, rows) measurements"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook) -> None:
+    _hooks.remove(hook)
+
+
+def _notify(phase, seconds, size, rows) -> None:
+    for hook in tuple(_hooks):
+        hook(phase, seconds, size, rows)
+
+
+def start():
+    """Start of a measurement, None when no hook is registered"""
+    return time.perf_counter() if _hooks else None
+
+
+def record(phase: str, started, *, size: int = 0, rows: int = 0) -> None:
+    """Reports the time elapsed since `started`, see `start`"""
+    if started is not None:
+        _notify(phase, time.perf_counter() - started, size, rows)
+
+
+def timed_iter(phase: str, iterable, size=None):
+    """Measures the time spent producing the items of `iterable`
+
+    Time spent by the consumer between items is not counted. The measurement is
+    reported once the iteration ends, with the number of items as rows and the
+    sum of `size(item)` as size. `iterable` is returned as is when no hook is
+    registered.
+    """
+    if not _hooks:
+        return iterable
+    return _timed_iter(phase, iter(iterable), size)
+
+
+def _timed_iter(phase, iterator, size):
+    seconds = 0.0
+    total = 0
+    rows = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - started
+            rows += 1
+            if size is not None:
+                total += size(item)
+            yield item
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+        _notify(phase, seconds, total, rows)
+
+
+class Recorder:
+    """Hook summing up calls, time, bytes and rows per phase
+
+    Phases measured on several threads at once, like reads by the reader
+    threads of `store_files`, may add up to more than the elapsed time.
+    """
+
+    def __init__(self) -> None:
+        self.phases = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, phase, seconds, size, rows) -> None:
+        with self._lock:
+            totals = self.phases.setdefault(phase, [0, 0.0, 0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size
+            totals[3] += rows
+
+    def report(self) -> str:
+        """Table of the phases with their share of the elapsed time and throughput"""
+        elapsed = time.perf_counter() - self.started
+        ordered = [phase for phase in PHASES if phase in self.phases]
+        ordered += sorted(set(self.phases) - set(PHASES))
+        rows = []
+        for phase in ordered:
+            calls, seconds, size, count = self.phases[phase]
+            rows.append(
+                (
+                    phase,
+                    calls,
+                    f"{seconds:.3f}",
+                    f"{seconds / elapsed:.1%}" if elapsed else "",
+                    f"{size / 1000000.0:.2f}",
+                    f"{size / seconds / 1000000.0:.2f}" if seconds else "",
+                    count,
+                )
+            )
+        # imported on first use, it is not needed unless a report is printed
+        from tabulate import tabulate  # pylint: disable=import-outside-toplevel
+
+        table = tabulate(
+            rows, headers=["phase", "calls", "seconds", "share", "MB", "MB/s", "rows"]
+        )
+        return f"{table}\nelapsed {elapsed:.3f} seconds"
+
+
+@contextmanager
+def recording(enabled: bool = True, stream=None):
+    """Records the phases of the enclosed block
+
+    The report is written to `stream`, stderr by default, when the block ends.
+    Nothing is measured when not `enabled`.
+
+    Yields:
+        Recorder: None when not enabled
+    """
+    if not enabled:
+        yield None
+        return
+    recorder = Recorder()
+    add_hook(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
+        print(recorder.report(), file=stream or sys.stderr)
@@ -0,0 +1,167 @@
+"""
+Chunk storage backends
+
+`blob` keeps chunk content in the `chunks.chunk` column. `pack` appends chunk
+content to large pack files next to the database, the `chunks` row keeps only
+(pack, offset, length). The `packs` table records the committed size of every
+pack, bytes past it were written by a transaction which never committed and are
+dropped when the pack is appended to again.
+
+Every chunk row tells where its content is, so databases mixing both layouts
+are read correctly whichever backend is configured.
+"""
+import json
+import os
+
+PACK_SIZE = 1073741824
+
+
+class BlobStorage:  # pylint: disable=too-few-public-methods
+    """Chunk content stored in the database"""
+
+    name = "blob"
+    packed = False
+
+    @property
+    def params(self) -> dict:
+        return {}
+
+
+class PackStorage:  # pylint: disable=too-few-public-methods
+    """Chunk content appended to pack files of up to `pack_size` bytes"""
+
+    name = "pack"
+    packed = True
+
+    def __init__(self, pack_size: int = PACK_SIZE) -> None:
+        if pack_size <= 0:
+            raise ValueError("Pack size must be positive")
+        self.pack_size = pack_size
+
+    @property
+    def params(self) -> dict:
+        return {"pack_size": self.pack_size}
+
+
+STORAGES = {BlobStorage.name: BlobStorage, PackStorage.name: PackStorage}
+
+
+def storage_config(storage) -> str:
+    """Serializes a storage backend for the database metadata"""
+    return json.dumps({"name": storage.name, "params": storage.params})
+
+
+def storage_from_config(config: str):
+    """Creates a storage backend from `storage_config` output
+
+    Raises:
+        ValueError: When the storage backend is unknown
+    """
+    config = json.loads(config)
+    try:
+        return STORAGES[config["name"]](**config.get("params", {}))
+    except KeyError as err:
+        raise ValueError(f"Unknown storage {config['name']}") from err
+
+
+def get_storage(name: str, **params):
+    """Creates a storage backend by name
+
+    Raises:
+        ValueError: When the storage backend is unknown
+    """
+    try:
+        return STORAGES[name](**params)
+    except KeyError as err:
+        raise ValueError(f"Unknown storage {name}") from err
+
+
+def pack_path(packs_dir: str, pack_id: int) -> str:
+    return os.path.join(packs_dir, f"{pack_id:08d}.pack")
+
+
+class PackWriter:
+    """Appends to pack files, one pack is open at a time"""
+
+    def __init__(self, packs_dir: str) -> None:
+        self._packs_dir = packs_dir
+        self._pack_id = None
+        self._fp = None
+
+    def append(self, pack_id: int, committed_size: int, data) -> int:
+        """Appends `data` to a pack
+
+        Args:
+            pack_id (int): Pack id
+            committed_size (int): Size of the pack recorded in the database
+            data (bytes): Content to append
+
+        Returns:
+            int: Offset of `data` in the pack
+        """
+        if pack_id != self._pack_id:
+            self.close()
+            os.makedirs(self._packs_dir, exist_ok=True)
+            path = pack_path(self._packs_dir, pack_id)
+            # pylint: disable=consider-using-with
+            self._fp = open(path, "r+b" if os.path.exists(path) else "w+b")
+            self._fp.truncate(committed_size)
+            self._pack_id = pack_id
+        self._fp.seek(committed_size)
+        self._fp.write(data)
+        return committed_size
+
+    def sync(self) -> None:
+        """Makes appended content durable, must precede the database commit"""
+        if self._fp is not None:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+
+    def close(self) -> None:
+        if self._fp is not None:
+            self.sync()
+            self._fp.close()
+        self._fp = None
+        self._pack_id = None
+
+
+class PackReader:
+    """Reads chunk content from memory mapped pack files"""
+
+    def __init__(self, packs_dir: str) -> None:
+        self._packs_dir = packs_dir
+        self._maps = {}
+
+    def _map(self, pack_id: int, end: int):
+        pack_map = self._maps.get(pack_id)
+        if pack_map is not None and len(pack_map) >= end:
+            return pack_map
+        with open(pack_path(self._packs_dir, pack_id), "rb") as fp_reader:
+            if os.fstat(fp_reader.fileno()).st_size < end:
+                raise OSError(f"Pack {pack_id} is truncated")
+            # loaded by the first pack read, databases without packs never need it
+            import mmap  # pylint: disable=import-outside-toplevel
+
+            # a grown pack is mapped again, readers of the old map keep it alive
+            pack_map = mmap.mmap(fp_reader.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[pack_id] = pack_map
+        return pack_map
+
+    def iter_range(self, pack_id: int, offset: int, length: int, piece_size: int):
+        """Yields `length` bytes of a pack from `offset` in pieces
+
+        Raises:
+            OSError: When the pack is missing or shorter than the range
+        """
+        if not length:
+            return
+        end = offset + length
+        pack_map = self._map(pack_id, end)
+        while offset < end:
+            yield pack_map[offset : min(offset + piece_size, end)]
+            offset += piece_size
+
+    def close(self) -> None:
+        for pack_map in self._maps.values():
+            pack_map.close()
+        self._maps = {}
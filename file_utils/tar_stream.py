@@ -0,0 +1,182 @@
+"""
+Tar streams of stored files
+
+`export_tar` writes a selection of stored files as a tar stream read straight
+from their chunks and `import_tar` stores the members of a tar stream through
+the regular ingest, so files move between databases and hosts through a pipe
+without being written to disk. Both hold at most one chunk of content at a
+time and the streams are read or written strictly sequentially, so standard
+input and output, `ssh` or object store clients work as well as files.
+
+Member names are the original paths without their leading `/`, as `tar`
+expects them, and their mtime is written to the PAX header with nanosecond
+digits, so a database importing a stream exported by another one records the
+same locations and signatures. Relative original locations are recorded in a
+`FILE_UTILS.path` header.
+"""
+import logging
+import os
+import tarfile
+from collections import namedtuple
+from contextlib import closing
+
+from .db_managers import SQLiteDBManager
+from .files import IngestStats, store_files
+from .queries import select_versions
+from .reader import StoredFile
+from .walker import WalkEntry
+
+_logger = logging.getLogger(__file__)
+
+PATH_HEADER = "FILE_UTILS.path"
+COMPRESSIONS = ("gz", "bz2", "xz")
+
+# size and mtime are what incremental ingest compares, tar members have no inode
+TarStat = namedtuple("TarStat", ["st_size", "st_mtime_ns", "st_ino"])
+
+
+def export_tar(  # pylint: disable=R0913,R0914
+    db_name,
+    fileobj,
+    *,
+    file_ids=None,
+    pattern=None,
+    location=None,
+    snapshot_id=None,
+    at=None,
+    compression: str = None,
+) -> int:
+    """Writes stored files to a tar stream
+
+    Files are selected as in `restore_files`, all current versions when no
+    criteria is given, and written ordered by original path.
+
+    Args:
+        db_name (str): Path to sqlite database
+        fileobj: Binary file object the stream is written to, it is not closed
+        file_ids (list): File record ids
+        pattern (str): File name search, `*` is a wildcard otherwise a prefix
+        location (str): Original location prefix, sub directories included
+        snapshot_id (int): Export the versions of this snapshot
+        at (datetime|str): Export the versions of the last snapshot taken at or
+            before this time
+        compression (str): `gz`, `bz2` or `xz`, uncompressed when None
+
+    Returns:
+        int: Number of exported files
+
+    Raises:
+        FileNotFoundError: When db file does not exists
+        ValueError: When the compression is unknown
+    """
+    if not os.path.isfile(db_name):
+        raise FileNotFoundError(f"DB file {db_name} does not exists")
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression}")
+    exported = 0
+    with SQLiteDBManager(db_name) as db_conn, tarfile.open(
+        fileobj=fileobj, mode=f"w|{compression or ''}", format=tarfile.PAX_FORMAT
+    ) as archive:
+        where, params = select_versions(
+            db_conn, file_ids, pattern, location, snapshot_id=snapshot_id, at=at
+        )
+        rows = db_conn.query(
+            "select f.id, f.original_file_location, f.file_name, f.mtime_ns "
+            f"from files as f where {where} "
+            "order by f.original_file_location, f.file_name",
+            params,
+        )
+        # rows are fetched as files are written, the cursor is closed before
+        # the connection when the export fails
+        with closing(rows):
+            for file_id, file_location, file_name, mtime_ns in rows:
+                with StoredFile(db_conn, file_id, cache_size=0) as stored:
+                    archive.addfile(
+                        _member(file_location, file_name, mtime_ns, stored.size),
+                        stored,
+                    )
+                exported += 1
+    _logger.info("%s file(s) have been exported", exported)
+    return exported
+
+
+def _member(file_location: str, file_name: str, mtime_ns, size: int):
+    path = os.path.join(file_location, file_name)
+    seconds, nanoseconds = divmod(mtime_ns or 0, 1000000000)
+    member = tarfile.TarInfo(path.lstrip("/"))
+    member.size = size
+    member.mode = 0o644
+    member.mtime = seconds
+    member.pax_headers = {"mtime": f"{seconds}.{nanoseconds:09d}"}
+    if not os.path.isabs(path):
+        member.pax_headers[PATH_HEADER] = path
+    return member
+
+
+def _mtime_ns(member) -> int:
+    """Exact mtime of a member, `tarfile` parses PAX times as floats"""
+    value = member.pax_headers.get("mtime", "")
+    seconds, _, fraction = value.partition(".")
+    if not seconds.isdigit() or not (fraction or "0").isdigit():
+        return int(member.mtime * 1000000000)
+    return int(seconds) * 1000000000 + int(f"{fraction:0<9}"[:9])
+
+
+class _TarMembers:
+    """File source of the ingest reading the regular members of a tar stream
+
+    Members are read in stream order, the ingest must open each one before it
+    asks for the next, which holds for ingests without reader threads.
+    """
+
+    def __init__(self, archive, prefix: str = None) -> None:
+        self._archive = archive
+        self._prefix = prefix
+        self._current = None
+
+    def _path(self, member) -> str:
+        if self._prefix is None and PATH_HEADER in member.pax_headers:
+            return member.pax_headers[PATH_HEADER]
+        name = os.path.normpath(member.name.lstrip("/"))
+        return os.path.join("/" if self._prefix is None else self._prefix, name)
+
+    def walk(self, _paths):
+        for member in self._archive:
+            if not member.isfile():
+                continue
+            path = self._path(member)
+            self._current = (path, member)
+            yield WalkEntry(
+                os.path.dirname(path),
+                os.path.basename(path),
+                TarStat(member.size, _mtime_ns(member), 0),
+            )
+
+    def open(self, path: str):
+        current_path, member = self._current
+        if path != current_path:
+            raise RuntimeError(f"Member {path} is not the current tar member")
+        return self._archive.extractfile(member)
+
+
+def import_tar(db_name, fileobj, *, prefix: str = None, **options) -> IngestStats:
+    """Stores the regular files of a tar stream
+
+    Members are stored under the original path recorded by `export_tar`, or
+    under `prefix` joined with the member name, `/` by default, for other
+    streams. Compressed streams are detected.
+
+    Args:
+        db_name (str): Path to sqlite database, created when it does not exist
+        fileobj: Binary file object the stream is read from
+        prefix (str): Location members are stored under instead of their
+            recorded path
+        options: `store_files` keyword arguments, reader threads are not used
+
+    Returns:
+        IngestStats: counters of the run
+    """
+    options["workers"] = 0
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        members = _TarMembers(archive, prefix)
+        return store_files(db_name, [], walker=members, opener=members.open, **options)
@@ -0,0 +1,357 @@
+"""
+Directory tree walker
+
+Trees are listed with `os.scandir`, whose entries tell files from directories
+without a system call on most platforms. Each accepted file is stat'ed once and
+its stat result travels with it to the read pipeline, which then neither checks
+nor stats the file again, so incremental backups compare signatures without
+extra system calls.
+
+Exclude and include rules use the gitignore syntax: `*`, `?` and `[...]` do
+not match `/`, `**` matches across directories, a leading or inner `/` anchors
+the pattern at the walked root, otherwise it matches at any depth, a trailing
+`/` matches directories only and `!` re-includes what an earlier rule
+excluded. The last matching rule wins. Excluded directories are not entered,
+so a file below one cannot be re-included.
+
+With `workers` directories are scanned by a pool of threads, `os.scandir` and
+`stat` release the GIL, which pays off on cold caches and network file
+systems. Files are then yielded in no particular order.
+"""
+import logging
+import os
+import queue
+import re
+import threading
+from collections import namedtuple
+from stat import S_ISDIR, S_ISREG
+
+from . import stats
+
+_logger = logging.getLogger(__file__)
+
+SYMLINKS_SKIP = "skip"
+SYMLINKS_FILES = "files"
+SYMLINKS_FOLLOW = "follow"
+SYMLINK_POLICIES = (SYMLINKS_SKIP, SYMLINKS_FILES, SYMLINKS_FOLLOW)
+
+_SCAN_DONE = "done"
+_POLL_INTERVAL = 0.1
+
+WalkEntry = namedtuple("WalkEntry", ["dir_path", "file_name", "stat"])
+# a directory waiting to be scanned, `rel_path` is relative to the walked root
+_Directory = namedtuple("_Directory", ["path", "rel_path", "depth", "device"])
+_Rule = namedtuple("_Rule", ["regex", "negate", "dir_only"])
+
+
+def _translate(pattern: str) -> str:
+    """Regular expression of a gitignore glob, without anchors"""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            parts.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[" and "]" in pattern[index + 2 :]:
+            end = pattern.index("]", index + 2)
+            members = pattern[index + 1 : end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            parts.append("[" + members.replace("\\", "\\\\") + "]")
+            index = end + 1
+            continue
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+
+def compile_rules(patterns) -> list:
+    """Compiles gitignore style patterns, blank and `#` comment lines are ignored
+
+    Raises:
+        ValueError: When a pattern is not valid
+    """
+    rules = []
+    for pattern in patterns or ():
+        pattern = pattern.strip()
+        if not pattern or pattern.startswith("#"):
+            continue
+        original = pattern
+        negate = pattern.startswith("!")
+        pattern = pattern[1:] if negate else pattern
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if not pattern:
+            raise ValueError(f"Invalid pattern {original!r}")
+        regex = ("" if anchored else "(?:.*/)?") + _translate(pattern)
+        try:
+            rules.append(_Rule(re.compile(regex, re.DOTALL), negate, dir_only))
+        except re.error as err:
+            raise ValueError(f"Invalid pattern {original!r}: {err}") from err
+    return rules
+
+
+def match_rules(rules, rel_path: str, is_dir: bool = False):
+    """True when the last matching rule excludes `rel_path`, False when it
+    re-includes it and None when no rule matches"""
+    matched = None
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if rule.regex.fullmatch(rel_path):
+            matched = not rule.negate
+    return matched
+
+
+def read_patterns(path: str) -> list:
+    """Patterns of an ignore file, one per line"""
+    with open(path, "r", encoding="utf-8") as reader:
+        return [line.rstrip("\n") for line in reader]
+
+
+class Walker:  # pylint: disable=R0902
+    """Lists the files of directory trees
+
+    Args:
+        exclude (list): Gitignore style patterns of skipped files and directories
+        include (list): When given, only files matching one of these patterns
+            are listed, directories are always entered
+        max_depth (int): Directory levels entered below a walked root, 0 lists
+            the files of the root only, unlimited when None
+        symlinks (str): `skip` ignores symbolic links, `files` follows links to
+            files but does not enter linked directories, `follow` follows both
+            while never entering a directory twice
+        one_file_system (bool): Do not enter directories on another device than
+            their walked root
+        min_size (int): Smallest listed file size in bytes
+        max_size (int): Largest listed file size in bytes
+        workers (int): Scanning threads, 0 walks on the caller's thread
+    """
+
+    def __init__(  # pylint: disable=R0913
+        self,
+        *,
+        exclude=None,
+        include=None,
+        max_depth: int = None,
+        symlinks: str = SYMLINKS_FILES,
+        one_file_system: bool = False,
+        min_size: int = None,
+        max_size: int = None,
+        workers: int = 0,
+    ) -> None:
+        if symlinks not in SYMLINK_POLICIES:
+            raise ValueError(f"Unknown symlink policy {symlinks}")
+        self._exclude = compile_rules(exclude)
+        self._include = compile_rules(include)
+        self.max_depth = max_depth
+        self.symlinks = symlinks
+        self.one_file_system = one_file_system
+        self.min_size = min_size
+        self.max_size = max_size
+        self.workers = workers
+        self._visited = set()
+        self._visited_lock = threading.Lock()
+
+    def walk(self, paths):
+        """Yields a `WalkEntry` for every accepted file under `paths`
+
+        A path naming a file is listed when it passes the rules, a path naming
+        a directory is walked. Directories which cannot be read are logged and
+        skipped.
+        """
+        self._visited = set()
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        if self.workers > 0:
+            return iter(_ParallelScan(self, paths, self.workers))
+        return self._walk_serial(paths)
+
+    def _roots(self, paths, entries: list) -> list:
+        """Directories to walk, files named directly are added to `entries`"""
+        roots = []
+        for path in map(os.fspath, paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if S_ISDIR(stat.st_mode):
+                if self._first_visit(stat):
+                    roots.append(_Directory(path, "", 0, stat.st_dev))
+            elif S_ISREG(stat.st_mode):
+                file_name = os.path.basename(path)
+                if self._accept_file(file_name, stat):
+                    entries.append(WalkEntry(os.path.dirname(path), file_name, stat))
+        return roots
+
+    def _walk_serial(self, paths):
+        entries = []
+        pending = self._roots(paths, entries)
+        yield from entries
+        pending.reverse()
+        while pending:
+            entries, subdirs = self.scan(pending.pop())
+            yield from entries
+            pending.extend(reversed(subdirs))
+
+    def _first_visit(self, stat) -> bool:
+        if self.symlinks != SYMLINKS_FOLLOW:
+            return True
+        key = (stat.st_dev, stat.st_ino)
+        with self._visited_lock:
+            if key in self._visited:
+                return False
+            self._visited.add(key)
+        return True
+
+    def _accept_file(self, rel_path: str, stat) -> bool:
+        if match_rules(self._exclude, rel_path):
+            return False
+        if self._include and not match_rules(self._include, rel_path):
+            return False
+        if self.min_size is not None and stat.st_size < self.min_size:
+            return False
+        return self.max_size is None or stat.st_size <= self.max_size
+
+    def _accept_dir(self, directory, entry, rel_path: str) -> bool:
+        if self.max_depth is not None and directory.depth >= self.max_depth:
+            return False
+        if match_rules(self._exclude, rel_path, is_dir=True):
+            return False
+        if not (self.one_file_system or self.symlinks == SYMLINKS_FOLLOW):
+            return True
+        stat = entry.stat()
+        if self.one_file_system and stat.st_dev != directory.device:
+            return False
+        return self._first_visit(stat)
+
+    def scan(self, directory):
+        """Lists a single directory
+
+        Returns:
+            (list, list): accepted `WalkEntry` files and `_Directory` to walk
+        """
+        started = stats.start()
+        entries, subdirs = [], []
+        try:
+            with os.scandir(directory.path) as scanner:
+                for entry in scanner:
+                    self._scan_entry(directory, entry, entries, subdirs)
+        except OSError as err:
+            _logger.warning("Skipping directory %s: %s", directory.path, err)
+        stats.record(stats.WALK, started, rows=1)
+        return entries, subdirs
+
+    def _scan_entry(self, directory, entry, entries, subdirs) -> None:
+        rel_path = f"{directory.rel_path}/{entry.name}".lstrip("/")
+        try:
+            if entry.is_symlink() and self.symlinks == SYMLINKS_SKIP:
+                return
+            if entry.is_dir():
+                if (
+                    not entry.is_symlink() or self.symlinks == SYMLINKS_FOLLOW
+                ) and self._accept_dir(directory, entry, rel_path):
+                    subdirs.append(
+                        _Directory(
+                            entry.path, rel_path, directory.depth + 1, directory.device
+                        )
+                    )
+                return
+            # broken links and special files are skipped
+            if entry.is_file():
+                stat = entry.stat()
+                if self._accept_file(rel_path, stat):
+                    entries.append(WalkEntry(directory.path, entry.name, stat))
+        except OSError as err:
+            _logger.warning("Skipping %s: %s", entry.path, err)
+
+
+class _ParallelScan:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """Directories scanned by a pool of threads, files yielded as they are found"""
+
+    def __init__(self, walker: Walker, paths, workers: int) -> None:
+        self._walker = walker
+        self._paths = paths
+        self._directories = queue.Queue()
+        self._entries = queue.Queue(maxsize=workers * 4)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"walker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._entries.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _add(self, directories) -> None:
+        with self._pending_lock:
+            self._pending += len(directories)
+        for directory in directories:
+            self._directories.put(directory)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                directory = self._directories.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if directory is None:
+                return
+            try:
+                entries, subdirs = self._walker.scan(directory)
+                self._add(subdirs)
+                if entries and not self._put(entries):
+                    return
+            except Exception as err:  # pylint: disable=broad-except
+                self._put(err)
+            with self._pending_lock:
+                self._pending -= 1
+                done = self._pending == 0
+            if done:
+                self._put(_SCAN_DONE)
+
+    def __iter__(self):
+        entries = []
+        roots = self._walker._roots(self._paths, entries)  # pylint: disable=W0212
+        yield from entries
+        if not roots:
+            return
+        self._add(roots)
+        for thread in self._threads:
+            thread.start()
+        try:
+            while True:
+                item = self._entries.get()
+                if item == _SCAN_DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            self._stop.set()
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,205 @@
+import asyncio
+import functools
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from file_utils.aio import AsyncFileUtils
+from file_utils.chunkers import FixedChunker
+from file_utils.files import _IngestWriter
+
+
+def run_async(test):
+    """Runs a coroutine test in a new event loop, IsolatedAsyncioTestCase needs 3.8"""
+
+    @functools.wraps(test)
+    def wrapper(self):
+        asyncio.run(test(self))
+
+    return wrapper
+
+
+class TestAsyncFileUtils(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.mkdir(self.files_folder)
+        for index in range(5):
+            with open(f"{self.files_folder}/{index}.txt", "w", encoding="utf-8") as fp:
+                fp.write(f"file {index} " * 500)
+        self.db_path = f"{self.tmp_dir}/database.db"
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    @run_async
+    async def test_operations(self):
+        async with AsyncFileUtils(self.db_path, step_rows=2) as files:
+            ingest_stats = await files.store_files(
+                [self.files_folder], chunker=FixedChunker(1000)
+            )
+            self.assertEqual(ingest_stats.files, 5)
+
+            rows = [row async for row in files.list_files()]
+            self.assertEqual([row[2] for row in rows], [f"{i}.txt" for i in range(5)])
+            rows = [row async for row in files.find_files("*3*")]
+            self.assertEqual([row[2] for row in rows], ["3.txt"])
+            rows = [row async for row in files.list_files(limit=2, after_id=rows[0][0])]
+            self.assertEqual([row[2] for row in rows], ["4.txt"])
+
+            file_id = next(
+                row[0] for row in await self.collect(files) if row[2] == "1.txt"
+            )
+            pieces = [piece async for piece in files.iter_file_content(file_id)]
+            self.assertEqual(b"".join(pieces), b"file 1 " * 500)
+            destination = await files.restore_file_by_id(file_id, self.tmp_dir)
+            with open(destination, "r", encoding="utf-8") as reader:
+                self.assertEqual(reader.read(), "file 1 " * 500)
+
+            await files.delete_file_by_id(file_id)
+            with self.assertRaisesRegex(RuntimeError, "does not exist"):
+                await files.delete_file_by_id(file_id)
+            self.assertEqual(await files.delete_files(pattern="*.txt"), 4)
+            self.assertEqual(await self.collect(files), [])
+
+    def test_event_loops(self):
+        # created outside of any loop and opened by two loops in turn
+        files = AsyncFileUtils(self.db_path, concurrency=2)
+
+        async def store():
+            async with files:
+                return await files.store_files([self.files_folder])
+
+        self.assertEqual(asyncio.run(store()).files, 5)
+        self.assertEqual(asyncio.run(store()).files, 0)
+
+    @staticmethod
+    async def collect(files):
+        return [row async for row in files.list_files()]
+
+    @run_async
+    async def test_single_database_thread(self):
+        threads = set()
+        original = AsyncFileUtils._call  # pylint: disable=protected-access
+
+        def record_thread(self, function, *args, **kwargs):
+            def run(*run_args, **run_kwargs):
+                threads.add(threading.current_thread().name)
+                return function(*run_args, **run_kwargs)
+
+            return original(self, run, *args, **kwargs)
+
+        with mock.patch.object(AsyncFileUtils, "_call", record_thread):
+            async with AsyncFileUtils(self.db_path, concurrency=2) as files:
+                await asyncio.gather(
+                    files.store_files([self.files_folder]),
+                    self.collect(files),
+                    self.collect(files),
+                )
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads.pop().startswith("file-utils-db"))
+
+    @run_async
+    async def test_cancel_store(self):
+        async with AsyncFileUtils(self.db_path, step_events=1) as files:
+            task = asyncio.create_task(
+                files.store_files([self.files_folder], chunker=FixedChunker(100))
+            )
+            for _ in range(20):
+                await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            stored = await self.collect(files)
+            self.assertLess(len(stored), 5)
+
+            await files.store_files([self.files_folder], incremental=True)
+            self.assertEqual(len(await self.collect(files)), 5)
+
+    @run_async
+    async def test_delete_waits_for_store(self):
+        shared = f"{self.tmp_dir}/shared"
+        os.mkdir(shared)
+        for name in ("a.txt", "b.txt"):
+            with open(f"{shared}/{name}", "w", encoding="utf-8") as fp:
+                fp.write("same content")
+        chunked = threading.Event()
+        original = _IngestWriter.handle
+
+        def handle(self, event, task, chunk):
+            original(self, event, task, chunk)
+            if chunk is not None:
+                chunked.set()
+
+        async with AsyncFileUtils(self.db_path, step_events=1) as files:
+            await files.store_files([f"{shared}/a.txt"], chunker=FixedChunker(1))
+            with mock.patch.object(_IngestWriter, "handle", handle):
+                store = asyncio.create_task(files.store_files([f"{shared}/b.txt"]))
+                # b.txt references chunks of a.txt but has no row yet
+                while not chunked.is_set():
+                    await asyncio.sleep(0.001)
+                self.assertEqual(await files.delete_files(pattern="a.txt"), 1)
+                self.assertEqual((await store).files, 1)
+            rows = await self.collect(files)
+            self.assertEqual([row[2] for row in rows], ["b.txt"])
+            pieces = [piece async for piece in files.iter_file_content(rows[0][0])]
+            self.assertEqual(b"".join(pieces), b"same content")
+
+    @run_async
+    async def test_delete_waits_for_reads(self):
+        async with AsyncFileUtils(self.db_path, step_rows=1) as files:
+            await files.store_files([self.files_folder], chunker=FixedChunker(1000))
+            file_id = (await self.collect(files))[1][0]
+            pieces = files.iter_file_content(file_id)
+            content = [await pieces.__anext__()]
+            delete = asyncio.create_task(files.delete_files(pattern="*.txt"))
+            await asyncio.sleep(0.05)
+            self.assertFalse(delete.done())
+            content.extend([piece async for piece in pieces])
+            self.assertEqual(b"".join(content), b"file 1 " * 500)
+            self.assertEqual(await delete, 5)
+
+    @run_async
+    async def test_delete_while_listing(self):
+        async with AsyncFileUtils(self.db_path, step_rows=2) as files:
+            await files.store_files([self.files_folder])
+
+            async def delete_listed():
+                async for row in files.list_files():
+                    await files.delete_file_by_id(row[0])
+
+            await asyncio.wait_for(delete_listed(), timeout=5)
+            self.assertEqual(await self.collect(files), [])
+
+    @run_async
+    async def test_failed_store_keeps_chunks_of_others(self):
+        for name in ("x.txt", "y.txt"):
+            with open(f"{self.tmp_dir}/{name}", "w", encoding="utf-8") as fp:
+                fp.write("same content")
+
+        class BrokenReader(io.BytesIO):
+            def readinto(self, buffer):
+                if self.tell() >= 3:
+                    raise OSError("Input/output error")
+                return super().readinto(buffer)
+
+        def broken(path):
+            with open(path, "rb") as reader:
+                return BrokenReader(reader.read())
+
+        async with AsyncFileUtils(self.db_path, step_events=1) as files:
+            stored, failed = await asyncio.gather(
+                files.store_files([f"{self.tmp_dir}/x.txt"], chunker=FixedChunker(1)),
+                files.store_files(
+                    [f"{self.tmp_dir}/y.txt"], chunker=FixedChunker(1), opener=broken
+                ),
+            )
+            self.assertEqual((stored.files, failed.files), (1, 0))
+            rows = await self.collect(files)
+            self.assertEqual([row[2] for row in rows], ["x.txt"])
+            pieces = [piece async for piece in files.iter_file_content(rows[0][0])]
+            self.assertEqual(b"".join(pieces), b"same content")
@@ -0,0 +1,110 @@
+import io
+import os
+import random
+from unittest import TestCase
+
+from file_utils.chunkers import (
+    BufferPool,
+    FastCDCChunker,
+    FixedChunker,
+    chunker_config,
+    chunker_from_config,
+    get_chunker,
+)
+
+
+class ShortReads(io.RawIOBase):
+    def __init__(self, data):
+        super().__init__()
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(memoryview(buffer)[:3])
+
+
+def random_bytes(size, seed=1):
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, "little")
+
+
+class TestFixedChunker(TestCase):
+    def test_split(self):
+        chunks = list(FixedChunker(4).split(io.BytesIO(b"0123456789")))
+        self.assertEqual(chunks, [b"0123", b"4567", b"89"])
+
+    def test_empty(self):
+        self.assertEqual(list(FixedChunker(4).split(io.BytesIO(b""))), [])
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            FixedChunker(0)
+
+    def test_split_buffers(self):
+        buffers = BufferPool()
+        chunks = []
+        for chunk in FixedChunker(4).split(ShortReads(b"0123456789"), buffers):
+            self.assertIsInstance(chunk, memoryview)
+            chunks.append((bytes(chunk), id(chunk.obj)))
+            buffers.release(chunk)
+        self.assertEqual([data for data, _ in chunks], [b"0123", b"4567", b"89"])
+        self.assertEqual(len({buffer for _, buffer in chunks}), 1)
+
+        kept = list(FixedChunker(4).split(io.BytesIO(b"0123456789"), buffers))
+        self.assertEqual([bytes(chunk) for chunk in kept], [b"0123", b"4567", b"89"])
+        buffers.release(b"0123")
+        self.assertEqual(len(buffers.acquire(8)), 8)
+
+
+class TestFastCDCChunker(TestCase):
+    def setUp(self) -> None:
+        self.chunker = FastCDCChunker(min_size=512, avg_size=2048, max_size=8192)
+        self.data = random_bytes(200000)
+
+    def test_split_sizes(self):
+        chunks = list(self.chunker.split(io.BytesIO(self.data)))
+        self.assertEqual(b"".join(chunks), self.data)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 512)
+            self.assertLessEqual(len(chunk), 8192)
+        average = len(self.data) / len(chunks)
+        self.assertGreater(average, 1024)
+        self.assertLess(average, 4096)
+
+    def test_boundaries_follow_content(self):
+        edited = self.data[:1000] + b"inserted" + self.data[1000:]
+        original = set(self.chunker.split(io.BytesIO(self.data)))
+        chunks = list(self.chunker.split(io.BytesIO(edited)))
+        reused = sum(len(chunk) for chunk in chunks if chunk in original)
+        self.assertGreater(reused / len(edited), 0.9)
+
+        fixed = FixedChunker(2048)
+        original = set(fixed.split(io.BytesIO(self.data)))
+        chunks = list(fixed.split(io.BytesIO(edited)))
+        self.assertLess(sum(1 for chunk in chunks if chunk in original), 2)
+
+    def test_repeated_content(self):
+        chunks = list(self.chunker.split(io.BytesIO(b"\x00" * 20000)))
+        self.assertEqual(b"".join(chunks), b"\x00" * 20000)
+        self.assertTrue(all(len(chunk) <= 8192 for chunk in chunks))
+
+    def test_read_file(self):
+        self.assertEqual(list(self.chunker.read_file(os.devnull)), [])
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            FastCDCChunker(min_size=4096, avg_size=2048, max_size=8192)
+
+
+class TestChunkerConfig(TestCase):
+    def test_round_trip(self):
+        chunker = chunker_from_config(chunker_config(FastCDCChunker(1, 4, 16)))
+        self.assertIsInstance(chunker, FastCDCChunker)
+        self.assertEqual(chunker.params, {"min_size": 1, "avg_size": 4, "max_size": 16})
+
+    def test_unknown(self):
+        with self.assertRaisesRegex(ValueError, "Unknown chunker rabin"):
+            get_chunker("rabin")
+        with self.assertRaisesRegex(ValueError, "Unknown chunker rabin"):
+            chunker_from_config('{"name": "rabin"}')
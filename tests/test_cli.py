@@ -0,0 +1,240 @@
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import TestCase, mock
+
+from file_utils.cli import main
+from file_utils.files import _IngestWriter
+
+
+class TestCli(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.makedirs(self.files_folder)
+        for name in ("a.txt", "b.txt", "c.log"):
+            with open(f"{self.files_folder}/{name}", "w", encoding="utf-8") as writer:
+                writer.write(f"content of {name}")
+        self.db_path = f"{self.tmp_dir}/database.db"
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def file_ids(self):
+        _, output, _ = self.run_cli("list", self.db_path, "-o", "ndjson")
+        rows = [json.loads(line) for line in output.splitlines()]
+        return {os.path.basename(row["file_path"]): row["id"] for row in rows}
+
+    def run_cli(self, *argv, stream=None):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            status = main(argv, stream=stream)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_commands(self):
+        status, output, _ = self.run_cli("backup", self.db_path, self.files_folder)
+        self.assertEqual(status, 0)
+        self.assertIn("Stored 3 file(s)", output)
+
+        file_ids = self.file_ids()
+        self.assertEqual(sorted(file_ids), ["a.txt", "b.txt", "c.log"])
+
+        status, output, _ = self.run_cli("find", self.db_path, "*.log", "-o", "json")
+        self.assertEqual(status, 0)
+        self.assertEqual([row["id"] for row in json.loads(output)], [file_ids["c.log"]])
+
+        restore_dir = f"{self.tmp_dir}/restored"
+        os.makedirs(restore_dir)
+        status, _, _ = self.run_cli(
+            "restore", self.db_path, str(file_ids["b.txt"]), restore_dir
+        )
+        self.assertEqual(status, 0)
+        with open(f"{restore_dir}/b.txt", encoding="utf-8") as reader:
+            self.assertEqual(reader.read(), "content of b.txt")
+
+        file_id = str(file_ids["b.txt"])
+        self.assertEqual(self.run_cli("remove", self.db_path, file_id)[0], 0)
+        status, _, error = self.run_cli("remove", self.db_path, file_id)
+        self.assertEqual(status, 1)
+        self.assertIn(f"Record {file_id} does not exist", error)
+
+    def test_tool_commands(self):
+        self.run_cli("backup", self.db_path, self.files_folder)
+        status, output, _ = self.run_cli("snapshots", self.db_path)
+        self.assertEqual((status, output.splitlines()[2].split()[0]), (0, "1"))
+
+        stdout = io.TextIOWrapper(io.BytesIO())
+        path = f"{self.files_folder}/a.txt"
+        with mock.patch("sys.stdout", stdout):
+            main(["cat", self.db_path, "-p", path, "--offset", "-5", "--length", "3"])
+        self.assertEqual(stdout.buffer.getvalue(), b"a.t")
+
+        tar_path = f"{self.tmp_dir}/files.tar"
+        status, _, _ = self.run_cli(
+            "export", self.db_path, "-o", tar_path, "-g", "*.txt"
+        )
+        self.assertEqual(status, 0)
+        copy_path = f"{self.tmp_dir}/copy.db"
+        status, output, _ = self.run_cli("import", copy_path, "-i", tar_path)
+        self.assertEqual(status, 0)
+        self.assertIn("Stored 2 file(s)", output)
+
+        restore_dir = f"{self.tmp_dir}/restored"
+        status, _, error = self.run_cli("restore-files", copy_path, restore_dir)
+        self.assertEqual(status, 1)
+        self.assertIn("one of --ids, --glob", error)
+        status, _, _ = self.run_cli("restore-files", copy_path, restore_dir, "-g", "b")
+        self.assertEqual(status, 0)
+        with open(
+            f"{restore_dir}{self.files_folder}/b.txt", encoding="utf-8"
+        ) as reader:
+            self.assertEqual(reader.read(), "content of b.txt")
+
+        status, output, _ = self.run_cli("verify", copy_path)
+        self.assertEqual(status, 0)
+        self.assertIn("0 corrupt, 0 missing", output)
+        with sqlite3.connect(copy_path) as conn:
+            conn.execute("update chunks set chunk = X'00'")
+        conn.close()
+        status, output, error = self.run_cli("verify", copy_path, "--restart")
+        self.assertEqual(status, 1)
+        self.assertIn("2 corrupt", output)
+        self.assertIn("Damaged", output)
+        self.assertIn("damaged chunks", error)
+
+        commands = io.StringIO("prune --created-older-than -1\nimport\nsnapshots\n")
+        status, output, error = self.run_cli("batch", copy_path, stream=commands)
+        self.assertEqual(status, 1)
+        self.assertIn("Deleted 2 file(s)", output)
+        self.assertTrue(error.startswith("line 2: "))
+        self.assertIn("--input", error)
+
+    def test_errors(self):
+        status, _, error = self.run_cli("list", "none")
+        self.assertEqual(status, 1)
+        self.assertIn("does not exists", error)
+        self.assertFalse(os.path.exists("none"))
+
+        status, _, error = self.run_cli("find", self.db_path)
+        self.assertEqual(status, 1)
+        self.assertIn("a file name or --location is required", error)
+
+        with open(self.db_path, "w", encoding="utf-8") as writer:
+            writer.write("not a database" * 100)
+        for command in ("list", "batch"):
+            status, _, error = self.run_cli(command, self.db_path, stream=io.StringIO())
+            self.assertEqual(status, 1)
+            self.assertIn("file is not a database", error)
+
+    def test_batch(self):
+        self.run_cli("backup", self.db_path, self.files_folder)
+        file_ids = self.file_ids()
+        restore_dir = f"{self.tmp_dir}/restored"
+        os.makedirs(restore_dir)
+        commands = io.StringIO(
+            "# listing\n"
+            'find "*.txt" -o ndjson\n'
+            f"{json.dumps(['restore', file_ids['c.log'], restore_dir])}\n"
+            "remove 42\n"
+            "unknown\n"
+            "\n"
+            f"remove {file_ids['a.txt']}\n"
+            "list -o ndjson\n"
+        )
+        status, output, error = self.run_cli("batch", self.db_path, stream=commands)
+        self.assertEqual(status, 1)
+        names = [json.loads(line)["file_path"] for line in output.splitlines()]
+        self.assertEqual(
+            [os.path.basename(name) for name in names],
+            ["a.txt", "b.txt", "b.txt", "c.log"],
+        )
+        self.assertTrue(os.path.isfile(f"{restore_dir}/c.log"))
+        self.assertEqual(
+            [line.split(":")[0] for line in error.splitlines()], ["line 4", "line 5"]
+        )
+
+        commands = io.StringIO("find a -o ndjson\nlist -o ndjson\n")
+        with mock.patch(
+            "file_utils.queries.select_files",
+            side_effect=[sqlite3.OperationalError("database is locked"), ("1", ())],
+        ):
+            status, output, error = self.run_cli("batch", self.db_path, stream=commands)
+        self.assertEqual(status, 1)
+        self.assertEqual(error, "line 1: database is locked\n")
+        self.assertEqual(len(output.splitlines()), 2)
+
+        commands = io.StringIO(f"backup {self.files_folder} -i\nlist -o csv\n")
+        status, output, _ = self.run_cli(
+            "batch", self.db_path, "--bulk", stream=commands
+        )
+        self.assertEqual(status, 0)
+        self.assertIn("Stored 1 file(s), 2 unchanged", output)
+
+    def test_batch_failed_backup(self):
+        with open(f"{self.files_folder}/big.bin", "wb") as writer:
+            writer.write(os.urandom(5000))
+        original = _IngestWriter.handle
+
+        def handle(writer, event, task, chunk):
+            original(writer, event, task, chunk)
+            if chunk is not None and chunk.index == 2:
+                raise RuntimeError("stopped")
+
+        commands = io.StringIO(
+            f"backup {self.files_folder} --chunker fixed --chunk-size 1000\n"
+        )
+        with mock.patch.object(_IngestWriter, "handle", handle):
+            status, _, error = self.run_cli(
+                "batch", self.db_path, "--bulk", stream=commands
+            )
+        self.assertEqual(status, 1)
+        self.assertEqual(error, "line 1: stopped\n")
+        with sqlite3.connect(self.db_path) as conn:
+            ret = conn.execute("select count(*) from chunks where ref_count = 0")
+            self.assertEqual(ret.fetchone(), (0,))
+        conn.close()
+
+    def test_lazy_imports(self):
+        code = (
+            "import sys, file_utils, file_utils.cli; "
+            "print(sorted(name for name in sys.modules "
+            "if name.startswith('file_utils.') or name == 'tabulate'))"
+        )
+        loaded = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+        self.assertEqual(loaded.strip(), "['file_utils.cli']")
+
+    def test_list_imports(self):
+        self.run_cli("backup", self.db_path, self.files_folder)
+        code = (
+            "import json, sys; from file_utils.cli import main; "
+            "main(['list', sys.argv[1], '-o', 'ndjson']); "
+            "print(json.dumps(sorted(sys.modules)), file=sys.stderr)"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", code, self.db_path],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        self.assertEqual(len(process.stdout.splitlines()), 3)
+        loaded = set(json.loads(process.stderr.splitlines()[-1]))
+        unused = {
+            f"file_utils.{name}"
+            for name in ("chunkers", "compression", "files", "pipeline", "shards")
+        }
+        unused.update(("file_utils.walker", "mmap", "tabulate"))
+        self.assertEqual(loaded & unused, set())
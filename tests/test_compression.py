@@ -0,0 +1,44 @@
+import os
+from unittest import TestCase
+
+from file_utils.compression import CODECS, Compressor, decompress, iter_decompress
+
+
+class TestCompressor(TestCase):
+    def setUp(self) -> None:
+        self.text = b"timestamp=2022-01-01 level=info message=ok\n" * 4000
+
+    def test_round_trip(self):
+        for codec in CODECS:
+            stored_codec, data = Compressor(codec).encode(self.text)
+            self.assertEqual(stored_codec, codec)
+            self.assertLess(len(data), len(self.text) / 5)
+            self.assertEqual(decompress(stored_codec, data), self.text)
+
+    def test_iter_decompress(self):
+        for codec in CODECS + ("raw",):
+            if codec == "raw":
+                data = self.text
+            else:
+                _, data = Compressor(codec).encode(self.text)
+            pieces = [data[index : index + 100] for index in range(0, len(data), 100)]
+            self.assertEqual(b"".join(iter_decompress(codec, pieces)), self.text)
+        with self.assertRaisesRegex(ValueError, "Unknown codec zstd"):
+            list(iter_decompress("zstd", [b""]))
+
+    def test_incompressible_stored_raw(self):
+        for size in (1000, 200000):
+            chunk = os.urandom(size)
+            self.assertEqual(Compressor("zlib").encode(chunk), ("raw", chunk))
+            self.assertEqual(decompress("raw", chunk), chunk)
+
+    def test_min_savings(self):
+        self.assertEqual(
+            Compressor("zlib", min_savings=1.0).encode(self.text)[0], "raw"
+        )
+
+    def test_unknown_codec(self):
+        with self.assertRaisesRegex(ValueError, "Unknown codec zstd"):
+            Compressor("zstd")
+        with self.assertRaisesRegex(ValueError, "Unknown codec zstd"):
+            decompress("zstd", b"")
@@ -1,10 +1,15 @@
+import hashlib
 import os.path
 import shutil
+import sqlite3
 import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from unittest import TestCase
+from unittest import TestCase, mock
 
-from file_utils.db_managers import SQLiteDBManager
+from file_utils.db_managers import _MIGRATIONS, SQLiteDBManager
 
 
 class TestSQLiteManagers(TestCase):
@@ -72,8 +77,11 @@ class TestSQLiteManagers(TestCase):
             record_id = db_conn.insert_row(table, data)
             self.assertEqual(record_id, 1)
 
+            self.assertTrue(db_conn.insert_chunk("hash-1", b"first chunk"))
+            self.assertFalse(db_conn.insert_chunk("hash-1", b"first chunk"))
+
             chunks_table = "file_chunks"
-            data_chunk = {"file_id": record_id, "chunk_id": 1, "chunk": "first chunk"}
+            data_chunk = {"file_id": record_id, "chunk_id": 1, "chunk_hash": "hash-1"}
 
             db_conn.insert_row(chunks_table, data_chunk)
 
@@ -90,3 +98,325 @@ class TestSQLiteManagers(TestCase):
 
             with self.assertRaises(StopIteration):
                 _ = next(db_conn.query(query, params))
+
+            with self.assertRaises(StopIteration):
+                _ = next(db_conn.query("select id from chunks"))
+
+    def test_bulk_commit_if_due(self):
+        db_path = f"{self.directory}/bulk.db"
+        with SQLiteDBManager(db_path, bulk=True, batch_rows=3) as db_conn:
+            reader = sqlite3.connect(db_path)
+            journal_mode = next(db_conn.query("select * from pragma_journal_mode"))
+            self.assertEqual(journal_mode, ("wal",))
+
+            db_conn.insert_row(
+                "files",
+                {
+                    "file_name": "bulk.txt",
+                    "original_file_location": "path",
+                    "created_on": datetime.now(),
+                },
+            )
+            db_conn.insert_chunk("hash-1", b"data")
+            self.assertFalse(db_conn.commit_if_due())
+            self.assertEqual(
+                reader.execute("select count(*) from files").fetchone(), (0,)
+            )
+
+            db_conn.insert_rows(
+                "file_chunks", ("file_id", "chunk_id", "chunk_hash"), [(1, 1, "hash-1")]
+            )
+            self.assertTrue(db_conn.commit_if_due())
+            self.assertEqual(
+                reader.execute("select count(*) from file_chunks").fetchone(), (1,)
+            )
+            reader.close()
+
+    def test_bulk_rollback_on_error(self):
+        db_path = f"{self.directory}/bulk.db"
+        with self.assertRaises(KeyboardInterrupt):
+            with SQLiteDBManager(db_path, bulk=True) as db_conn:
+                db_conn.insert_chunk("hash-1", b"data")
+                raise KeyboardInterrupt()
+
+        with SQLiteDBManager(db_path) as db_conn:
+            with self.assertRaises(StopIteration):
+                _ = next(db_conn.query("select id from chunks"))
+
+    def test_migrate_legacy_chunks(self):
+        db_path = f"{self.directory}/legacy.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB,
+                FOREIGN KEY (file_id) REFERENCES files(id)
+                    ON UPDATE CASCADE ON DELETE CASCADE
+            );
+            INSERT INTO files VALUES (1, 'path', 'a.txt', '2022-01-01');
+            INSERT INTO files VALUES (2, 'path', 'b.txt', '2022-01-01');
+            INSERT INTO file_chunks VALUES (1, 1, X'616263');
+            INSERT INTO file_chunks VALUES (2, 1, X'616263');
+            """
+        )
+        conn.close()
+
+        with SQLiteDBManager(db_path) as db_conn:
+            ret = list(db_conn.query("select ref_count, chunk from chunks"))
+            self.assertEqual(ret, [(2, b"abc")])
+            ret = list(db_conn.query("select id, file_size_mb from v_files"))
+            self.assertEqual(ret, [(1, 3e-06), (2, 3e-06)])
+            ret = list(db_conn.query("select size, chunk_count, checksum from files"))
+            abc_hash = hashlib.sha256(b"abc").hexdigest()
+            self.assertEqual(ret, [(3, 1, abc_hash), (3, 1, abc_hash)])
+
+    def test_migrate_file_totals(self):
+        db_path = f"{self.directory}/v4.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            """
+        )
+        conn.close()
+        v4_migrations = {version: _MIGRATIONS[version] for version in range(1, 5)}
+        with mock.patch.dict(_MIGRATIONS, v4_migrations, clear=True):
+            with SQLiteDBManager(db_path):
+                pass
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "INSERT INTO chunks (hash, size, chunk, codec) VALUES (?, ?, ?, ?)",
+            ("hash-1", 6000, zlib.compress(b"abc" * 2000), "zlib"),
+        )
+        conn.execute(
+            "INSERT INTO chunks (hash, size, chunk) VALUES ('hash-2', 3, X'646566')"
+        )
+        conn.executescript(
+            """
+            INSERT INTO files (id, original_file_location, file_name, created_on)
+                VALUES (1, 'path', 'a.txt', '2022-01-01');
+            INSERT INTO file_chunks VALUES (1, 2, 'hash-2');
+            INSERT INTO file_chunks VALUES (1, 1, 'hash-1');
+            """
+        )
+        conn.commit()
+        conn.close()
+
+        with SQLiteDBManager(db_path) as db_conn:
+            ret = next(db_conn.query("select size, chunk_count, checksum from files"))
+            content = b"abc" * 2000 + b"def"
+            self.assertEqual(ret, (6003, 2, hashlib.sha256(content).hexdigest()))
+            ret = next(db_conn.query("select file_size_mb from v_files"))
+            self.assertEqual(ret, (0.006003,))
+
+    def test_migrate_snapshots(self):
+        db_path = f"{self.directory}/v6.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            """
+        )
+        conn.close()
+        v6_migrations = {version: _MIGRATIONS[version] for version in range(1, 7)}
+        with mock.patch.dict(_MIGRATIONS, v6_migrations, clear=True):
+            with SQLiteDBManager(db_path) as db_conn:
+                for created_on in ("2022-02-01", "2022-01-01"):
+                    db_conn.insert_row(
+                        "files",
+                        {
+                            "original_file_location": created_on,
+                            "file_name": "a.txt",
+                            "created_on": created_on,
+                        },
+                    )
+
+        with SQLiteDBManager(db_path) as db_conn:
+            ret = list(db_conn.query("select id, created_on from snapshots"))
+            self.assertEqual(ret, [(1, "2022-01-01")])
+            ret = list(db_conn.query("select snapshot_id, replaced_in from v_files"))
+            self.assertEqual(ret, [(1, None), (1, None)])
+
+            version = {
+                "original_file_location": "2022-01-01",
+                "file_name": "a.txt",
+                "created_on": "2022-03-01",
+            }
+            self.assertIsNone(db_conn.insert_row("files", version))
+            db_conn.update_row("files", 2, {"replaced_in": 1})
+            self.assertEqual(db_conn.insert_row("files", version), 3)
+
+    def test_migrate_inline_content(self):
+        db_path = f"{self.directory}/v7.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            """
+        )
+        conn.close()
+        v7_migrations = {version: _MIGRATIONS[version] for version in range(1, 8)}
+        with mock.patch.dict(_MIGRATIONS, v7_migrations, clear=True):
+            with SQLiteDBManager(db_path) as db_conn:
+                db_conn.insert_row(
+                    "files",
+                    {
+                        "original_file_location": "/tmp",
+                        "file_name": "a.txt",
+                        "created_on": "2022-01-01",
+                    },
+                )
+
+        with SQLiteDBManager(db_path) as db_conn:
+            ret = list(db_conn.query("select id, content from files"))
+            self.assertEqual(ret, [(1, None)])
+
+    def test_migrate_concurrently(self):
+        db_path = f"{self.directory}/legacy.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            INSERT INTO files VALUES (1, 'path', 'a.txt', '2022-01-01');
+            INSERT INTO file_chunks VALUES (1, 1, X'616263');
+            """
+        )
+        conn.close()
+        barrier = threading.Barrier(4)
+
+        def open_db(_):
+            barrier.wait()
+            with SQLiteDBManager(db_path) as db_conn:
+                return list(db_conn.query("select ref_count, chunk from chunks"))
+
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(open_db, range(4)))
+        self.assertEqual(results, [[(1, b"abc")]] * 4)
+        conn = sqlite3.connect(db_path)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        self.assertEqual(version, max(_MIGRATIONS))
+
+    def test_enable_incremental_vacuum(self):
+        db_path = f"{self.directory}/legacy.db"
+        conn = sqlite3.connect(db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            """
+        )
+        conn.close()
+        v4_migrations = {version: _MIGRATIONS[version] for version in range(1, 5)}
+        with mock.patch.dict(_MIGRATIONS, v4_migrations, clear=True):
+            with SQLiteDBManager(db_path):
+                pass
+
+        with SQLiteDBManager(db_path) as db_conn:
+            self.assertEqual(db_conn.reclaim_space(), 0)
+            db_conn.enable_incremental_vacuum()
+            ret = next(db_conn.query("select * from pragma_auto_vacuum"))
+            self.assertEqual(ret, (2,))
+            self.assertEqual(db_conn.reclaim_space(), 0)
+
+    def test_iter_blob(self):
+        with SQLiteDBManager(f"{self.directory}/data.db") as db_conn:
+            db_conn.insert_chunk("hash-1", b"0123456789")
+            pieces = list(db_conn.iter_blob("chunks", "chunk", 1, piece_size=4))
+            if hasattr(sqlite3.Connection, "blobopen"):
+                self.assertEqual(pieces, [b"0123", b"4567", b"89"])
+            self.assertEqual(b"".join(pieces), b"0123456789")
+
+            db_conn._blob_io = False  # pylint: disable=protected-access
+            pieces = list(db_conn.iter_blob("chunks", "chunk", 1, piece_size=4))
+            self.assertEqual(pieces, [b"0123456789"])
+
+    def test_query_is_lazy(self):
+        with SQLiteDBManager(f"{self.directory}/data.db") as db_conn:
+            for index in range(3):
+                db_conn.insert_chunk(f"hash-{index}", b"data")
+            rows = db_conn.query("select hash from chunks order by id")
+            self.assertEqual(next(rows), ("hash-0",))
+            db_conn.insert_chunk("hash-3", b"data")
+            self.assertEqual(list(rows), [("hash-1",), ("hash-2",), ("hash-3",)])
+
+    def test_search_index(self):
+        with SQLiteDBManager(f"{self.directory}/data.db") as db_conn:
+            if not db_conn.search_index:
+                self.skipTest("FTS5 trigram tokenizer is not available")
+            for name in ("report.parquet", "notes.txt"):
+                db_conn.insert_row(
+                    "files",
+                    {
+                        "file_name": name,
+                        "original_file_location": "path",
+                        "created_on": datetime.now(),
+                    },
+                )
+            search = "select rowid from files_fts where file_name LIKE ?"
+            self.assertEqual(list(db_conn.query(search, ("%parq%",))), [(1,)])
+
+            db_conn.update_row("files", 1, {"file_name": "report.csv"})
+            self.assertEqual(list(db_conn.query(search, ("%parq%",))), [])
+            self.assertEqual(list(db_conn.query(search, ("%.csv",))), [(1,)])
+
+            db_conn.delete_file_record(1)
+            self.assertEqual(list(db_conn.query(search, ("%.csv",))), [])
+            self.assertEqual(list(db_conn.query(search, ("%t%",))), [(2,)])
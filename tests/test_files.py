@@ -1,17 +1,27 @@
+import io
 import os
 import shutil
 import sqlite3
 import tempfile
+import tracemalloc
 import unittest
+from datetime import datetime
 from unittest import mock
 
+from file_utils.chunkers import FastCDCChunker, FixedChunker
+from file_utils.compression import Compressor
+from file_utils.storage import PackStorage
 from file_utils.files import (
     delete_file_by_id,
+    delete_files,
     find_files,
     get_filepath,
     list_files,
+    list_snapshots,
     read_file_chunks,
+    reclaim_space,
     restore_file_by_id,
+    restore_files,
     store_files,
 )
 
@@ -21,6 +31,19 @@ def create_file(path, contents="empty"):
         file_w.write(contents)
 
 
+class BrokenReader(io.BytesIO):
+    """File whose reads fail past `limit` bytes"""
+
+    def __init__(self, data, limit) -> None:
+        super().__init__(data)
+        self.limit = limit
+
+    def readinto(self, buffer):
+        if self.tell() >= self.limit:
+            raise OSError("Input/output error")
+        return super().readinto(buffer)
+
+
 class TestGetFilePath(unittest.TestCase):
     def test_file_path(self):
         with tempfile.NamedTemporaryFile() as tmpfile:
@@ -91,10 +114,19 @@ class TestFileOperations(unittest.TestCase):
         ret = self.cur.execute("select * from files order by id asc").fetchall()
         self.assertEqual(len(ret), 2)
 
-        self.assertEqual(len(ret[0]), 4)
+        self.assertEqual(len(ret[0]), 12)
         self.assertEqual(1, ret[0][0])
         self.assertEqual(self.files_folder, ret[0][1])
         self.assertEqual("one.txt", ret[0][2])
+        file_stat = os.stat(self.files[0])
+        self.assertEqual(
+            (3, file_stat.st_mtime_ns, file_stat.st_ino), tuple(ret[0][4:7])
+        )
+        self.assertEqual(
+            "7692c3ad3540bb803c020b3aee66cd8887123234ea0c6e7143c0add73ff431ed",
+            ret[0][7],
+        )
+        self.assertEqual(1, ret[0][8])
 
         self.assertEqual(2, ret[1][0])
         self.assertEqual(self.files_folder, ret[1][1])
@@ -102,7 +134,8 @@ class TestFileOperations(unittest.TestCase):
 
     def test_store_files_chunks(self):
         ret = self.cur.execute(
-            "select * from file_chunks order by file_id asc"
+            "select fc.file_id, fc.chunk_id, c.chunk from file_chunks as fc "
+            "join chunks as c on c.hash = fc.chunk_hash order by fc.file_id asc"
         ).fetchall()
         self.assertEqual(len(ret), 2)
 
@@ -117,6 +150,387 @@ class TestFileOperations(unittest.TestCase):
         self.assertEqual(second_row[1], 1)
         self.assertEqual(second_row[2], b"two")
 
+    def test_store_files_dedup(self):
+        copy_folder = f"{self.tmp_dir}/copy"
+        os.mkdir(copy_folder)
+        create_file(f"{copy_folder}/one.txt", "one")
+        create_file(f"{copy_folder}/three.txt", "three")
+
+        stats = store_files(self.db_path, [copy_folder])
+        self.assertEqual(stats.files, 2)
+        self.assertEqual(stats.bytes_read, 8)
+        self.assertEqual(stats.bytes_stored, 5)
+        self.assertAlmostEqual(stats.dedup_ratio, 1.6)
+
+        ret = self.cur.execute(
+            "select ref_count from chunks where chunk = ?", (b"one",)
+        ).fetchall()
+        self.assertEqual(ret, [(2,)])
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.mkdir(restore_location)
+        copy_id = self.cur.execute(
+            "select id from files where original_file_location = ? "
+            "and file_name = 'one.txt'",
+            (copy_folder,),
+        ).fetchone()[0]
+        restore_file_by_id(self.db_path, copy_id, restore_location)
+        with open(f"{restore_location}/one.txt", "rb") as reader:
+            self.assertEqual(reader.read(), b"one")
+
+        delete_file_by_id(self.db_path, 1)
+        ret = self.cur.execute(
+            "select ref_count from chunks where chunk = ?", (b"one",)
+        ).fetchall()
+        self.assertEqual(ret, [(1,)])
+
+        delete_file_by_id(self.db_path, copy_id)
+        ret = self.cur.execute(
+            "select ref_count from chunks where chunk = ?", (b"one",)
+        ).fetchall()
+        self.assertEqual(ret, [])
+
+    def test_store_files_bulk(self):
+        bulk_folder = f"{self.tmp_dir}/bulk"
+        os.mkdir(bulk_folder)
+        for index in range(5):
+            create_file(f"{bulk_folder}/{index}.txt", f"bulk {index}")
+
+        stats = store_files(self.db_path, [bulk_folder], bulk=True, batch_rows=4)
+        self.assertEqual(stats.files, 5)
+
+        ret = self.cur.execute(
+            "select count(*) from files where original_file_location = ?",
+            (bulk_folder,),
+        ).fetchone()
+        self.assertEqual(ret, (5,))
+        ret = self.cur.execute("select count(*) from file_chunks").fetchone()
+        self.assertEqual(ret, (7,))
+
+    def test_store_files_inline(self):
+        inline_folder = f"{self.tmp_dir}/inline"
+        os.mkdir(inline_folder)
+        for index in range(5):
+            create_file(f"{inline_folder}/{index}.txt", f"small {index} " * 10)
+        create_file(f"{inline_folder}/empty.txt", "")
+        create_file(f"{inline_folder}/large.txt", "large " * 1000)
+
+        with mock.patch("file_utils.files.INLINE_BATCH", 2):
+            stats = store_files(
+                self.db_path,
+                [inline_folder],
+                chunker=FixedChunker(1024),
+                compression=Compressor("zlib", min_savings=0),
+                inline_size=1024,
+            )
+        self.assertEqual(stats.files, 7)
+        ret = self.cur.execute(
+            "select f.file_name, f.chunk_count, f.content, count(fc.file_id) "
+            "from files as f left join file_chunks as fc on fc.file_id = f.id "
+            "where f.original_file_location = ? group by f.id order by f.file_name",
+            (inline_folder,),
+        ).fetchall()
+        self.assertEqual(
+            ret[:2],
+            [("0.txt", 0, b"small 0 " * 10, 0), ("1.txt", 0, b"small 1 " * 10, 0)],
+        )
+        self.assertEqual(ret[5], ("empty.txt", 0, b"", 0))
+        self.assertEqual(ret[6], ("large.txt", 6, None, 6))
+
+        stats = store_files(self.db_path, [inline_folder], inline_size=1024)
+        self.assertEqual(stats.files, 0)
+        create_file(f"{inline_folder}/0.txt", "changed")
+        stats = store_files(
+            self.db_path, [inline_folder], incremental=True, inline_size=1024
+        )
+        self.assertEqual((stats.files, stats.updated), (1, 1))
+
+        file_id, size_mb = self.cur.execute(
+            "select id, file_size_mb from v_files "
+            "where file_name = '0.txt' and replaced_in is null"
+        ).fetchone()
+        self.assertEqual(size_mb, 7 / 1000000.0)
+        restore_folder = f"{self.tmp_dir}/restored"
+        os.mkdir(restore_folder)
+        restore_file_by_id(self.db_path, file_id, restore_folder)
+        with open(f"{restore_folder}/0.txt", "rb") as reader:
+            self.assertEqual(reader.read(), b"changed")
+        delete_file_by_id(self.db_path, file_id)
+        self.assertIsNone(
+            self.cur.execute("select id from files where id = ?", (file_id,)).fetchone()
+        )
+
+    def test_store_files_incremental_chunk_size(self):
+        big_file = f"{self.files_folder}/big.bin"
+        with open(big_file, "wb") as writer:
+            writer.write(os.urandom(5000))
+        store_files(self.db_path, [big_file], chunker=FixedChunker(1000))
+        os.utime(big_file, ns=(0, 0))
+
+        stats = store_files(
+            self.db_path, [big_file], incremental=True, chunker=FixedChunker(700)
+        )
+        self.assertEqual((stats.files, stats.updated, stats.unchanged), (0, 0, 1))
+        ret = self.cur.execute(
+            "select count(*), sum(ref_count = 0) from chunks"
+        ).fetchone()
+        self.assertEqual(ret, (7, 0))
+
+    def test_store_files_inline_transitions(self):
+        grown_file = f"{self.files_folder}/grown.bin"
+        contents = [b"small" * 10, os.urandom(3000), b"small again"]
+        stored = []
+        for index, data in enumerate(contents):
+            with open(grown_file, "wb") as writer:
+                writer.write(data)
+            stats = store_files(
+                self.db_path,
+                [grown_file],
+                incremental=True,
+                chunker=FixedChunker(1000),
+                inline_size=1024,
+            )
+            stored.append((stats.files, stats.updated))
+            ret = self.cur.execute(
+                "select id, chunk_count from files "
+                "where file_name = 'grown.bin' and replaced_in is null"
+            ).fetchall()
+            self.assertEqual(len(ret), 1)
+            restore_folder = f"{self.tmp_dir}/restored{index}"
+            os.mkdir(restore_folder)
+            restore_file_by_id(self.db_path, ret[0][0], restore_folder)
+            with open(f"{restore_folder}/grown.bin", "rb") as reader:
+                self.assertEqual(reader.read(), data)
+        self.assertEqual(stored, [(1, 0), (1, 1), (1, 1)])
+        self.assertEqual(ret[0][1], 0)
+        self.assertEqual(
+            self.cur.execute(
+                "select count(*), sum(ref_count = 0) from chunks"
+            ).fetchone(),
+            (5, 0),
+        )
+
+    def test_store_files_failed_update(self):
+        create_file(f"{self.files_folder}/one.txt", "changed")
+        with mock.patch(
+            "file_utils.db_managers.SQLiteDBManager.insert_row", return_value=None
+        ):
+            for inline_size in (0, 1024):
+                stats = store_files(
+                    self.db_path,
+                    [self.files_folder],
+                    incremental=True,
+                    inline_size=inline_size,
+                )
+                self.assertEqual((stats.files, stats.updated), (0, 0))
+        ret = self.cur.execute(
+            "select count(*) from files where file_name = 'one.txt' "
+            "and replaced_in is null"
+        ).fetchone()
+        self.assertEqual(ret, (1,))
+
+    def test_store_files_workers(self):
+        tree_folder = f"{self.tmp_dir}/tree"
+        os.makedirs(f"{tree_folder}/sub")
+        for index in range(10):
+            create_file(f"{tree_folder}/sub/{index}.txt", f"content {index % 3}")
+
+        stats = store_files(self.db_path, [tree_folder], workers=4, queue_depth=2)
+        self.assertEqual(stats.files, 10)
+        self.assertEqual(stats.new_chunks, 3)
+
+        stats = store_files(self.db_path, [tree_folder], workers=4)
+        self.assertEqual(stats.files, 0)
+
+        ret = self.cur.execute(
+            "select count(*) from v_files where original_file_location = ?",
+            (f"{tree_folder}/sub",),
+        ).fetchone()
+        self.assertEqual(ret, (10,))
+
+    def test_store_files_incremental(self):
+        stats = store_files(self.db_path, [self.files_folder])
+        self.assertEqual((stats.files, stats.unchanged), (0, 0))
+
+        stats = store_files(self.db_path, [self.files_folder], incremental=True)
+        self.assertEqual((stats.files, stats.unchanged, stats.chunks), (0, 2, 0))
+
+        create_file(self.files[1], "two changed")
+        create_file(f"{self.files_folder}/three.txt", "three")
+        os.utime(self.files[0], ns=(0, 0))
+
+        stats = store_files(self.db_path, [self.files_folder], incremental=True)
+        # one.txt is read again for its new mtime only
+        self.assertEqual((stats.files, stats.updated, stats.unchanged), (2, 1, 1))
+        self.assertEqual(stats.bytes_stored, len("two changed") + len("three"))
+
+        stats = store_files(self.db_path, [self.files_folder], incremental=True)
+        self.assertEqual((stats.files, stats.unchanged), (0, 3))
+
+        ret = self.cur.execute(
+            "select id, size, chunk_count, snapshot_id, replaced_in from files "
+            "order by id"
+        ).fetchall()
+        self.assertEqual(
+            ret,
+            [
+                (1, 3, 1, 1, None),
+                (2, 3, 1, 1, 4),
+                (3, 5, 1, 4, None),
+                (4, 11, 1, 4, None),
+            ],
+        )
+        ret = self.cur.execute("select chunk from chunks order by chunk").fetchall()
+        self.assertEqual(ret, [(b"one",), (b"three",), (b"two",), (b"two changed",)])
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.mkdir(restore_location)
+        restore_file_by_id(self.db_path, 4, restore_location)
+        with open(f"{restore_location}/two.txt", "rb") as reader:
+            self.assertEqual(reader.read(), b"two changed")
+
+    def test_store_files_chunker_metadata(self):
+        ret = self.cur.execute(
+            "select value from metadata where key = 'chunker'"
+        ).fetchone()
+        self.assertEqual(
+            ret, ('{"name": "fixed", "params": {"chunk_size": 10485760}}',)
+        )
+
+        cdc_db = f"{self.db_folder}/cdc.db"
+        big_file = f"{self.files_folder}/big.bin"
+        with open(big_file, "wb") as writer:
+            writer.write(os.urandom(50000))
+        store_files(cdc_db, [big_file], chunker=FastCDCChunker(1024, 4096, 16384))
+        with mock.patch.object(
+            FastCDCChunker,
+            "read_file",
+            autospec=True,
+            side_effect=FastCDCChunker.read_file,
+        ) as read_file, mock.patch.object(FixedChunker, "read_file") as fixed_read:
+            store_files(cdc_db, [self.files_folder])
+            self.assertEqual(read_file.call_count, 2)
+            fixed_read.assert_not_called()
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.mkdir(restore_location)
+        restore_file_by_id(cdc_db, 1, restore_location)
+        with open(big_file, "rb") as original, open(
+            f"{restore_location}/big.bin", "rb"
+        ) as restored:
+            self.assertEqual(original.read(), restored.read())
+
+    def test_store_files_read_error(self):
+        broken_file = f"{self.files_folder}/broken.bin"
+        with open(broken_file, "wb") as writer:
+            writer.write(b"one" + os.urandom(4000))
+
+        def opener(path):
+            if path == broken_file:
+                with open(path, "rb") as reader:
+                    return BrokenReader(reader.read(), 3072)
+            return open(path, "rb")
+
+        chunks = self.cur.execute("select hash from chunks").fetchall()
+        stats = store_files(
+            self.db_path, [broken_file], chunker=FixedChunker(3), opener=opener
+        )
+        self.assertEqual(stats.files, 0)
+        # the chunk shared with one.txt is kept, those of the broken file are not
+        self.assertEqual(self.cur.execute("select hash from chunks").fetchall(), chunks)
+        self.assertEqual(
+            self.cur.execute(
+                "select count(*) from files where file_name = 'broken.bin'"
+            ).fetchone(),
+            (0,),
+        )
+
+    def test_store_files_compression(self):
+        log_file = f"{self.files_folder}/app.log"
+        media_file = f"{self.files_folder}/media.bin"
+        create_file(log_file, "GET /index.html 200\n" * 1000)
+        with open(media_file, "wb") as writer:
+            writer.write(os.urandom(5000))
+
+        stats = store_files(
+            self.db_path, [log_file, media_file], compression=Compressor("lzma")
+        )
+        self.assertEqual(stats.bytes_stored, 25000)
+        self.assertGreater(stats.compression_ratio, 2)
+
+        ret = self.cur.execute(
+            "select codec, size, length(chunk) < size from chunks order by id"
+        ).fetchall()
+        self.assertEqual(ret[2:], [("lzma", 20000, 1), ("raw", 5000, 0)])
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.mkdir(restore_location)
+        restore_file_by_id(self.db_path, 3, restore_location)
+        with open(f"{restore_location}/app.log", "r", encoding="utf-8") as reader:
+            self.assertEqual(reader.read(), "GET /index.html 200\n" * 1000)
+
+        ret = self.cur.execute("select file_size_mb from v_files where id = 3")
+        self.assertEqual(ret.fetchone(), (0.02,))
+
+    def test_store_files_pack_storage(self):
+        pack_db = f"{self.db_folder}/packed.db"
+        big_file = f"{self.files_folder}/big.bin"
+        with open(big_file, "wb") as writer:
+            writer.write(os.urandom(300000))
+        create_file(f"{self.files_folder}/copy.txt", "one")
+        store_files(
+            pack_db,
+            [self.files_folder],
+            chunker=FixedChunker(100000),
+            compression=Compressor("zlib"),
+            storage=PackStorage(150000),
+        )
+
+        conn = sqlite3.connect(pack_db)
+        ret = conn.execute(
+            "select count(*), count(chunk), count(distinct pack_id) from chunks"
+        ).fetchone()
+        self.assertEqual(ret, (5, 0, 3))
+        ret = conn.execute("select value from metadata where key = 'storage'")
+        self.assertEqual(
+            ret.fetchone(), ('{"name": "pack", "params": {"pack_size": 150000}}',)
+        )
+        conn.close()
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        restored = restore_files(pack_db, restore_location, pattern="*")
+        self.assertEqual(len(restored), 4)
+        with open(big_file, "rb") as original, open(
+            f"{restore_location}{big_file}", "rb"
+        ) as copy:
+            self.assertEqual(original.read(), copy.read())
+
+        store_files(pack_db, [f"{self.tmp_dir}/database/database.db"])
+        conn = sqlite3.connect(pack_db)
+        ret = conn.execute("select count(chunk) from chunks").fetchone()
+        self.assertEqual(ret, (0,))
+        conn.close()
+
+    def test_restore_file_streaming(self):
+        big_file = f"{self.files_folder}/big.bin"
+        with open(big_file, "wb") as writer:
+            writer.write(os.urandom(4 * 1048576))
+        store_files(self.db_path, [big_file], chunker=FixedChunker(262144))
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.mkdir(restore_location)
+        tracemalloc.start()
+        try:
+            restore_file_by_id(self.db_path, 3, restore_location)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1048576)
+        with open(big_file, "rb") as original, open(
+            f"{restore_location}/big.bin", "rb"
+        ) as restored:
+            self.assertEqual(original.read(), restored.read())
+
     def test_restore_file_by_id(self):
         restore_location = f"{self.tmp_dir}/restored_files"
         os.mkdir(restore_location)
@@ -147,6 +561,23 @@ class TestFileOperations(unittest.TestCase):
         _ = list_files(self.db_path, result_handler)
         result_handler.get_all.assert_called_once()
 
+    def test_list_files_empty_file(self):
+        empty_file = f"{self.files_folder}/empty.txt"
+        create_file(empty_file, "")
+        store_files(self.db_path, [empty_file])
+
+        ret = self.cur.execute(
+            "select file_name, file_size_mb from v_files order by id"
+        ).fetchall()
+        self.assertEqual(ret[2], ("empty.txt", 0.0))
+        ret = self.cur.execute(
+            "select chunk_count, checksum from files where id = 3"
+        ).fetchone()
+        self.assertEqual(
+            ret,
+            (0, "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"),
+        )
+
     def test_find_files(self):
         result_handler = mock.Mock()
         with self.assertRaisesRegex(FileNotFoundError, "DB file none does not exists"):
@@ -172,6 +603,102 @@ class TestFileOperations(unittest.TestCase):
         ret = find_files(self.db_path, "n*", TestingHandler)
         self.assertEqual(len(ret), 0)
 
+    def test_find_files_location(self):
+        nested = f"{self.files_folder}/data/2022"
+        os.makedirs(nested)
+        create_file(f"{nested}/report.parquet", "report")
+        create_file(f"{self.files_folder}_other.txt", "other")
+        store_files(self.db_path, [nested, f"{self.files_folder}_other.txt"])
+
+        class TestingHandler:
+            @staticmethod
+            def get_all(data):
+                return sorted(row[2] for row in data)
+
+        for search_index in (True, False):
+            with mock.patch(
+                "file_utils.db_managers.SQLiteDBManager._setup_search_index",
+                autospec=True,
+                side_effect=lambda db_conn, enabled=search_index: setattr(
+                    db_conn, "search_index", enabled
+                ),
+            ):
+                ret = find_files(self.db_path, "*.PARQUET", TestingHandler)
+                self.assertEqual(ret, ["report.parquet"])
+                ret = find_files(self.db_path, "*wo*", TestingHandler)
+                self.assertEqual(ret, ["two.txt"])
+                ret = find_files(
+                    self.db_path, None, TestingHandler, location=self.files_folder
+                )
+                self.assertEqual(ret, ["one.txt", "report.parquet", "two.txt"])
+                ret = find_files(
+                    self.db_path, "*t*", TestingHandler, location="*/data/*"
+                )
+                self.assertEqual(ret, ["report.parquet"])
+
+    def test_list_files_pagination(self):
+        for name in ("a.txt", "c.txt", "b.txt"):
+            create_file(f"{self.files_folder}/{name}", name)
+        store_files(self.db_path, [self.files_folder])
+
+        class TestingHandler:
+            @staticmethod
+            def get_all(data):
+                return [row[2] for row in data]
+
+        ret = list_files(self.db_path, TestingHandler)
+        self.assertEqual(ret, ["a.txt", "b.txt", "c.txt", "one.txt", "two.txt"])
+        ret = list_files(self.db_path, TestingHandler, limit=2, offset=1)
+        self.assertEqual(ret, ["b.txt", "c.txt"])
+
+        b_id = self.cur.execute(
+            "select id from files where file_name = 'b.txt'"
+        ).fetchone()[0]
+        ret = list_files(self.db_path, TestingHandler, limit=2, after_id=b_id)
+        self.assertEqual(ret, ["c.txt", "one.txt"])
+
+        ret = find_files(self.db_path, "*.txt", TestingHandler, limit=2, offset=2)
+        self.assertEqual(ret, ["c.txt", "one.txt"])
+        ret = find_files(self.db_path, "*t*", TestingHandler, after_id=b_id)
+        self.assertEqual(ret, ["c.txt", "one.txt", "two.txt"])
+
+    def test_snapshots(self):
+        class TestingHandler:
+            @staticmethod
+            def get_all(data):
+                return [(row[2], row[0]) for row in data]
+
+        create_file(self.files[1], "two changed")
+        create_file(f"{self.files_folder}/three.txt", "three")
+        store_files(self.db_path, [self.files_folder], incremental=True)
+
+        snapshots = list_snapshots(self.db_path)
+        self.assertEqual([row[0] for row in snapshots], [1, 2])
+        current = [("one.txt", 1), ("three.txt", 3), ("two.txt", 4)]
+        self.assertEqual(list_files(self.db_path, TestingHandler), current)
+        self.assertEqual(
+            list_files(self.db_path, TestingHandler, snapshot_id=2), current
+        )
+        first = [("one.txt", 1), ("two.txt", 2)]
+        self.assertEqual(list_files(self.db_path, TestingHandler, snapshot_id=1), first)
+        ret = list_files(self.db_path, TestingHandler, at=snapshots[0][1])
+        self.assertEqual(ret, first)
+        ret = list_files(self.db_path, TestingHandler, at=datetime(2000, 1, 1))
+        self.assertEqual(ret, [])
+        ret = find_files(self.db_path, "two", TestingHandler, snapshot_id=1)
+        self.assertEqual(ret, [("two.txt", 2)])
+
+        restore_location = f"{self.tmp_dir}/restored_files"
+        restore_files(self.db_path, restore_location, pattern="two", snapshot_id=1)
+        with open(f"{restore_location}{self.files[1]}", "rb") as reader:
+            self.assertEqual(reader.read(), b"two")
+        restore_files(self.db_path, restore_location, pattern="t*")
+        with open(f"{restore_location}{self.files[1]}", "rb") as reader:
+            self.assertEqual(reader.read(), b"two changed")
+        self.assertTrue(
+            os.path.isfile(f"{restore_location}{self.files_folder}/three.txt")
+        )
+
     def test_delete_file(self):
         with self.assertRaisesRegex(FileNotFoundError, "DB file none does not exists"):
             delete_file_by_id("none", 10)
@@ -183,6 +710,151 @@ class TestFileOperations(unittest.TestCase):
             self.cur.execute("select id from files where id = 1").fetchone()
         )
 
+    def test_restore_files(self):
+        nested = f"{self.files_folder}/nested/deep"
+        os.makedirs(nested)
+        create_file(f"{nested}/three.txt", "three")
+        create_file(f"{self.files_folder}/nested/four.log", "four")
+        store_files(self.db_path, [f"{self.files_folder}/nested"])
+        restore_location = f"{self.tmp_dir}/restored_files"
+
+        with self.assertRaisesRegex(FileNotFoundError, "DB file none does not exists"):
+            restore_files("none", restore_location, pattern="*")
+
+        restored = restore_files(
+            self.db_path, restore_location, location=f"{self.files_folder}/nested"
+        )
+        base = f"{restore_location}{self.files_folder}"
+        self.assertEqual(
+            sorted(restored),
+            [f"{base}/nested/deep/three.txt", f"{base}/nested/four.log"],
+        )
+        with open(f"{base}/nested/deep/three.txt", "r", encoding="utf-8") as reader:
+            self.assertEqual(reader.read(), "three")
+        self.assertEqual(
+            os.stat(f"{base}/nested/four.log").st_mtime_ns,
+            os.stat(f"{self.files_folder}/nested/four.log").st_mtime_ns,
+        )
+
+        shutil.rmtree(restore_location)
+        restored = restore_files(self.db_path, restore_location, pattern="*.txt")
+        self.assertEqual(len(restored), 3)
+        self.assertFalse(os.path.exists(f"{base}/nested/four.log"))
+
+        shutil.rmtree(restore_location)
+        restored = restore_files(
+            self.db_path, restore_location, file_ids=[1, 4], pattern="t*", workers=1
+        )
+        self.assertEqual(restored, [f"{base}/nested/deep/three.txt"])
+
+    def test_restore_files_location_prefix(self):
+        sibling = f"{self.files_folder}_other"
+        os.mkdir(sibling)
+        create_file(f"{sibling}/one.txt", "other")
+        store_files(self.db_path, [sibling])
+        restore_location = f"{self.tmp_dir}/restored_files"
+
+        restored = restore_files(
+            self.db_path, restore_location, location=f"{self.files_folder}/"
+        )
+        self.assertEqual(len(restored), 2)
+        self.assertFalse(os.path.exists(f"{restore_location}{sibling}"))
+
+    def test_restore_files_failures(self):
+        restore_location = f"{self.tmp_dir}/restored_files"
+        os.makedirs(f"{restore_location}{self.files_folder}/one.txt")
+        with self.assertRaisesRegex(
+            RuntimeError, "1 file\\(s\\) could not be restored"
+        ):
+            restore_files(self.db_path, restore_location, pattern="*")
+        self.assertTrue(
+            os.path.isfile(f"{restore_location}{self.files_folder}/two.txt")
+        )
+
+        shutil.rmtree(restore_location)
+        self.cur.execute("update chunks set codec = 'zlib'")
+        self.conn.commit()
+        with self.assertRaisesRegex(
+            RuntimeError, "2 file\\(s\\) could not be restored"
+        ):
+            restore_files(self.db_path, restore_location, pattern="*")
+        self.assertEqual(os.listdir(f"{restore_location}{self.files_folder}"), [])
+
+        with mock.patch("file_utils.files._restore_worker"), self.assertRaisesRegex(
+            RuntimeError, "2 file\\(s\\) could not be restored"
+        ):
+            restore_files(self.db_path, restore_location, pattern="*")
+
+    def test_delete_files(self):
+        nested = f"{self.files_folder}/nested"
+        os.mkdir(nested)
+        create_file(f"{nested}/three.txt", "three")
+        create_file(f"{nested}/four.log", "four")
+        create_file(f"{nested}/five.txt", "five")
+        store_files(self.db_path, [nested])
+        create_file(self.files[1], "two changed")
+        store_files(self.db_path, [self.files[1]], incremental=True)
+        # one.txt is old but current, the first two.txt was replaced long ago
+        self.cur.execute("update files set created_on = '2000-01-01' where id < 3")
+        self.cur.execute("update snapshots set created_on = '2000-01-01'")
+        self.cur.execute("update snapshots set created_on = '2021-01-01' where id = 2")
+        self.conn.commit()
+
+        with self.assertRaisesRegex(ValueError, "selection criteria"):
+            delete_files(self.db_path)
+        self.assertEqual(delete_files(self.db_path, pattern="*.log"), 1)
+        self.assertEqual(delete_files(self.db_path, location=nested, pattern="th"), 1)
+        self.assertEqual(
+            delete_files(self.db_path, replaced_before=datetime(2020, 1, 1)), 1
+        )
+        ret = self.cur.execute("select id, file_name from files order by id").fetchall()
+        self.assertEqual(ret, [(1, "one.txt"), (5, "five.txt"), (6, "two.txt")])
+        self.assertEqual(
+            delete_files(self.db_path, replaced_before=datetime(2030, 1, 1)), 0
+        )
+        self.assertEqual(delete_files(self.db_path, file_ids=[2, 5]), 1)
+        # created_before also selects current versions
+        self.assertEqual(
+            delete_files(self.db_path, created_before=datetime(2020, 1, 1)), 1
+        )
+        ret = self.cur.execute("select file_name from files order by id").fetchall()
+        self.assertEqual(ret, [("two.txt",)])
+        ret = self.cur.execute("select count(*) from chunks").fetchone()
+        self.assertEqual(ret, (1,))
+
+    def test_reclaim_space(self):
+        big_db = f"{self.db_folder}/big.db"
+        for index in range(3):
+            with open(f"{self.files_folder}/big{index}.bin", "wb") as writer:
+                writer.write(os.urandom(200000))
+        store_files(big_db, [self.files_folder], chunker=FixedChunker(10000))
+        size = os.path.getsize(big_db)
+        delete_files(big_db, pattern="big")
+
+        page_size = sqlite3.connect(big_db).execute("PRAGMA page_size").fetchone()
+        self.assertEqual(reclaim_space(big_db, max_pages=1), page_size[0])
+        self.assertGreater(reclaim_space(big_db, max_pages=None), 500000)
+        self.assertLess(os.path.getsize(big_db), size - 500000)
+        self.assertEqual(reclaim_space(big_db), 0)
+
+    def test_reclaim_space_packs(self):
+        pack_db = f"{self.db_folder}/packed.db"
+        for index in range(3):
+            with open(f"{self.files_folder}/big{index}.bin", "wb") as writer:
+                writer.write(os.urandom(100000))
+        store_files(
+            pack_db,
+            [self.files_folder],
+            chunker=FixedChunker(100000),
+            storage=PackStorage(150000),
+        )
+        self.assertEqual(len(os.listdir(f"{pack_db}.packs")), 3)
+        delete_files(pack_db, pattern="big0")
+        self.assertGreaterEqual(reclaim_space(pack_db), 100000)
+        self.assertEqual(len(os.listdir(f"{pack_db}.packs")), 2)
+        restored = restore_files(pack_db, f"{self.tmp_dir}/restored", pattern="*")
+        self.assertEqual(len(restored), 4)
+
 
 class TestBrokenLink(unittest.TestCase):
     def setUp(self) -> None:
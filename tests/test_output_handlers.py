@@ -1,6 +1,16 @@
+import io
+import json
 from unittest import TestCase
 
-from file_utils import AsJSON, AsTable, Generic
+from file_utils import (
+    AsCSV,
+    AsJSON,
+    AsJSONStream,
+    AsNDJSON,
+    AsPagedTable,
+    AsTable,
+    Generic,
+)
 
 
 class TestOutputHandlers(TestCase):
@@ -28,3 +38,56 @@ class TestOutputHandlers(TestCase):
     def test_generic(self):
         ret = Generic.get_all(self.data)
         self.assertEqual("", ret)
+
+
+class TestStreamingOutputHandlers(TestCase):
+    def setUp(self) -> None:
+        self.data = [
+            (1, "/path", "one.txt", "2022-01-01", 0.5),
+            (2, "/path", "two.txt", "2022-01-02", 1.5),
+            (3, "/other", "three.txt", "2022-01-03", 2.5),
+        ]
+        self.stream = io.StringIO()
+
+    def test_ndjson(self):
+        ret = AsNDJSON(self.stream).get_all(iter(self.data))
+        self.assertEqual(ret, "")
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            json.loads(lines[2]),
+            {
+                "id": 3,
+                "file_path": "/other/three.txt",
+                "created": "2022-01-03",
+                "file_size_mb": 2.5,
+            },
+        )
+
+    def test_json_stream(self):
+        AsJSONStream(self.stream).get_all(iter(self.data))
+        self.assertEqual(self.stream.getvalue(), AsJSON.get_all(self.data))
+
+        stream = io.StringIO()
+        AsJSONStream(stream).get_all(iter([]))
+        self.assertEqual(json.loads(stream.getvalue()), [])
+
+    def test_csv(self):
+        AsCSV(self.stream).get_all(iter(self.data))
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(
+            lines[0], "Id,original file path,file name,created on,file size (MB)"
+        )
+        self.assertEqual(lines[1], "1,/path,one.txt,2022-01-01,0.5")
+        self.assertEqual(len(lines), 4)
+
+    def test_paged_table(self):
+        def rows():
+            yield from self.data[:2]
+            self.assertIn("two.txt", self.stream.getvalue())
+            yield self.data[2]
+
+        AsPagedTable(self.stream, page_size=2).get_all(rows())
+        output = self.stream.getvalue()
+        self.assertEqual(output.count("file name"), 2)
+        self.assertIn("three.txt", output)
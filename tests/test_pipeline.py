@@ -0,0 +1,118 @@
+import functools
+import os
+import shutil
+import tempfile
+import unittest
+
+from file_utils.chunkers import BufferPool, FixedChunker
+from file_utils.pipeline import (
+    FILE_CHUNK,
+    FILE_END,
+    FILE_ERROR,
+    FILE_START,
+    chunk_hash,
+    iter_file_events,
+)
+
+
+def read_two_byte_chunks(file_path):
+    with open(file_path, "rb") as reader:
+        chunk = True
+        while chunk:
+            chunk = reader.read(2)
+            yield chunk
+
+
+class TestIterFileEvents(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for index in range(6):
+            file_name = f"{index}.txt"
+            with open(f"{self.tmp_dir}/{file_name}", "wb") as writer:
+                writer.write(b"x" * index)
+            self.paths.append((self.tmp_dir, file_name))
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def collect(self, workers, skip=()):
+        chunks = {}
+        ended = []
+        for event, task, chunk in iter_file_events(
+            self.paths, read_two_byte_chunks, workers=workers, queue_depth=2
+        ):
+            if event == FILE_START:
+                task.skip = task.file_name in skip
+            elif event == FILE_CHUNK:
+                self.assertEqual(chunk.digest, chunk_hash(chunk.data))
+                self.assertEqual(chunk.codec, "raw")
+                chunks.setdefault(task.file_name, []).append((chunk.index, chunk.data))
+            elif event == FILE_END:
+                ended.append(task.file_name)
+        return chunks, sorted(ended)
+
+    def test_serial(self):
+        chunks, ended = self.collect(workers=0, skip=("3.txt",))
+        self.assertEqual(ended, ["0.txt", "1.txt", "2.txt", "4.txt", "5.txt"])
+        self.assertNotIn("0.txt", chunks)
+        self.assertEqual(chunks["5.txt"], [(1, b"xx"), (2, b"xx"), (3, b"x")])
+
+    def test_threaded(self):
+        serial = self.collect(workers=0, skip=("3.txt",))
+        threaded = self.collect(workers=3, skip=("3.txt",))
+        self.assertEqual(serial, threaded)
+
+    def test_read_error(self):
+        self.paths.append((self.tmp_dir, "missing.txt"))
+        for workers in (0, 2):
+            errors = [
+                task.file_name
+                for event, task, _ in iter_file_events(
+                    self.paths, read_two_byte_chunks, workers=workers
+                )
+                if event == FILE_ERROR
+            ]
+            self.assertEqual(errors, ["missing.txt"])
+
+    def test_encode(self):
+        encoded = [
+            chunk
+            for event, _, chunk in iter_file_events(
+                self.paths[5:],
+                read_two_byte_chunks,
+                encode=lambda data: ("upper", data.upper()),
+            )
+            if event == FILE_CHUNK
+        ]
+        self.assertEqual(
+            [(chunk.size, chunk.data, chunk.codec) for chunk in encoded],
+            [(2, b"XX", "upper"), (2, b"XX", "upper"), (1, b"X", "upper")],
+        )
+        self.assertEqual(encoded[2].digest, chunk_hash(b"x"))
+
+    def test_release_buffers(self):
+        for workers in (0, 2):
+            buffers = BufferPool()
+            chunks = {}
+            seen = set()
+            for event, task, chunk in iter_file_events(
+                self.paths,
+                functools.partial(FixedChunker(2).read_file, buffers=buffers),
+                workers=workers,
+                queue_depth=2,
+                release=buffers.release,
+            ):
+                if event == FILE_CHUNK:
+                    seen.add(id(chunk.data.obj))
+                    chunks.setdefault(task.file_name, []).append(bytes(chunk.data))
+            self.assertEqual(chunks["5.txt"], [b"xx", b"xx", b"x"])
+            self.assertEqual(sum(map(len, chunks["4.txt"])), 4)
+            # queued chunks, one per reader and the one being handled
+            self.assertLessEqual(len(seen), 2 + workers + 1)
+
+    def test_consumer_stops_early(self):
+        events = iter_file_events(self.paths, read_two_byte_chunks, workers=2)
+        self.assertEqual(next(events)[0], FILE_START)
+        events.close()
@@ -0,0 +1,155 @@
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import TestCase, mock
+
+from file_utils.chunkers import FixedChunker
+from file_utils.compression import Compressor
+from file_utils.db_managers import SQLiteDBManager
+from file_utils.files import store_files
+from file_utils.reader import open_file
+from file_utils.storage import PackStorage
+
+
+class TestStoredFile(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.mkdir(self.files_folder)
+        self.content = random.Random(7).getrandbits(50000 * 8).to_bytes(50000, "big")
+        self.file_path = f"{self.files_folder}/data.bin"
+        with open(self.file_path, "wb") as writer:
+            writer.write(self.content)
+        self.db_path = f"{self.tmp_dir}/database.db"
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def store(self, **options):
+        store_files(
+            self.db_path, [self.files_folder], chunker=FixedChunker(4096), **options
+        )
+
+    def test_random_access(self):
+        for options in (
+            {},
+            {"compression": Compressor("zlib", min_savings=0)},
+            {"storage": PackStorage()},
+        ):
+            if os.path.isfile(self.db_path):
+                os.remove(self.db_path)
+            self.store(**options)
+            with open_file(self.db_path, 1) as stored:
+                self.assertEqual(stored.size, len(self.content))
+                self.assertEqual(stored.name, self.file_path)
+                self.assertTrue(stored.seekable() and stored.readable())
+                self.assertFalse(stored.writable())
+                for offset, length in ((0, 10), (4090, 20), (100, 20000), (49990, 50)):
+                    stored.seek(offset)
+                    self.assertEqual(
+                        stored.read(length), self.content[offset : offset + length]
+                    )
+                self.assertEqual(stored.tell(), len(self.content))
+                self.assertEqual(stored.read(10), b"")
+                stored.seek(-100, io.SEEK_END)
+                self.assertEqual(stored.read(), self.content[-100:])
+                stored.seek(0)
+                buffer = bytearray(5000)
+                self.assertEqual(stored.readinto(buffer), 5000)
+                self.assertEqual(bytes(buffer), self.content[:5000])
+                stored.seek(10, io.SEEK_CUR)
+                self.assertEqual(stored.read(5), self.content[5010:5015])
+                with self.assertRaisesRegex(ValueError, "Negative seek"):
+                    stored.seek(-1)
+            self.assertTrue(stored.closed)
+            with self.assertRaises(ValueError):
+                stored.read(1)
+
+    def test_chunk_cache(self):
+        self.store()
+        with open_file(self.db_path, 1, cache_size=8192) as stored, mock.patch.object(
+            SQLiteDBManager,
+            "iter_chunk",
+            autospec=True,
+            side_effect=SQLiteDBManager.iter_chunk,
+        ) as iter_chunk:
+            stored.seek(4000)
+            stored.read(5000)
+            self.assertEqual(iter_chunk.call_count, 3)
+            stored.seek(8192)
+            stored.read(100)
+            stored.seek(4100)
+            stored.read(10)
+            self.assertEqual(iter_chunk.call_count, 3)
+            stored.seek(0)
+            stored.read(10)
+            self.assertEqual(iter_chunk.call_count, 4)
+
+    def test_archives_in_place(self):
+        os.remove(self.file_path)
+        members = {"a.txt": b"alpha" * 3000, "b.bin": self.content}
+        with tarfile.open(f"{self.files_folder}/bundle.tar", "w") as archive:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        with zipfile.ZipFile(f"{self.files_folder}/bundle.zip", "w") as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+        self.store()
+
+        bundle = f"{self.files_folder}/bundle"
+        with open_file(self.db_path, path=f"{bundle}.tar") as stored:
+            with tarfile.open(fileobj=stored) as archive:
+                self.assertEqual(archive.extractfile("b.bin").read(), self.content)
+        with open_file(self.db_path, path=f"{bundle}.zip") as stored:
+            with zipfile.ZipFile(stored) as archive:
+                self.assertEqual(archive.read("a.txt"), members["a.txt"])
+
+    def test_open_versions(self):
+        self.store()
+        with open(self.file_path, "wb") as writer:
+            writer.write(b"changed")
+        self.store(incremental=True)
+
+        with open_file(self.db_path, path=self.file_path) as stored:
+            self.assertEqual(stored.read(), b"changed")
+        with open_file(self.db_path, path=self.file_path, snapshot_id=1) as stored:
+            self.assertEqual(stored.read(), self.content)
+
+    def test_inline(self):
+        small_path = f"{self.files_folder}/small.txt"
+        with open(small_path, "wb") as writer:
+            writer.write(b"0123456789")
+        self.store(inline_size=100)
+        with open_file(self.db_path, path=small_path) as stored:
+            self.assertEqual(stored.size, 10)
+            stored.seek(-4, io.SEEK_END)
+            self.assertEqual(stored.read(), b"6789")
+            stored.seek(20)
+            self.assertEqual(stored.read(), b"")
+
+    def test_errors(self):
+        with self.assertRaisesRegex(FileNotFoundError, "does not exists"):
+            open_file("none", 1)
+        self.store()
+        with self.assertRaisesRegex(ValueError, "file id or a path"):
+            open_file(self.db_path)
+        with self.assertRaisesRegex(ValueError, "file id or a path"):
+            open_file(self.db_path, 1, path=self.file_path)
+        with self.assertRaisesRegex(RuntimeError, "does not exists"):
+            open_file(self.db_path, 10)
+        with self.assertRaisesRegex(RuntimeError, "does not exist"):
+            open_file(self.db_path, path=f"{self.files_folder}/none")
+
+        with SQLiteDBManager(self.db_path) as db_conn:
+            db_conn.update_row("chunks", 2, {"chunk": b"short"})
+        with open_file(self.db_path, 1) as stored:
+            self.assertEqual(stored.read(4096), self.content[:4096])
+            with self.assertRaisesRegex(OSError, "Chunk 1 of file 1 decodes to 5"):
+                stored.read(10)
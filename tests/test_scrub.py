@@ -0,0 +1,148 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zlib
+from unittest import TestCase, mock
+
+from file_utils.chunkers import FixedChunker
+from file_utils.compression import Compressor
+from file_utils.db_managers import SQLiteDBManager
+from file_utils.files import store_files
+from file_utils.scrub import affected_files, scrub
+from file_utils.storage import PackStorage
+
+
+class TestScrub(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.mkdir(self.files_folder)
+        for index in range(4):
+            with open(f"{self.files_folder}/{index}.txt", "w", encoding="utf-8") as fp:
+                fp.write(f"file {index} " * 300)
+        self.db_path = f"{self.tmp_dir}/database.db"
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def store(self, **options):
+        store_files(
+            self.db_path,
+            [self.files_folder],
+            chunker=FixedChunker(1000),
+            compression=Compressor("zlib"),
+            **options,
+        )
+        conn = sqlite3.connect(self.db_path)
+        return conn
+
+    def test_clean(self):
+        self.store().close()
+        report = scrub(self.db_path, workers=2, batch_size=2)
+        self.assertTrue(report.clean)
+        self.assertTrue(report.completed)
+        self.assertEqual(report.chunks, 12)
+
+    def test_corrupt_and_missing(self):
+        conn = self.store()
+        hashes = [row[0] for row in conn.execute("select hash from chunks order by id")]
+        conn.execute(
+            "update chunks set chunk = ? where hash = ?",
+            (zlib.compress(b"other content"), hashes[0]),
+        )
+        conn.execute("update chunks set chunk = X'00' where hash = ?", (hashes[1],))
+        conn.execute("update chunks set chunk = NULL where hash = ?", (hashes[2],))
+        conn.execute("update files set chunk_count = 7 where id = 4")
+        conn.commit()
+        conn.close()
+
+        report = scrub(self.db_path, workers=3, batch_size=1)
+        self.assertEqual(report.corrupt, hashes[:2])
+        self.assertEqual(report.missing, hashes[2:3])
+        self.assertEqual(report.mismatched_files, [4])
+        damaged = sorted(row[0] for row in affected_files(self.db_path, hashes[:3]))
+        self.assertEqual(damaged, [1, 1, 1])
+
+    def test_inline_content(self):
+        with open(f"{self.files_folder}/small.txt", "w", encoding="utf-8") as fp:
+            fp.write("small")
+        conn = self.store(inline_size=100)
+        conn.execute(
+            "update files set content = X'6f74686572' where file_name = 'small.txt'"
+        )
+        conn.commit()
+        file_id = conn.execute(
+            "select id from files where file_name = 'small.txt'"
+        ).fetchone()[0]
+        conn.close()
+
+        report = scrub(self.db_path, workers=1)
+        self.assertEqual(report.mismatched_files, [file_id])
+        self.assertEqual(report.chunks, 12)
+
+    def test_missing_pack(self):
+        self.store(storage=PackStorage()).close()
+        os.remove(f"{self.db_path}.packs/00000001.pack")
+        report = scrub(self.db_path)
+        self.assertEqual(len(report.missing), 12)
+
+    def test_resume(self):
+        self.store().close()
+        report = scrub(self.db_path, workers=1, batch_size=2, max_bytes=1)
+        self.assertFalse(report.completed)
+        self.assertEqual(report.chunks, 2)
+
+        report = scrub(self.db_path, workers=1, batch_size=2)
+        self.assertTrue(report.completed)
+        self.assertEqual(report.chunks, 10)
+
+        report = scrub(self.db_path, workers=1, batch_size=2)
+        self.assertEqual(report.chunks, 12)
+
+    def test_rate_limit(self):
+        self.store().close()
+        conn = sqlite3.connect(self.db_path)
+        stored = conn.execute("select sum(length(chunk)) from chunks").fetchone()[0]
+        conn.close()
+        started = time.monotonic()
+        scrub(self.db_path, workers=4, rate=stored / 0.2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_legacy_database(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(
+            """
+            CREATE TABLE files (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                original_file_location TEXT NOT NULL,
+                file_name VARCHAR(200) NOT NULL,
+                created_on DATETIME NOT NULL
+            );
+            CREATE TABLE file_chunks (
+                file_id INTEGER NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk BLOB
+            );
+            INSERT INTO files VALUES (1, 'path', 'a.txt', '2022-01-01');
+            INSERT INTO file_chunks VALUES (1, 1, X'616263');
+            """
+        )
+        conn.close()
+        report = scrub(self.db_path, workers=4)
+        self.assertTrue(report.clean)
+        self.assertTrue(report.completed)
+        self.assertEqual(report.chunks, 1)
+
+    def test_worker_failure(self):
+        self.store().close()
+        with mock.patch(
+            "file_utils.scrub.SQLiteDBManager",
+            side_effect=[
+                SQLiteDBManager(self.db_path),
+                sqlite3.OperationalError("unable to open database file"),
+            ],
+        ), self.assertRaisesRegex(sqlite3.OperationalError, "unable to open"):
+            scrub(self.db_path, workers=1)
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase, mock
+
+from file_utils.catalog import is_archive
+from file_utils.files import find_files, restore_file_by_id
+from file_utils.shards import (
+    create_archive,
+    find_archive,
+    list_archive,
+    resolve_file_id,
+    shard_index,
+    shard_paths,
+    store_archive,
+)
+from file_utils.walker import Walker
+
+
+class RowsHandler:
+    @staticmethod
+    def get_all(data):
+        return list(data)
+
+
+class TestShards(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.mkdir(self.files_folder)
+        self.names = [f"file-{index:02d}.txt" for index in range(12)]
+        for name in self.names:
+            with open(f"{self.files_folder}/{name}", "w", encoding="utf-8") as writer:
+                writer.write(name)
+        self.catalog = f"{self.tmp_dir}/archive.db"
+        create_archive(self.catalog, 3)
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def test_create_archive(self):
+        paths = shard_paths(self.catalog)
+        self.assertEqual(
+            paths, [f"{self.tmp_dir}/archive.db.shards/{i:04d}.db" for i in range(3)]
+        )
+        self.assertTrue(is_archive(self.catalog))
+        self.assertFalse(is_archive(paths[0]))
+        with self.assertRaises(FileExistsError):
+            create_archive(self.catalog, 3)
+        with self.assertRaises(ValueError):
+            create_archive(f"{self.tmp_dir}/other.db", 0)
+
+    def test_store_archive(self):
+        with mock.patch.object(
+            Walker, "walk", autospec=True, side_effect=Walker.walk
+        ) as walk:
+            stats = store_archive(self.catalog, [self.files_folder])
+        self.assertEqual(stats.files, 12)
+        self.assertEqual(walk.call_count, 1)
+
+        for index, path in enumerate(shard_paths(self.catalog)):
+            rows = find_files(path, "*", RowsHandler)
+            expected = [
+                name
+                for name in self.names
+                if shard_index(self.files_folder, name, 3) == index
+            ]
+            self.assertEqual([row[2] for row in rows], expected)
+
+        rows = list_archive(self.catalog, RowsHandler)
+        self.assertEqual([row[2] for row in rows], self.names)
+        self.assertEqual(len({row[0] for row in rows}), 12)
+
+        db_name, file_id = resolve_file_id(self.catalog, rows[5][0])
+        restore_location = f"{self.tmp_dir}/restored"
+        os.mkdir(restore_location)
+        restore_file_by_id(db_name, file_id, restore_location)
+        with open(f"{restore_location}/file-05.txt", encoding="utf-8") as reader:
+            self.assertEqual(reader.read(), "file-05.txt")
+
+    def test_store_archive_failure(self):
+        with mock.patch(
+            "file_utils.shards.store_files", side_effect=OSError("disk full")
+        ), self.assertRaisesRegex(OSError, "disk full"):
+            store_archive(self.catalog, [self.files_folder], walker=Walker())
+
+    def test_parallel_writers(self):
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(
+                    store_archive,
+                    self.catalog,
+                    [self.files_folder],
+                    shards=[index],
+                    bulk=True,
+                )
+                for index in range(3)
+            ]
+            stored = sum(future.result().files for future in futures)
+        self.assertEqual(stored, 12)
+        rows = list_archive(self.catalog, RowsHandler)
+        self.assertEqual([row[2] for row in rows], self.names)
+
+    def test_find_archive_pagination(self):
+        store_archive(self.catalog, [self.files_folder])
+
+        rows = find_archive(self.catalog, "*-1*", RowsHandler)
+        self.assertEqual([row[2] for row in rows], self.names[10:])
+
+        rows = list_archive(self.catalog, RowsHandler, limit=4, offset=3)
+        self.assertEqual([row[2] for row in rows], self.names[3:7])
+
+        after_id = rows[-1][0]
+        rows = list_archive(self.catalog, RowsHandler, limit=3, after_id=after_id)
+        self.assertEqual([row[2] for row in rows], self.names[7:10])
@@ -0,0 +1,67 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from file_utils import stats
+from file_utils.chunkers import FixedChunker
+from file_utils.files import restore_files, store_files
+
+
+class TestStats(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.makedirs(f"{self.files_folder}/sub")
+        for name in ("a.txt", "b.txt", "sub/c.txt"):
+            with open(f"{self.files_folder}/{name}", "w", encoding="utf-8") as fp:
+                fp.write(name * 1000)
+        self.db_path = f"{self.tmp_dir}/database.db"
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def test_disabled(self):
+        rows = [1, 2]
+        self.assertIs(stats.timed_iter(stats.QUERY, rows), rows)
+        self.assertIsNone(stats.start())
+        stats.record(stats.QUERY, None, rows=1)
+
+    def test_timed_iter(self):
+        calls = []
+        stats.add_hook(lambda *measurement: calls.append(measurement))
+        try:
+            pieces = stats.timed_iter(stats.READ, [b"ab", b"cde"], len)
+            self.assertEqual(list(pieces), [b"ab", b"cde"])
+        finally:
+            stats._hooks.clear()  # pylint: disable=protected-access
+        self.assertEqual(len(calls), 1)
+        phase, seconds, size, rows = calls[0]
+        self.assertEqual((phase, size, rows), (stats.READ, 5, 2))
+        self.assertGreaterEqual(seconds, 0)
+
+    def test_recording(self):
+        stream = io.StringIO()
+        with stats.recording(stream=stream) as recorder:
+            store_files(self.db_path, [self.files_folder], chunker=FixedChunker(1000))
+            restore_files(self.db_path, f"{self.tmp_dir}/restored", pattern="*")
+        self.assertFalse(stats._hooks)  # pylint: disable=protected-access
+
+        phases = recorder.phases
+        self.assertEqual(phases[stats.WALK][3], 2)
+        self.assertEqual(phases[stats.READ][2], 2 * 19000)
+        self.assertEqual(phases[stats.WRITE][2], 19000)
+        for phase in (stats.INSERT, stats.COMMIT, stats.QUERY):
+            self.assertIn(phase, phases)
+        report = stream.getvalue()
+        self.assertIn("commit", report)
+        self.assertIn("elapsed", report)
+
+    def test_recording_disabled(self):
+        stream = io.StringIO()
+        with stats.recording(False, stream=stream) as recorder:
+            store_files(self.db_path, [self.files_folder])
+        self.assertIsNone(recorder)
+        self.assertEqual(stream.getvalue(), "")
@@ -0,0 +1,125 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from file_utils.db_managers import SQLiteDBManager
+from file_utils.storage import (
+    BlobStorage,
+    PackReader,
+    PackStorage,
+    PackWriter,
+    get_storage,
+    pack_path,
+    storage_config,
+    storage_from_config,
+)
+
+
+class TestStorageConfig(TestCase):
+    def test_config(self):
+        storage = storage_from_config(storage_config(PackStorage(1024)))
+        self.assertIsInstance(storage, PackStorage)
+        self.assertEqual(storage.pack_size, 1024)
+        self.assertIsInstance(get_storage("blob"), BlobStorage)
+        with self.assertRaisesRegex(ValueError, "Unknown storage tape"):
+            get_storage("tape")
+        with self.assertRaises(ValueError):
+            PackStorage(0)
+
+
+class TestPacks(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def test_pack_io(self):
+        writer = PackWriter(self.directory)
+        self.assertEqual(writer.append(1, 0, b"0123"), 0)
+        self.assertEqual(writer.append(1, 4, b"456789"), 4)
+        writer.close()
+
+        reader = PackReader(self.directory)
+        self.assertEqual(list(reader.iter_range(1, 2, 6, 4)), [b"2345", b"67"])
+        self.assertEqual(list(reader.iter_range(1, 0, 0, 4)), [])
+        with self.assertRaisesRegex(OSError, "Pack 1 is truncated"):
+            list(reader.iter_range(1, 8, 4, 4))
+
+        writer = PackWriter(self.directory)
+        writer.append(1, 4, b"abc")
+        writer.sync()
+        self.assertEqual(list(reader.iter_range(1, 4, 3, 4)), [b"abc"])
+        writer.close()
+        reader.close()
+        self.assertEqual(os.path.getsize(pack_path(self.directory, 1)), 7)
+
+    def test_packed_chunks(self):
+        db_path = f"{self.directory}/data.db"
+        with SQLiteDBManager(db_path, storage=PackStorage(8)) as db_conn:
+            self.assertTrue(db_conn.insert_chunk("hash-1", b"0123456"))
+            self.assertFalse(db_conn.insert_chunk("hash-1", b"0123456"))
+            self.assertTrue(
+                db_conn.insert_chunk("hash-2", b"abc", size=10, codec="zlib")
+            )
+            ret = list(
+                db_conn.query(
+                    "select id, size, chunk, pack_id, pack_offset, pack_length "
+                    "from chunks order by id"
+                )
+            )
+            self.assertEqual(ret, [(1, 7, None, 1, 0, 7), (2, 10, None, 2, 0, 3)])
+            self.assertEqual(b"".join(db_conn.iter_chunk(2, 2, 0, 3)), b"abc")
+            self.assertEqual(
+                list(db_conn.query("select id, size from packs")), [(1, 7), (2, 3)]
+            )
+
+    def test_uncommitted_tail_is_dropped(self):
+        db_path = f"{self.directory}/data.db"
+        with SQLiteDBManager(db_path, storage=PackStorage()) as db_conn:
+            db_conn.insert_chunk("hash-1", b"committed")
+        with self.assertRaises(KeyboardInterrupt):
+            with SQLiteDBManager(db_path, bulk=True, storage=PackStorage()) as db_conn:
+                db_conn.insert_chunk("hash-2", b"rolled back")
+                raise KeyboardInterrupt()
+        self.assertEqual(os.path.getsize(f"{db_path}.packs/00000001.pack"), 20)
+
+        with SQLiteDBManager(db_path, storage=PackStorage()) as db_conn:
+            db_conn.insert_chunk("hash-3", b"new")
+            ret = list(
+                db_conn.query("select hash, pack_offset from chunks order by id")
+            )
+            self.assertEqual(ret, [("hash-1", 0), ("hash-3", 9)])
+        self.assertEqual(os.path.getsize(f"{db_path}.packs/00000001.pack"), 12)
+
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(conn.execute("select size from packs").fetchall(), [(12,)])
+        conn.close()
+
+    def test_concurrent_writers(self):
+        db_path = f"{self.directory}/data.db"
+        with SQLiteDBManager(db_path, storage=PackStorage()) as db_conn:
+            db_conn.insert_chunk("hash-1", b"first")
+
+        def insert_chunk():
+            with SQLiteDBManager(db_path, storage=PackStorage()) as db_conn:
+                db_conn.insert_chunk("hash-3", b"third")
+
+        with SQLiteDBManager(db_path, bulk=True, storage=PackStorage()) as db_conn:
+            db_conn.insert_chunk("hash-2", b"second")
+            # waits for the write lock held here before reading the pack tail
+            writer = threading.Thread(target=insert_chunk)
+            writer.start()
+            time.sleep(0.2)
+            db_conn.commit()
+            writer.join()
+            ret = list(
+                db_conn.query("select hash, pack_offset from chunks order by id")
+            )
+            self.assertEqual(ret, [("hash-1", 0), ("hash-2", 5), ("hash-3", 11)])
+            self.assertEqual(b"".join(db_conn.iter_chunk(3, 1, 11, 5)), b"third")
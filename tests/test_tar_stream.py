@@ -0,0 +1,126 @@
+import io
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import tracemalloc
+from unittest import TestCase
+
+from file_utils.chunkers import FixedChunker
+from file_utils.files import store_files
+from file_utils.tar_stream import export_tar, import_tar
+
+
+class Discard(io.RawIOBase):
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return len(data)
+
+
+class TestTarStream(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.files_folder = f"{self.tmp_dir}/files"
+        os.makedirs(f"{self.files_folder}/sub")
+        self.contents = {
+            "a.txt": b"alpha" * 1000,
+            "sub/b.log": b"beta",
+            "sub/empty": b"",
+        }
+        for index, (name, data) in enumerate(self.contents.items()):
+            with open(f"{self.files_folder}/{name}", "wb") as writer:
+                writer.write(data)
+            os.utime(
+                f"{self.files_folder}/{name}",
+                ns=(0, 1600000000123456789 + index),
+            )
+        self.db_path = f"{self.tmp_dir}/database.db"
+        store_files(self.db_path, [self.files_folder], chunker=FixedChunker(1024))
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def rows(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(
+                "select original_file_location, file_name, size, mtime_ns, checksum "
+                "from files order by original_file_location, file_name"
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def test_export(self):
+        stream = io.BytesIO()
+        self.assertEqual(export_tar(self.db_path, stream), 3)
+        stream.seek(0)
+        with tarfile.open(fileobj=stream) as archive:
+            members = archive.getmembers()
+            names = [member.name for member in members]
+            self.assertEqual(
+                names,
+                [
+                    f"{self.files_folder}/a.txt".lstrip("/"),
+                    f"{self.files_folder}/sub/b.log".lstrip("/"),
+                    f"{self.files_folder}/sub/empty".lstrip("/"),
+                ],
+            )
+            self.assertEqual(archive.extractfile(members[0]).read(), b"alpha" * 1000)
+            self.assertEqual(int(members[1].mtime), 1600000000)
+
+        stream = io.BytesIO()
+        self.assertEqual(export_tar(self.db_path, stream, pattern="*.log"), 1)
+        with self.assertRaisesRegex(ValueError, "Unknown compression"):
+            export_tar(self.db_path, io.BytesIO(), compression="zip")
+        with self.assertRaisesRegex(FileNotFoundError, "does not exists"):
+            export_tar("none", io.BytesIO())
+
+    def test_round_trip(self):
+        for compression in (None, "gz"):
+            stream = io.BytesIO()
+            export_tar(self.db_path, stream, compression=compression)
+            stream.seek(0)
+            copy_path = f"{self.tmp_dir}/copy-{compression}.db"
+            stats = import_tar(copy_path, stream)
+            self.assertEqual(stats.files, 3)
+            self.assertEqual(self.rows(copy_path), self.rows(self.db_path))
+
+        stream.seek(0)
+        stats = import_tar(copy_path, stream, incremental=True)
+        self.assertEqual((stats.files, stats.unchanged), (0, 3))
+
+    def test_import_foreign_tar(self):
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode="w") as archive:
+            archive.add(self.files_folder, arcname="files")
+        stream.seek(0)
+        copy_path = f"{self.tmp_dir}/copy.db"
+        import_tar(copy_path, stream, prefix="/restored")
+        rows = self.rows(copy_path)
+        self.assertEqual(
+            [row[:3] for row in rows],
+            [
+                ("/restored/files", "a.txt", 5000),
+                ("/restored/files/sub", "b.log", 4),
+                ("/restored/files/sub", "empty", 0),
+            ],
+        )
+        self.assertEqual(rows[0][3] // 1000000000, 1600000000)
+
+    def test_export_memory(self):
+        big_file = f"{self.files_folder}/big.bin"
+        with open(big_file, "wb") as writer:
+            writer.write(os.urandom(4 * 1048576))
+        store_files(self.db_path, [big_file], chunker=FixedChunker(262144))
+
+        tracemalloc.start()
+        try:
+            export_tar(self.db_path, Discard(), pattern="big")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1048576)
@@ -0,0 +1,193 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from file_utils.files import store_files
+from file_utils.walker import Walker, compile_rules, match_rules
+
+
+def create_file(path, contents="empty"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file_w:
+        file_w.write(contents)
+
+
+class TestRules(unittest.TestCase):
+    def check(self, patterns, rel_path, expected, is_dir=False):
+        self.assertEqual(
+            match_rules(compile_rules(patterns), rel_path, is_dir),
+            expected,
+            f"{patterns} {rel_path}",
+        )
+
+    def test_unanchored(self):
+        self.check(["*.log"], "a.log", True)
+        self.check(["*.log"], "deep/dir/a.log", True)
+        self.check(["*.log"], "a.log.txt", None)
+        self.check(["cache"], "src/cache", True, is_dir=True)
+
+    def test_anchored(self):
+        self.check(["/build"], "build", True, is_dir=True)
+        self.check(["/build"], "src/build", None, is_dir=True)
+        self.check(["doc/*.md"], "doc/a.md", True)
+        self.check(["doc/*.md"], "doc/sub/a.md", None)
+        self.check(["doc/**/*.md"], "doc/sub/deep/a.md", True)
+        self.check(["doc/**/*.md"], "doc/a.md", True)
+        self.check(["**/tmp/*"], "a/b/tmp/x", True)
+        self.check(["logs/**"], "logs/a/b.txt", True)
+
+    def test_directories_only(self):
+        self.check(["out/"], "out", True, is_dir=True)
+        self.check(["out/"], "out", None)
+
+    def test_negation_and_classes(self):
+        rules = ["*.log", "!keep.log", "# comment", ""]
+        self.check(rules, "a.log", True)
+        self.check(rules, "x/keep.log", False)
+        self.check(["file[0-9].txt"], "file1.txt", True)
+        self.check(["file[!0-9].txt"], "file1.txt", None)
+        self.check(["a?c"], "abc", True)
+        self.check(["a?c"], "a/c", None)
+        self.check(["\\!important"], "!important", True)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, "Invalid pattern"):
+            compile_rules(["/"])
+
+
+class TestWalker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = f"{self.tmp_dir}/root"
+        for name, size in (
+            ("a.txt", 1),
+            ("b.log", 10),
+            ("sub/c.txt", 100),
+            ("sub/build/d.txt", 1000),
+            ("sub/deep/e.txt", 5),
+            ("build/f.txt", 5),
+        ):
+            create_file(f"{self.root}/{name}", "x" * size)
+
+    def tearDown(self) -> None:
+        if os.path.isdir(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+
+    def listed(self, walker, paths=None):
+        return sorted(
+            os.path.relpath(os.path.join(entry.dir_path, entry.file_name), self.root)
+            for entry in walker.walk(paths or [self.root])
+        )
+
+    def test_walk(self):
+        everything = [
+            "a.txt",
+            "b.log",
+            "build/f.txt",
+            "sub/build/d.txt",
+            "sub/c.txt",
+            "sub/deep/e.txt",
+        ]
+        self.assertEqual(self.listed(Walker()), everything)
+        self.assertEqual(self.listed(Walker(workers=3)), everything)
+
+        entry = next(Walker().walk(f"{self.root}/sub/c.txt"))
+        self.assertEqual(entry.dir_path, f"{self.root}/sub")
+        self.assertEqual(entry.stat.st_size, 100)
+
+    def test_rules(self):
+        walker = Walker(exclude=["/build/", "*.log"])
+        self.assertEqual(
+            self.listed(walker),
+            ["a.txt", "sub/build/d.txt", "sub/c.txt", "sub/deep/e.txt"],
+        )
+        walker = Walker(exclude=["build"], include=["sub/**"], workers=2)
+        self.assertEqual(self.listed(walker), ["sub/c.txt", "sub/deep/e.txt"])
+
+        with mock.patch("os.scandir", side_effect=os.scandir) as scandir:
+            self.listed(Walker(exclude=["sub/"]))
+        scanned = [call.args[0] for call in scandir.call_args_list]
+        self.assertNotIn(f"{self.root}/sub", scanned)
+
+    def test_depth_and_size(self):
+        self.assertEqual(self.listed(Walker(max_depth=0)), ["a.txt", "b.log"])
+        self.assertEqual(
+            self.listed(Walker(max_depth=1)),
+            ["a.txt", "b.log", "build/f.txt", "sub/c.txt"],
+        )
+        self.assertEqual(
+            self.listed(Walker(min_size=5, max_size=100)),
+            ["b.log", "build/f.txt", "sub/c.txt", "sub/deep/e.txt"],
+        )
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "symbolic links are required")
+    def test_symlinks(self):
+        os.symlink(f"{self.root}/sub", f"{self.root}/link")
+        os.symlink(f"{self.root}/a.txt", f"{self.root}/sub/deep/a_link.txt")
+        os.symlink(f"{self.root}", f"{self.root}/sub/deep/loop")
+        os.symlink(f"{self.tmp_dir}/missing", f"{self.root}/broken.txt")
+
+        listed = self.listed(Walker())
+        self.assertIn("sub/deep/a_link.txt", listed)
+        self.assertFalse([path for path in listed if path.startswith("link")])
+
+        listed = self.listed(Walker(symlinks="skip"))
+        self.assertNotIn("sub/deep/a_link.txt", listed)
+
+        for workers in (0, 2):
+            listed = self.listed(Walker(symlinks="follow", workers=workers))
+            self.assertEqual(len(listed), 7)
+            self.assertEqual(len([path for path in listed if "c.txt" in path]), 1)
+
+        with self.assertRaisesRegex(ValueError, "Unknown symlink policy"):
+            Walker(symlinks="always")
+
+    def test_one_file_system(self):
+        real_scandir = os.scandir
+        device = os.stat(self.root).st_dev
+
+        class MountedEntry:
+            def __init__(self, entry):
+                self._entry = entry
+
+            def __getattr__(self, name):
+                return getattr(self._entry, name)
+
+            def stat(self, **kwargs):
+                result = self._entry.stat(**kwargs)
+                if self._entry.name != "deep":
+                    return result
+                return os.stat_result((*result[:2], device + 1, *result[3:]))
+
+        @contextlib.contextmanager
+        def scandir(path):
+            with real_scandir(path) as entries:
+                yield (MountedEntry(entry) for entry in entries)
+
+        with mock.patch("os.scandir", scandir):
+            self.assertIn("sub/deep/e.txt", self.listed(Walker()))
+            listed = self.listed(Walker(one_file_system=True))
+        self.assertNotIn("sub/deep/e.txt", listed)
+        self.assertIn("sub/c.txt", listed)
+
+    def test_store_files_reuses_stat(self):
+        db_path = f"{self.tmp_dir}/database.db"
+        with mock.patch("os.stat", side_effect=os.stat) as stat:
+            stats = store_files(
+                db_path,
+                [self.root],
+                walker=Walker(exclude=["*.log"], max_size=500, workers=2),
+            )
+        stated = [call.args[0] for call in stat.call_args_list]
+        self.assertFalse([path for path in stated if str(path).endswith(".txt")])
+        self.assertEqual(stats.files, 4)
+
+        stats = store_files(db_path, [self.root], incremental=True)
+        self.assertEqual((stats.files, stats.unchanged), (2, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()